@@ -2,104 +2,198 @@
 # October 6, 2019
 #
 # Analysis tool for working with the data scraped from IMDb.  Will read in
-# the pickle file movie_dataframe.pkl created by the scraper.py program.
-
-import requests
-import urllib.request
-import time
-import numpy as np
-import pandas as pd
-from bs4 import BeautifulSoup
-import pickle
-import re
-
-import seaborn as sns
-from sklearn.metrics import mean_squared_error, r2_score
-from sklearn.linear_model import LinearRegression
-from sklearn.model_selection import train_test_split, cross_val_score
-
-df = pd.read_pickle('movie_dataframe.pkl') # Load file 'movie_dataframe.pkl'
-                                           # which was created in 'scraper.py'
-                                           # and read it in as dataframe 'df'.
-
-# Name the columns of df.
-df.columns = ['Title', 'Release Month', 'MPAA Rating', 'G Dummy', 'PG Dummy',
-              'PG-13 Dummy', 'R Dummy', 'January', 'February', 'March',
-              'April', 'May', 'June', 'July', 'August', 'September',
-              'October', 'November', 'December', 'Runtime', 'Budget',
-              'Opening Weekend Box Office Earnings',
-              'Total Domestic Gross Earnings',
-              'Total Worldwide Gross Earnings', 'IMDb User Ratings']
-
-# Linear Regression
-
-# Target dataframe
-y = df['Total Worldwide Gross Earnings']
-
-# Feature dataframe
-X = df[['Budget', 'Runtime', 'January', 'February', 'March',
-        'April', 'May', 'June', 'July', 'August', 'September',
-        'October', 'November', 'December', 'G Dummy','PG Dummy',
-        'PG-13 Dummy', 'R Dummy']]
-
-# Perform train-test split.  X_test and y_test are holdout test sets.
-X, X_test, y, y_test = train_test_split(X, y, test_size=.2, random_state=10)
-
-linreg_model = LinearRegression() # Create an object for linear regression
-linreg_model.fit(X,y)             # Fit linear model
-
-# Use cross validation on the training set, segmenting it into 5
-# subsets to validate the linear regression.  The mean of those
-# values will then be stored in cv_score.
-cv_list = cross_val_score(linreg_model, X, y, cv=5)
-cv_score = np.mean(cv_list)
-
-# R^2 value for test set
-r_squared = linreg_model.score(X_test,y_test)
-
-print('r^2 = {}'.format(r_squared))                   # Print r^2 value
-
-print('Cross validation score = {}'.format(cv_score)) # Print cv score
-
-# Create dataframes based on rating
-df_g = df.loc[df['MPAA Rating'] == 'G']
-df_pg = df.loc[df['MPAA Rating'] == 'PG']
-df_pg13 = df.loc[df['MPAA Rating'] == 'PG-13']
-df_r = df.loc[df['MPAA Rating'] == 'R']
-
-# Save scatterplot of worldwide gross earnings as a function of budget
-# to a .png file.
-sns.scatterplot(x='Budget',y='Total Worldwide Gross Earnings',data=df)\
-   .figure.savefig('budget_worldwide_gross_scatterplot.png')
-
-# Verbose output
-print('Saved scatterplot as \'budget_worldwide_gross_scatterplot.png\'.')
-
-# Save scatterplot of worldwide gross earnings as a function of budget
-# and with line of best fit to a .png file.
-sns.lmplot('Budget','Total Worldwide Gross Earnings',
-           data=df, fit_reg=True)\
-   .savefig('budget_worldwide_gross_linreg.png')
-
-# Verbose output
-print('Saved \'budget_worldwide_gross_linreg.png\'.')
-
-sns.lmplot('Budget','Total Worldwide Gross Earnings',
-           data=df_g, fit_reg=True).savefig('earnings_g.png')
-
-print('Saved \'earnings_g.png\'.') # Verbose output
-
-sns.lmplot('Budget','Total Worldwide Gross Earnings',
-           data=df_pg, fit_reg=True).savefig('earnings_pg.png')
-
-print('Saved \'earnings_pg.png\'.') # Verbose output
-
-sns.lmplot('Budget','Total Worldwide Gross Earnings',
-           data=df_pg13, fit_reg=True).savefig('earnings_pg13.png')
-
-print('Saved \'earnings_pg13.png\'.') # Verbose output
-
-sns.lmplot('Budget','Total Worldwide Gross Earnings',
-           data=df_r, fit_reg=True).savefig('earnings_r.png')
-
-print('Saved \'earnings_r.png\'.') # Verbose output
+# the dataset movie_dataset created by the scraper.py program.
+#
+# The analysis can be imported and run piece by piece, or run from the
+# command line with `python analysis.py` (or `python cli.py analyze`).
+# scikit-learn and seaborn are slow to import, so they are only imported
+# by the functions that use them: pass --no-plots to get just the
+# regression numbers without ever loading seaborn.  Datasets too large to
+# load at once can be analyzed with --out-of-core, which reads them a chunk
+# at a time (see streaming.py).
+
+import argparse
+
+import features
+import metrics
+import plots
+import predict
+import records
+import streaming
+
+def fitRegression(df, timings=None):
+    '''
+    Fit a linear regression of worldwide gross
+    earnings on the features in
+    features.FEATURE_LIST.
+    Returns a tuple of the fitted model, its
+    r^2 on a holdout test set and its mean
+    cross validation score on the training set.
+    '''
+
+    import numpy as np
+    from sklearn.linear_model import LinearRegression
+    from sklearn.model_selection import train_test_split, cross_val_score
+
+    timings = timings or metrics.Metrics()
+
+    # Linear Regression
+
+    # Target vector
+    y = features.targetVector(df)
+
+    # Feature matrix
+    X = features.featureMatrix(df, features.FEATURE_LIST)
+
+    # Perform train-test split.  X_test and y_test are holdout test sets.
+    X, X_test, y, y_test = train_test_split(X, y, test_size=.2, random_state=10)
+
+    with timings.timed('fit'):
+        linreg_model = LinearRegression() # Create an object for linear regression
+        linreg_model.fit(X,y)             # Fit linear model
+
+    # Use cross validation on the training set, segmenting it into 5
+    # subsets to validate the linear regression.  The mean of those
+    # values will then be stored in cv_score.
+    with timings.timed('cross_validation'):
+        cv_list = cross_val_score(linreg_model, X, y, cv=5)
+        cv_score = np.mean(cv_list)
+
+    # R^2 value for test set
+    r_squared = linreg_model.score(X_test,y_test)
+
+    return linreg_model, r_squared, cv_score
+
+def savePlots(df, timings=None, plot_dir=plots.DEFAULT_PLOT_DIR,
+              n_boot=plots.DEFAULT_BOOTSTRAP, workers=plots.DEFAULT_WORKERS,
+              force=False):
+    '''
+    Save scatterplots of worldwide gross
+    earnings against budget, for every movie
+    and for each MPAA rating, as .png files.
+    Figures whose data hasn't changed since the
+    last run are not rendered again.
+    '''
+
+    return plots.renderPlots(df, plots.PLOTS, plot_dir, n_boot, workers, force,
+                             timings)
+
+def addArguments(arg_parser):
+    '''
+    Add the command line options of the
+    analysis to an argparse parser.
+    '''
+
+    arg_parser.add_argument('--dataset', default=records.DEFAULT_DATASET_PATH,
+                            help='movie dataset created by scraper.py')
+    arg_parser.add_argument('--no-plots', action='store_true',
+                            help='only print the regression results')
+    arg_parser.add_argument('--plot-dir', default=plots.DEFAULT_PLOT_DIR,
+                            help='directory the figures are saved in')
+    arg_parser.add_argument('--bootstrap', type=int,
+                            default=plots.DEFAULT_BOOTSTRAP,
+                            help='bootstrap resamples for the confidence '
+                                 'bands of the regression plots (lower it '
+                                 'for quick drafts, 0 draws no band)')
+    arg_parser.add_argument('--plot-workers', type=int,
+                            default=plots.DEFAULT_WORKERS,
+                            help='number of processes rendering figures '
+                                 '(default: one per CPU, 0 renders in this '
+                                 'process)')
+    arg_parser.add_argument('--force-plots', action='store_true',
+                            help='render every figure, even if its data '
+                                 'hasn\'t changed')
+    arg_parser.add_argument('--save-model', action='store_true',
+                            help='save the fitted regression as a new '
+                                 'version of the model used by predict.py')
+    arg_parser.add_argument('--model-dir', default=predict.DEFAULT_ARTIFACT_DIR,
+                            help='directory the model versions are saved in')
+    arg_parser.add_argument('--out-of-core', action='store_true',
+                            help='fit the regression and summarize each MPAA '
+                                 'rating in one pass over the dataset, a '
+                                 'chunk at a time, without loading it into '
+                                 'memory (no figures are drawn)')
+    arg_parser.add_argument('--chunk-size', type=int,
+                            default=streaming.DEFAULT_CHUNK_SIZE,
+                            help='movies read at a time with --out-of-core')
+    arg_parser.add_argument('--timings', action='store_true',
+                            help='print how long each stage of the analysis '
+                                 'took')
+    arg_parser.add_argument('--metrics', default=None,
+                            help='write the timings of the run to this JSON '
+                                 'file')
+    arg_parser.add_argument('--profile', choices=metrics.availableProfilers(),
+                            default=None,
+                            help='profile the run with this profiler')
+    arg_parser.add_argument('--profile-output',
+                            default=metrics.DEFAULT_PROFILE_OUTPUT,
+                            help='file name (without extension) the profile '
+                                 'is saved under')
+
+def run(args):
+    '''
+    Run the whole analysis with the options
+    parsed from the command line.
+    '''
+
+    timings = metrics.Metrics()
+    profiler = metrics.Profiler(args.profile, args.profile_output).start()
+
+    if(args.out_of_core):
+        # Only one chunk of the dataset is in memory at a time, so the
+        # figures, which need every movie, are left out.
+        linreg_model, r_squared, cv_score, movie_count, ratings = \
+            streaming.fitRegression(args.dataset, features.FEATURE_LIST,
+                                    args.chunk_size, timings)
+
+        print(ratings.report())
+    else:
+        with timings.timed('load'):
+            # Load the dataset 'movie_dataset', which was created in
+            # 'scraper.py', and read it in as dataframe 'df' with named
+            # columns.  The features are built from it by fitRegression().
+            df = records.loadMovies(args.dataset)
+
+        linreg_model, r_squared, cv_score = fitRegression(df, timings)
+        movie_count = len(df)
+
+    print('r^2 = {}'.format(r_squared))                   # Print r^2 value
+
+    print('Cross validation score = {}'.format(cv_score)) # Print cv score
+
+    if(args.save_model):
+        artifact_path = predict.saveArtifact(linreg_model,
+                                             features.FEATURE_LIST,
+                                             {'r_squared': r_squared,
+                                              'cv_score': cv_score,
+                                              'dataset': args.dataset,
+                                              'movies': movie_count},
+                                             args.model_dir)
+
+        # Verbose output
+        print('Saved the model as \'{}\'.'.format(artifact_path))
+
+    if(not args.no_plots and not args.out_of_core):
+        savePlots(df, timings, args.plot_dir, args.bootstrap,
+                  args.plot_workers, args.force_plots)
+
+    profiler.stop()
+
+    if(args.timings):
+        print(timings.report())
+
+    if(args.metrics):
+        timings.writeJson(args.metrics)
+
+        # Verbose output
+        print('Saved run metrics to \'{}\'.'.format(args.metrics))
+
+def main(argv=None, prog=None):
+    arg_parser = argparse.ArgumentParser(prog=prog,
+                                         description='Analyze the scraped '
+                                                     'movie data.')
+    addArguments(arg_parser)
+    run(arg_parser.parse_args(argv))
+
+if __name__ == '__main__':
+    main()
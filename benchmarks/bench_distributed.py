@@ -0,0 +1,111 @@
+# Benchmark of distributed scrapes.
+#
+# Serves a synthetic page corpus from a local replay server and scrapes it
+# with `cli.py scrape --queue ... --local-workers N` for each number of
+# workers, reporting pages/sec and the speedup over the first run.  Every
+# worker fetches at most --concurrency pages at once, so with a server
+# that takes --latency seconds per page a single process tops out at
+# about concurrency / latency pages/sec, and each extra worker should add
+# as much again until the CPUs (or the server) run out.  On a machine with
+# few cores, keep --latency high enough that the run is bound by waiting
+# on the server rather than by parsing.
+#
+# Run from the root of the repository with:
+#
+#     python -m benchmarks.bench_distributed
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import corpus
+from benchmarks.replay_server import ReplayServer
+
+CLI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                   'cli.py')
+
+arg_parser = argparse.ArgumentParser(description='Benchmark a distributed '
+                                                 'scrape with more and more '
+                                                 'workers.')
+arg_parser.add_argument('--titles', type=int, default=2000,
+                        help='number of movies in the synthetic corpus')
+arg_parser.add_argument('--local-workers', type=int, nargs='*',
+                        default=[1, 2, 4, 8],
+                        help='numbers of worker processes to try')
+arg_parser.add_argument('--latency', type=float, default=0.1,
+                        help='seconds the replay server waits per request')
+arg_parser.add_argument('--concurrency', type=int, default=5,
+                        help='maximum number of pages each worker fetches at '
+                             'once')
+arg_parser.add_argument('--json', default=None,
+                        help='write the results to this JSON file')
+args = arg_parser.parse_args()
+
+def benchWorkers(corpus_dir, manifest, work_dir, workers):
+    run_dir = os.path.join(work_dir, 'workers_{}'.format(workers))
+    os.makedirs(run_dir)
+    metrics_path = os.path.join(run_dir, 'metrics.json')
+
+    with ReplayServer(corpus_dir, args.latency) as server:
+        start = time.perf_counter()
+        subprocess.run([
+            sys.executable, CLI, 'scrape',
+            '--base-url', server.url,
+            '--years', ','.join(str(year) for year in manifest['years']),
+            '--top-n', str(manifest['top_n']),
+            '--concurrency', str(args.concurrency),
+            '--output', os.path.join(run_dir, 'scraped_dataset'),
+            '--queue', os.path.join(run_dir, 'queue.sqlite'),
+            '--shard-dir', os.path.join(run_dir, 'shards'),
+            '--local-workers', str(workers),
+            '--no-cache',
+            '--metrics', metrics_path,
+        ], cwd=run_dir, stdout=subprocess.DEVNULL, check=True)
+        seconds = time.perf_counter() - start
+        requests = server.requests
+
+    with open(metrics_path, encoding='utf-8') as metrics_file:
+        counters = json.load(metrics_file)['counters']
+
+    return {
+        'workers': workers,
+        'pages': counters.get('pages', 0),
+        'failed': counters.get('failed', 0),
+        'requests': requests,
+        'seconds': seconds,
+        'pages_per_second': counters.get('pages', 0) / seconds,
+    }
+
+with tempfile.TemporaryDirectory() as work_dir:
+    corpus_dir = os.path.join(work_dir, 'corpus')
+    corpus.syntheticCorpus(args.titles, corpus_dir)
+    manifest = corpus.loadManifest(corpus_dir)
+
+    print('{} titles, {:g}s latency, concurrency {} per worker, {} CPUs\n'\
+          .format(args.titles, args.latency, args.concurrency,
+                  os.cpu_count()))
+    print('{:>8} {:>7} {:>7} {:>9} {:>10} {:>8}'\
+          .format('workers', 'pages', 'failed', 'seconds', 'pages/sec',
+                  'speedup'))
+
+    results = []
+    for workers in args.local_workers:
+        results.append(benchWorkers(corpus_dir, manifest, work_dir, workers))
+        result = results[-1]
+
+        print('{:>8} {:>7} {:>7} {:>9.2f} {:>10.1f} {:>7.2f}x'\
+              .format(workers, result['pages'], result['failed'],
+                      result['seconds'], result['pages_per_second'],
+                      result['pages_per_second']
+                      / results[0]['pages_per_second']))
+
+if(args.json):
+    with open(args.json, 'w', encoding='utf-8') as json_file:
+        json.dump({'cpus': os.cpu_count(), 'arguments': vars(args),
+                   'runs': results}, json_file, indent=2)
+
+    print('\nSaved the results to \'{}\'.'.format(args.json))
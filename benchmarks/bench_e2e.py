@@ -0,0 +1,231 @@
+# End-to-end benchmark of the scraper and the analysis.
+#
+# Builds a synthetic page corpus (or uses a recorded one, see corpus.py),
+# serves it from a local replay server and runs a complete scrape against
+# it with `cli.py scrape`, then runs `cli.py analyze` on synthetic datasets
+# of several sizes.  Each run is a separate process so that its peak
+# memory can be measured on its own.  It reports:
+#
+#   - scrape: pages/sec from start to finish, parse time per page, peak
+#     RSS of the scraper process, and the connections and bytes the server
+#     saw.  --tls, --compress and --bandwidth make the server more like
+#     imdb.com, and --http2 and --stop-early are passed on to the scraper.
+#   - analysis: wall-clock seconds, time per stage and peak RSS at each
+#     dataset size (1k, 10k and 100k titles by default), loading the
+#     dataset into memory or, with --out-of-core, a chunk at a time
+#
+# Nothing is fetched from the internet and every input is generated from
+# fixed seeds and the files in benchmarks/fixtures/, so the numbers can be
+# compared between runs on the same machine.  Those movie pages are
+# synthetic and much smaller than IMDb's, so the scrape rate is higher than
+# a real one unless --corpus gives a recorded corpus; the output says which
+# it was.  Pass --json to save them,
+# e.g. as a baseline before a performance change.
+#
+# Run from the root of the repository with:
+#
+#     python -m benchmarks.bench_e2e
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import records
+from benchmarks import corpus
+from benchmarks.replay_server import ReplayServer
+from benchmarks.stub_server import certificateFiles
+from benchmarks.synthetic import syntheticRecords
+
+CLI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                   'cli.py')
+
+arg_parser = argparse.ArgumentParser(description='Benchmark a whole scrape '
+                                                 'and analysis offline.')
+arg_parser.add_argument('--titles', type=int, default=1000,
+                        help='number of movies in the synthetic corpus')
+arg_parser.add_argument('--corpus', default=None,
+                        help='recorded corpus to scrape instead of a '
+                             'synthetic one')
+arg_parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds the replay server waits per request')
+arg_parser.add_argument('--jitter', type=float, default=0.0,
+                        help='most extra seconds added to the latency at '
+                             'random')
+arg_parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of requests the server fails with 503')
+arg_parser.add_argument('--tls', action='store_true',
+                        help='serve the corpus over HTTPS')
+arg_parser.add_argument('--compress', action='store_true',
+                        help='have the server compress the pages')
+arg_parser.add_argument('--bandwidth', type=float, default=0.0,
+                        help='megabits per second each response is sent at '
+                             '(0 for no limit)')
+arg_parser.add_argument('--http2', action='store_true',
+                        help='scrape with the scraper\'s --http2 option')
+arg_parser.add_argument('--stop-early', action='store_true',
+                        help='scrape with the scraper\'s --stop-early option')
+arg_parser.add_argument('--concurrency', type=int, default=20,
+                        help='maximum number of pages fetched at once')
+arg_parser.add_argument('--workers', type=int, default=0,
+                        help='number of parser processes')
+arg_parser.add_argument('--analysis-titles', type=int, nargs='*',
+                        default=[1000, 10000, 100000],
+                        help='dataset sizes the analysis is run at')
+arg_parser.add_argument('--out-of-core', action='store_true',
+                        help='run the analysis with its --out-of-core option')
+arg_parser.add_argument('--plots', action='store_true',
+                        help='render the figures in the analysis runs too')
+arg_parser.add_argument('--bootstrap', type=int, default=100,
+                        help='bootstrap resamples for the figures')
+arg_parser.add_argument('--json', default=None,
+                        help='write the results to this JSON file')
+args = arg_parser.parse_args()
+
+def runMeasured(command, cwd, env=None):
+    '''
+    Run a command (with extra environment
+    variables from env) and return a tuple of
+    its wall-clock seconds and peak RSS in MB.
+    '''
+
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=cwd, stdout=subprocess.DEVNULL,
+                               env=dict(os.environ, **(env or {})))
+
+    # wait4 reports the resource usage of this one child, unlike
+    # getrusage(RUSAGE_CHILDREN), which takes the maximum over all of them.
+    _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    if(process.returncode != 0):
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+    return seconds, usage.ru_maxrss / 1024
+
+def readMetrics(path):
+    with open(path, encoding='utf-8') as metrics_file:
+        return json.load(metrics_file)
+
+def benchScrape(work_dir):
+    corpus_dir = args.corpus
+    if(corpus_dir is None):
+        corpus_dir = os.path.join(work_dir, 'corpus')
+        corpus.syntheticCorpus(args.titles, corpus_dir)
+
+    manifest = corpus.loadManifest(corpus_dir)
+    metrics_path = os.path.join(work_dir, 'scrape_metrics.json')
+
+    # The scraper is told to trust the server's certificate through the
+    # environment, as it would be for a proxy's.
+    env = {'SSL_CERT_FILE': certificateFiles()[0]} if args.tls else {}
+    options = [option for option, enabled in (('--http2', args.http2),
+                                              ('--stop-early', args.stop_early))
+               if enabled]
+
+    with ReplayServer(corpus_dir, args.latency, args.error_rate,
+                      jitter=args.jitter, tls=args.tls, compress=args.compress,
+                      bandwidth=args.bandwidth * 10**6 / 8 or None) as server:
+        seconds, peak_rss = runMeasured([
+            sys.executable, CLI, 'scrape',
+            '--base-url', server.url,
+            '--years', ','.join(str(year) for year in manifest['years']),
+            '--top-n', str(manifest['top_n']),
+            '--concurrency', str(args.concurrency),
+            '--workers', str(args.workers),
+            '--output', os.path.join(work_dir, 'scraped_dataset'),
+            '--journal', os.path.join(work_dir, 'journal.jsonl'),
+            '--no-cache',
+            '--metrics', metrics_path,
+        ] + options, work_dir, env)
+        requests = server.requests
+        connections = server.connections
+        bytes_sent = server.bytes_sent
+
+    run_metrics = readMetrics(metrics_path)
+    parse = run_metrics['stages'].get('parse', {})
+
+    return {
+        'corpus': 'recorded' if args.corpus else 'synthetic',
+        'pages': run_metrics['counters'].get('pages', 0),
+        'requests': requests,
+        'connections': connections,
+        'mb_sent': bytes_sent / 2**20,
+        'seconds': seconds,
+        'pages_per_second': run_metrics['counters'].get('pages', 0) / seconds,
+        'parse_mean_ms': parse.get('mean_ms', 0.0),
+        'parse_p95_ms': parse.get('p95_ms', 0.0),
+        'peak_rss_mb': peak_rss,
+    }
+
+def benchAnalysis(work_dir, titles):
+    dataset_path = os.path.join(work_dir, 'dataset_{}'.format(titles))
+    records.saveMovies(syntheticRecords(titles), dataset_path)
+
+    metrics_path = os.path.join(work_dir, 'analysis_metrics_{}.json'\
+                                .format(titles))
+    command = [sys.executable, CLI, 'analyze', '--dataset', dataset_path,
+               '--metrics', metrics_path]
+    if(args.out_of_core):
+        command.append('--out-of-core')
+    if(args.plots):
+        command += ['--plot-dir', os.path.join(work_dir, 'plots'),
+                    '--bootstrap', str(args.bootstrap), '--force-plots']
+    else:
+        command.append('--no-plots')
+
+    seconds, peak_rss = runMeasured(command, work_dir)
+    stages = readMetrics(metrics_path)['stages']
+
+    return {
+        'titles': titles,
+        'seconds': seconds,
+        'stage_seconds': {stage: stage_summary['total_seconds']
+                          for stage, stage_summary in stages.items()},
+        'peak_rss_mb': peak_rss,
+    }
+
+with tempfile.TemporaryDirectory() as work_dir:
+    scrape = benchScrape(work_dir)
+
+    if(scrape['corpus'] == 'synthetic'):
+        print(corpus.fixtureNote() + '\n')
+
+    print('{corpus} corpus, '
+          'scrape: {pages} pages ({requests} requests, {connections} '
+          'connections, {mb_sent:.1f} MB) in {seconds:.2f}s = '
+          '{pages_per_second:.1f} pages/sec, parse {parse_mean_ms:.2f} ms/page '
+          '(p95 {parse_p95_ms:.2f}), peak RSS {peak_rss_mb:.0f} MB'\
+          .format(**scrape))
+
+    print('\n{:>8} {:>9} {:>8} {:>8} {:>8} {:>8} {:>9}'\
+          .format('titles', 'seconds', 'load', 'fit', 'cv', 'plots',
+                  'peak MB'))
+
+    analysis = []
+    for titles in args.analysis_titles:
+        analysis.append(benchAnalysis(work_dir, titles))
+        stage_seconds = analysis[-1]['stage_seconds']
+
+        print('{:>8} {:>9.2f} {:>8.2f} {:>8.2f} {:>8.2f} {:>8.2f} {:>9.0f}'\
+              .format(titles, analysis[-1]['seconds'],
+                      stage_seconds.get('load', 0.0),
+                      stage_seconds.get('fit', 0.0),
+                      stage_seconds.get('cross_validation', 0.0),
+                      stage_seconds.get('plot', 0.0),
+                      analysis[-1]['peak_rss_mb']))
+
+if(args.json):
+    with open(args.json, 'w', encoding='utf-8') as json_file:
+        json.dump({'python': platform.python_version(),
+                   'cpus': os.cpu_count(),
+                   'arguments': vars(args),
+                   'scrape': scrape,
+                   'analysis': analysis}, json_file, indent=2)
+
+    print('\nSaved the results to \'{}\'.'.format(args.json))
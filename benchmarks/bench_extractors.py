@@ -0,0 +1,64 @@
+# Micro-benchmark for the extractor engines in extractors.py.
+#
+# Parses each movie page in benchmarks/fixtures over and over
+# with the original tree-walking extractor (parseMovieDataSoup) and with
+# the single-pass engine (parseMovieData) on every installed HTML parser,
+# and prints the pages/sec for each combination.  Every engine is checked
+# against the tree-walking extractor first so that a speedup can't come
+# from extracting the wrong values.  The fixtures are synthetic pages,
+# far smaller than real IMDb ones (see corpus.fixtureNote()), so the
+# speedups carry over to a real scrape better than the pages/sec do.
+#
+# Run from the root of the repository with:
+#
+#     python -m benchmarks.bench_extractors
+
+import argparse
+import time
+
+import extractors
+from benchmarks.corpus import fixtureNote, fixturePaths
+
+arg_parser = argparse.ArgumentParser(description='Benchmark extractors.py.')
+arg_parser.add_argument('--repeat', type=int, default=200,
+                        help='number of times each fixture is parsed')
+args = arg_parser.parse_args()
+
+movie_pages = []
+for fixture_path in fixturePaths():
+    with open(fixture_path, encoding='utf-8') as fixture_file:
+        movie_pages.append(fixture_file.read())
+
+# (engine, parser, function) for every combination to be timed.
+engines = [('tree-walk', 'html.parser', extractors.parseMovieDataSoup)]
+for parser in extractors.availableParsers():
+    engines.append(('single-pass', parser,
+                    lambda movie_html, parser=parser:
+                        extractors.parseMovieData(movie_html, parser)))
+
+expected = [extractors.parseMovieDataSoup(movie_html)
+            for movie_html in movie_pages]
+
+print(fixtureNote() + '\n')
+print('{:<12} {:<12} {:>12} {:>10}'.format('engine', 'parser', 'pages/sec',
+                                           'speedup'))
+
+baseline = None
+
+for engine, parser, parse in engines:
+    if([parse(movie_html) for movie_html in movie_pages] != expected):
+        print('{:<12} {:<12} extracted different values!'.format(engine, parser))
+        continue
+
+    start = time.perf_counter()
+    for repeat in range(args.repeat):
+        for movie_html in movie_pages:
+            parse(movie_html)
+    pages_per_second = args.repeat * len(movie_pages) / (time.perf_counter() - start)
+
+    if(baseline is None):
+        baseline = pages_per_second
+
+    print('{:<12} {:<12} {:>12.1f} {:>9.1f}x'.format(engine, parser,
+                                                     pages_per_second,
+                                                     pages_per_second / baseline))
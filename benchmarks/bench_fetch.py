@@ -0,0 +1,65 @@
+# Benchmark for the concurrent fetch engine in fetcher.py.
+#
+# Fetches the same number of pages from a local stub server at several
+# concurrency settings and prints the throughput for each one.  With a
+# fixed per-request latency, pages/sec should grow roughly in step with
+# the concurrency limit until the client or server saturates.
+#
+# Pass --error-rate and/or --capacity to have the stub server fail some
+# requests with 503 or throttle with 429 above a number of requests in
+# flight.  The table then also shows how many requests were sent and how
+# many got an error, so the retry and adaptive concurrency logic can be
+# compared across settings.
+#
+# Run from the root of the repository with:
+#
+#     python -m benchmarks.bench_fetch
+
+import argparse
+import time
+
+import fetcher
+from benchmarks.stub_server import StubServer
+
+arg_parser = argparse.ArgumentParser(description='Benchmark fetcher.py.')
+arg_parser.add_argument('--pages', type=int, default=200,
+                        help='number of pages fetched per run')
+arg_parser.add_argument('--latency', type=float, default=0.05,
+                        help='seconds the stub server waits per request')
+arg_parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 2, 5, 10, 20, 50],
+                        help='concurrency settings to benchmark')
+arg_parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of requests the server fails with 503')
+arg_parser.add_argument('--capacity', type=int, default=None,
+                        help='requests in flight above which the server '
+                             'answers 429')
+arg_parser.add_argument('--retry-after', type=float, default=None,
+                        help='Retry-After seconds sent with each error')
+args = arg_parser.parse_args()
+
+with StubServer(latency=args.latency, error_rate=args.error_rate,
+                capacity=args.capacity,
+                retry_after=args.retry_after) as server:
+    page_urls = ['{}/title/tt{:07d}/'.format(server.url, i)
+                 for i in range(args.pages)]
+
+    print('{:>12} {:>10} {:>12} {:>9} {:>7} {:>7}'.format('concurrency',
+                                                         'seconds',
+                                                         'pages/sec',
+                                                         'requests', 'errors',
+                                                         'failed'))
+
+    for concurrency in args.concurrency:
+        requests, errors = server.requests, server.errors
+
+        start = time.perf_counter()
+        pages = fetcher.fetchPages(page_urls, concurrency=concurrency)
+        elapsed = time.perf_counter() - start
+
+        failed = sum(isinstance(page, Exception) for page in pages)
+
+        print('{:>12} {:>10.2f} {:>12.1f} {:>9} {:>7} {:>7}'\
+              .format(concurrency, elapsed, (args.pages - failed) / elapsed,
+                      server.requests - requests, server.errors - errors,
+                      failed))
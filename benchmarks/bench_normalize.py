@@ -0,0 +1,140 @@
+# Benchmark for the field normalization in normalize.py.
+#
+# Generates thousands of synthetic field strings shaped like the ones
+# scraped from IMDb movie pages and times the functions in normalize.py
+# against the original chains of uncompiled re.sub() calls, which are
+# reproduced below as the reference.  Both versions must produce the same
+# values.  Pass --min-speedup to fail (exit status 1) if any field gets
+# slower than that, so that regressions get caught.
+#
+# Run from the root of the repository with:
+#
+#     python -m benchmarks.bench_normalize
+
+import argparse
+import random
+import re
+import sys
+import time
+
+import normalize
+
+arg_parser = argparse.ArgumentParser(description='Benchmark normalize.py.')
+arg_parser.add_argument('--strings', type=int, default=5000,
+                        help='number of synthetic strings per field')
+arg_parser.add_argument('--repeat', type=int, default=5,
+                        help='number of passes over the strings')
+arg_parser.add_argument('--min-speedup', type=float, default=None,
+                        help='exit with an error if any field is sped up '
+                             'by less than this factor')
+arg_parser.add_argument('--seed', type=int, default=0,
+                        help='seed for generating the strings')
+args = arg_parser.parse_args()
+
+# The original normalization code from scraper.py.
+
+def legacyMPAArating(rating):
+    rating = re.sub('\n','',rating)
+    return re.sub(r'\|.*','',rating).strip()
+
+def legacyBudget(budget):
+    budget = re.sub('\n','',budget)
+    budget = re.sub(r'.*\$','',budget)
+    budget = re.sub(',','',budget)
+    budget = re.sub(r'\(estimated\)','',budget).strip()
+    return int(budget)
+
+def legacyOpeningWeekendGross(opening_weekend_gross):
+    opening_weekend_gross = re.sub('\nO','',opening_weekend_gross)
+    opening_weekend_gross = re.search('.*',opening_weekend_gross)
+    opening_weekend_gross = str(opening_weekend_gross)
+    opening_weekend_gross = re.sub(r'.*\$','',opening_weekend_gross)
+    opening_weekend_gross = re.sub('[^0-9]','',opening_weekend_gross)
+    return int(opening_weekend_gross)
+
+def legacyReleaseMonth(release_date):
+    for month in normalize.MONTH_NAMES:
+        if(re.search(month, release_date) != None):
+            return month
+
+def legacyDigits(text):
+    return int(re.sub('[^0-9]','',text))
+
+def legacyUserRating(user_rating):
+    user_rating = re.sub('\n','',user_rating)
+    return float(re.sub('/.*','',user_rating))
+
+# Synthetic strings shaped like the text of each section of a movie page.
+
+random_generator = random.Random(args.seed)
+
+def dollars():
+    return '${:,}'.format(random_generator.randint(10**5, 3 * 10**9))
+
+def releaseDate():
+    return '{} {} {} (USA)\n'.format(random_generator.randint(1, 28),
+                                     random_generator.choice(normalize.MONTH_NAMES),
+                                     random_generator.randint(2009, 2019))
+
+field_strings = {
+    'mpaa_rating': lambda: '\n    {}\n|\n{}min\n|\nAction, Adventure\n|\n{}'\
+                           .format(random_generator.choice(['G', 'PG', 'PG-13', 'R']),
+                                   random_generator.randint(80, 180),
+                                   releaseDate()),
+    'budget': lambda: '\nBudget:{}\n(estimated)\n'.format(dollars()),
+    'opening_weekend_gross': lambda: '\nOpening Weekend USA: {},\n{}'\
+                                     .format(dollars(), releaseDate()),
+    'gross': lambda: '\nGross USA: {}\n'.format(dollars()),
+    'release_month': releaseDate,
+    'runtime': lambda: '{} min'.format(random_generator.randint(80, 180)),
+    'user_rating': lambda: '\n{:.1f}/10\n'.format(random_generator.randint(10, 99) / 10),
+}
+
+# (field, original function, new function)
+benchmarks = [
+    ('mpaa_rating', legacyMPAArating, normalize.parseMPAArating),
+    ('budget', legacyBudget, normalize.parseBudget),
+    ('opening_weekend_gross', legacyOpeningWeekendGross,
+     normalize.parseOpeningWeekendGross),
+    ('gross', legacyDigits, normalize.parseGross),
+    ('release_month', legacyReleaseMonth, normalize.parseReleaseMonth),
+    ('runtime', legacyDigits, normalize.parseRuntime),
+    ('user_rating', legacyUserRating, normalize.parseUserRating),
+]
+
+def timeFunction(function, strings):
+    start = time.perf_counter()
+    for repeat in range(args.repeat):
+        for string in strings:
+            function(string)
+    return time.perf_counter() - start
+
+print('{:<22} {:>14} {:>14} {:>9}'.format('field', 'original (us)',
+                                          'normalize (us)', 'speedup'))
+
+too_slow = []
+
+for field, legacy_function, new_function in benchmarks:
+    strings = [field_strings[field]() for i in range(args.strings)]
+
+    if([legacy_function(s) for s in strings] != [new_function(s) for s in strings]):
+        print('{:<22} normalize.py gives different values!'.format(field))
+        too_slow.append(field)
+        continue
+
+    calls = args.strings * args.repeat
+    legacy_seconds = timeFunction(legacy_function, strings)
+    new_seconds = timeFunction(new_function, strings)
+    speedup = legacy_seconds / new_seconds
+
+    print('{:<22} {:>14.2f} {:>14.2f} {:>8.1f}x'.format(field,
+                                                      1e6 * legacy_seconds / calls,
+                                                      1e6 * new_seconds / calls,
+                                                      speedup))
+
+    if(args.min_speedup is not None and speedup < args.min_speedup):
+        too_slow.append(field)
+
+if(too_slow):
+    print('Failed: {}'.format(', '.join(too_slow)))
+    sys.exit(1)
@@ -0,0 +1,60 @@
+# Benchmark for the fetch/parse pipeline in pipeline.py.
+#
+# Serves a synthetic movie page from a local stub server and runs the
+# full fetch and parse pipeline at several parser worker counts, printing
+# the wall-clock throughput and the time spent in each stage.  Because the
+# stub server answers almost instantly, parsing is the bottleneck here and
+# throughput should grow with the number of workers up to the core count.
+#
+# Run from the root of the repository with:
+#
+#     python -m benchmarks.bench_pipeline
+
+import argparse
+import asyncio
+import os
+import time
+
+import metrics
+import pipeline
+from benchmarks.stub_server import StubServer
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'tt0848228.html')
+
+arg_parser = argparse.ArgumentParser(description='Benchmark pipeline.py.')
+arg_parser.add_argument('--pages', type=int, default=500,
+                        help='number of pages fetched and parsed per run')
+arg_parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds the stub server waits per request')
+arg_parser.add_argument('--concurrency', type=int, default=20,
+                        help='maximum number of pages fetched at once')
+arg_parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({0, 1, 2, 4, os.cpu_count()}),
+                        help='parser worker counts to benchmark')
+args = arg_parser.parse_args()
+
+async def runPipeline(movie_link_list, workers, timings):
+    failed = 0
+    async for i, movie_url, movie_tuple in pipeline.iterMovieData(
+            movie_link_list, args.concurrency, None, workers, timings):
+        if(isinstance(movie_tuple, Exception)):
+            failed += 1
+    return failed
+
+with open(FIXTURE, 'rb') as fixture_file:
+    page = fixture_file.read()
+
+with StubServer(latency=args.latency, page=page) as server:
+    movie_link_list = ['{}/title/tt{:07d}/'.format(server.url, i)
+                       for i in range(args.pages)]
+
+    for workers in args.workers:
+        timings = metrics.Metrics()
+
+        start = time.perf_counter()
+        failed = asyncio.run(runPipeline(movie_link_list, workers, timings))
+        elapsed = time.perf_counter() - start
+
+        print('\nworkers = {}: {:.1f} pages/sec ({} failed)'\
+              .format(workers, args.pages / elapsed, failed))
+        print(timings.report())
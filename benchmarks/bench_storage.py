@@ -0,0 +1,88 @@
+# Benchmark for the movie dataset format in records.py.
+#
+# Writes the same synthetic movies both the old way (25-element tuples,
+# including the 16 dummy columns, in a pickled object dataframe) and the
+# new way (Parquet files of raw fields with categorical rating and month
+# columns, one file per year), then compares the file sizes and how long each takes to load
+# into the named, dummy-expanded dataframe that analysis.py works with:
+# reading the pickle and naming its columns by position, or reading the
+# Parquet file and building the dummies with features.featureMatrix().
+#
+# Run from the root of the repository with:
+#
+#     python -m benchmarks.bench_storage
+
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+import features
+import records
+from benchmarks.synthetic import syntheticRecords
+from normalize import MONTH_NAMES
+
+arg_parser = argparse.ArgumentParser(description='Benchmark records.py.')
+arg_parser.add_argument('--movies', type=int, nargs='+',
+                        default=[1000, 10000, 100000],
+                        help='dataset sizes to benchmark')
+args = arg_parser.parse_args()
+
+def legacyTuple(movie_record):
+    '''
+    The 25-element tuple the scraper used to
+    build for each movie.
+    '''
+
+    rating_dummies = [int(movie_record.mpaa_rating == rating)
+                      for rating in records.MPAA_RATINGS]
+    month_dummies = [int(movie_record.release_month == month)
+                     for month in MONTH_NAMES]
+
+    return tuple([movie_record.title, movie_record.release_month,
+                  movie_record.mpaa_rating] + rating_dummies + month_dummies +
+                 [movie_record.runtime, movie_record.budget,
+                  movie_record.opening_weekend_gross,
+                  movie_record.total_domestic_gross,
+                  movie_record.worldwide_gross, movie_record.user_rating])
+
+def loadLegacy(path):
+    df = pd.read_pickle(path)
+    df.columns = records.LEGACY_COLUMNS
+    return df
+
+def loadDataset(path):
+    df = records.loadMovies(path)
+    return df, features.featureMatrix(df, ['mpaa_rating', 'release_month'])
+
+def timeLoad(load, path, repeat=5):
+    start = time.perf_counter()
+    for i in range(repeat):
+        load(path)
+    return (time.perf_counter() - start) / repeat
+
+print('{:>8} {:>14} {:>14} {:>12} {:>12}'.format('movies', 'pickle (KB)',
+                                                 'parquet (KB)', 'pickle (ms)',
+                                                 'parquet (ms)'))
+
+with tempfile.TemporaryDirectory() as temp_dir:
+    pickle_path = os.path.join(temp_dir, 'movie_dataframe.pkl')
+    dataset_path = os.path.join(temp_dir, 'movie_dataset')
+
+    for movie_count in args.movies:
+        movie_records = syntheticRecords(movie_count)
+
+        pd.DataFrame([legacyTuple(movie_record)
+                      for movie_record in movie_records]).to_pickle(pickle_path)
+        records.saveMovies(movie_records, dataset_path)
+        dataset_size = sum(os.path.getsize(partition_path) for partition_path
+                           in records.partitionPaths(dataset_path))
+
+        print('{:>8} {:>14.1f} {:>14.1f} {:>12.1f} {:>12.1f}'\
+              .format(movie_count,
+                      os.path.getsize(pickle_path) / 1024,
+                      dataset_size / 1024,
+                      1000 * timeLoad(loadLegacy, pickle_path),
+                      1000 * timeLoad(loadDataset, dataset_path)))
@@ -0,0 +1,137 @@
+# Benchmark of how the movie pages are transferred.
+#
+# Fetches the same movie pages from a local HTTPS stub server in several
+# ways and prints the time taken, the connections the server accepted and
+# the bytes it sent for each:
+#
+#   - a new connection (and TLS handshake) for every page, as the old
+#     requests.get() calls did
+#   - kept-alive connections, uncompressed
+#   - kept-alive connections with gzip/brotli compression
+#   - either of those, stopping each page once the scraped sections have
+#     arrived.  Over HTTP/1.1 the rest of a page can only be refused by
+#     closing its connection, so this trades bytes for new connections.
+#   - httpx, which uses HTTP/2 with servers that offer it.  The stub
+#     server only speaks HTTP/1.1, so this row shows the cost of the httpx
+#     transport itself.
+#
+# The page is a synthetic movie page followed by --tail-kb of filler standing
+# in for everything IMDb puts after the sections we scrape, and each
+# response is sent at no more than --bandwidth.  Every page is parsed too,
+# to check that nothing the extractors need was cut off.
+#
+# Run from the root of the repository with:
+#
+#     python -m benchmarks.bench_transport
+
+import argparse
+import os
+import random
+import time
+
+import fetcher
+from benchmarks.stub_server import StubServer, clientSSLContext
+from extractors import STOP_MARKER, parseMovieData
+from metrics import Metrics
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'tt0848228.html')
+
+arg_parser = argparse.ArgumentParser(description='Benchmark connection reuse '
+                                                 'and compression.')
+arg_parser.add_argument('--pages', type=int, default=500,
+                        help='number of pages fetched per run')
+arg_parser.add_argument('--latency', type=float, default=0.01,
+                        help='seconds the stub server waits per request')
+arg_parser.add_argument('--concurrency', type=int, default=10,
+                        help='maximum number of pages fetched at once')
+arg_parser.add_argument('--tail-kb', type=int, default=200,
+                        help='kilobytes of filler after the scraped sections '
+                             'of each page')
+arg_parser.add_argument('--bandwidth', type=float, default=20.0,
+                        help='megabits per second each response is sent at '
+                             '(0 for no limit)')
+arg_parser.add_argument('--no-tls', action='store_true',
+                        help='use plain HTTP instead of HTTPS')
+args = arg_parser.parse_args()
+
+def paddedPage(tail_kb):
+    '''
+    Return the fixture page with tail_kb of
+    made-up markup inserted after its last
+    section, compressible about as well as a
+    real page.
+    '''
+
+    with open(FIXTURE, 'rb') as fixture_file:
+        page = fixture_file.read()
+
+    words = random.Random(0).choices(
+        ['movie', 'trivia', 'goofs', 'quotes', 'crazy', 'credits', 'soundtrack',
+         'connections', 'user', 'reviews', 'the', 'a', 'of', 'and', 'to'],
+        k=tail_kb * 1024 // 6)
+    lines = ['<div class="txt-block" data-id="{}">{}</div>'\
+             .format(i, ' '.join(words[i:i + 12]))
+             for i in range(0, len(words), 12)]
+    tail = '\n'.join(lines).encode('utf-8')[:tail_kb * 1024]
+
+    return page.replace(b'</body>', tail + b'\n</body>')
+
+# Name, whether the server compresses, Transport options and whether pages
+# are cut off at the stop marker.
+SETTINGS = [
+    ('new connection per page', False, {'keep_alive': False}, False),
+    ('keep-alive', False, {}, False),
+    ('keep-alive + stop early', False, {}, True),
+    ('keep-alive + compression', True, {}, False),
+    ('keep-alive + compression + stop early', True, {}, True),
+]
+if(fetcher.http2Available()):
+    SETTINGS.append(('httpx + compression', True, {'http2': True}, False))
+
+page = paddedPage(args.tail_kb)
+ssl_context = None if args.no_tls else clientSSLContext()
+
+bandwidth = args.bandwidth * 10**6 / 8 if args.bandwidth else None
+
+print('{} pages of {:.0f} KB over {} at {}, concurrency {}\n'\
+      .format(args.pages, len(page) / 1024,
+              'HTTP' if args.no_tls else 'HTTPS',
+              '{:g} Mbit/s'.format(args.bandwidth) if args.bandwidth
+              else 'full speed', args.concurrency))
+print('{:<40} {:>8} {:>10} {:>12} {:>9} {:>11} {:>7}'\
+      .format('setting', 'seconds', 'pages/sec', 'connections', 'MB sent',
+              'connect ms', 'parsed'))
+
+for name, compress, transport_options, stop_early in SETTINGS:
+    with StubServer(latency=args.latency, page=page, tls=not args.no_tls,
+                    compress=compress, bandwidth=bandwidth) as server:
+        page_urls = ['{}/title/tt{:07d}/'.format(server.url, i)
+                     for i in range(args.pages)]
+        timings = Metrics()
+        transport = fetcher.Transport(ssl=ssl_context, **transport_options)
+
+        start = time.perf_counter()
+        pages = fetcher.fetchPages(page_urls, args.concurrency, timings=timings,
+                                   transport=transport,
+                                   stop_marker=STOP_MARKER if stop_early
+                                   else None)
+        elapsed = time.perf_counter() - start
+
+        parsed = 0
+        for page_html in pages:
+            if(isinstance(page_html, Exception)):
+                continue
+            try:
+                parseMovieData(page_html)
+                parsed += 1
+            except Exception:
+                pass
+
+        connect_seconds = 0.0
+        if('connect' in timings.totals):
+            connect_seconds = timings.stageSummary('connect')['total_seconds']
+
+        print('{:<40} {:>8.2f} {:>10.1f} {:>12} {:>9.2f} {:>11.1f} {:>7}'\
+              .format(name, elapsed, args.pages / elapsed, server.connections,
+                      server.bytes_sent / 2**20,
+                      connect_seconds * 1000, parsed))
@@ -0,0 +1,72 @@
+# Check that the out-of-core analysis matches the in-memory one.
+#
+# Saves synthetic datasets of a few sizes, fits the regression on each
+# with analysis.fitRegression() (the whole dataframe in memory) and with
+# streaming.fitRegression() (a chunk at a time), and compares the
+# intercept, the coefficients, the holdout r^2 and the cross validation
+# score.  The chunks are kept small so that every dataset is read in many
+# pieces.  Exits with an error if anything differs by more than rounding.
+#
+# Run from the root of the repository with:
+#
+#     python -m benchmarks.check_streaming
+
+import argparse
+import sys
+import tempfile
+
+import numpy as np
+
+import analysis
+import features
+import records
+import streaming
+from benchmarks.synthetic import syntheticRecords
+
+arg_parser = argparse.ArgumentParser(description='Compare the out-of-core '
+                                                 'analysis with the in-memory '
+                                                 'one.')
+arg_parser.add_argument('--titles', type=int, nargs='*',
+                        default=[50, 1000, 5000],
+                        help='dataset sizes to compare at')
+arg_parser.add_argument('--chunk-size', type=int, default=300,
+                        help='movies read at a time by the out-of-core fit')
+arg_parser.add_argument('--rtol', type=float, default=1e-7,
+                        help='largest relative difference allowed')
+args = arg_parser.parse_args()
+
+def relativeDifference(a, b):
+    a, b = np.atleast_1d(a), np.atleast_1d(b)
+    return float(np.max(np.abs(a - b)) / max(np.max(np.abs(b)), 1e-300))
+
+print('{:>8} {:>12} {:>12} {:>12} {:>12}'\
+      .format('titles', 'intercept', 'coef', 'r^2', 'cv'))
+
+failed = False
+with tempfile.TemporaryDirectory() as work_dir:
+    for titles in args.titles:
+        dataset_path = '{}/dataset_{}'.format(work_dir, titles)
+        records.saveMovies(syntheticRecords(titles, seed=titles), dataset_path,
+                           batch_size=max(1, titles // 7))
+
+        df = records.loadMovies(dataset_path)
+        model, r_squared, cv_score = analysis.fitRegression(df)
+        streamed_model, streamed_r_squared, streamed_cv_score, movies, _ = \
+            streaming.fitRegression(dataset_path, features.FEATURE_LIST,
+                                    args.chunk_size)
+
+        differences = [relativeDifference(streamed_model.intercept_,
+                                          model.intercept_),
+                       relativeDifference(streamed_model.coef_, model.coef_),
+                       relativeDifference(streamed_r_squared, r_squared),
+                       relativeDifference(streamed_cv_score, cv_score)]
+        failed = failed or movies != len(df) \
+                 or max(differences) > args.rtol
+
+        print('{:>8} {:>12.1e} {:>12.1e} {:>12.1e} {:>12.1e}'\
+              .format(titles, *differences))
+
+if(failed):
+    sys.exit('The out-of-core fit differs from the in-memory one.')
+
+print('\nThe out-of-core fit matches the in-memory one.')
@@ -0,0 +1,231 @@
+# Offline page corpus for the benchmarks.
+#
+# A corpus is a directory of saved pages (list pages and movie pages) and
+# a manifest.json mapping the path of each page on IMDb (e.g.
+# '/title/tt0848228/') to the file holding it, along with the years and
+# number of movies per year it covers.  replay_server.py serves a corpus
+# back over HTTP so that a whole scrape can be run without imdb.com.
+#
+# There are two ways to make one:
+#
+#     python -m benchmarks.corpus record --cache-dir .imdb_cache --output corpus
+#
+# copies every page of a real scrape out of the response cache, and
+#
+#     python -m benchmarks.corpus synthetic --titles 1000 --output corpus
+#
+# builds list pages for any number of made-up movies, whose pages are the
+# movie pages in benchmarks/fixtures/.  The synthetic corpus only depends
+# on the files in the repository, so it comes out the same on every
+# machine.  The fixtures are synthetic too: hand-trimmed pages of about
+# 4 KB holding just the sections the extractors read, where a real IMDb
+# movie page runs to hundreds of KB.  Rates measured on them are an upper
+# bound on what a real scrape reaches (see fixtureNote()).
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+from urllib.parse import urlsplit
+
+import paginator
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+MANIFEST = 'manifest.json'
+LIST_PAGE_SIZE = 50    # Movies per list page, as on IMDb.
+FIRST_YEAR = 2000      # First year of a synthetic corpus.
+
+def fixturePaths():
+    return sorted(glob.glob(os.path.join(FIXTURE_DIR, 'tt*.html')))
+
+def fixtureNote():
+    '''
+    Return a warning to print alongside rates
+    measured on the fixture pages.
+    '''
+
+    sizes = [os.path.getsize(fixture_path) for fixture_path in fixturePaths()]
+    return ('Note: the {} movie pages in benchmarks/fixtures/ are synthetic, '
+            'hand-trimmed to {:.1f} KB on average.  Real IMDb pages are '
+            'hundreds of KB, so a real scrape parses and transfers far fewer '
+            'pages/sec.'.format(len(sizes), sum(sizes) / len(sizes) / 1024))
+
+def pagePath(url):
+    '''
+    Return the path and query of a URL, which
+    is what a page is looked up by.
+    '''
+
+    parts = urlsplit(url)
+    return parts.path + ('?' + parts.query if parts.query else '')
+
+def loadManifest(corpus_dir):
+    with open(os.path.join(corpus_dir, MANIFEST), encoding='utf-8') as manifest_file:
+        return json.load(manifest_file)
+
+def saveManifest(corpus_dir, pages, years, top_n):
+    with open(os.path.join(corpus_dir, MANIFEST), 'w',
+              encoding='utf-8') as manifest_file:
+        json.dump({'years': years, 'top_n': top_n, 'pages': pages},
+                  manifest_file, indent=1, sort_keys=True)
+
+def loadPages(corpus_dir):
+    '''
+    Return a dictionary of path -> page bytes
+    for every page in a corpus.  Pages stored
+    in the same file share the same bytes.
+    '''
+
+    files = {}
+    pages = {}
+    for path, file_name in loadManifest(corpus_dir)['pages'].items():
+        if(file_name not in files):
+            with open(os.path.join(corpus_dir, file_name), 'rb') as page_file:
+                files[file_name] = page_file.read()
+        pages[path] = files[file_name]
+
+    return pages
+
+def recordCorpus(cache_dir, corpus_dir, years=None, top_n=None):
+    '''
+    Copy every page in a response cache into a
+    corpus.  years and top_n are stored in the
+    manifest as the scope of the scrape that
+    filled the cache.
+    '''
+
+    from cache import ResponseCache
+
+    os.makedirs(corpus_dir, exist_ok=True)
+    response_cache = ResponseCache(cache_dir)
+
+    pages = {}
+    try:
+        for (url,) in response_cache.db.execute('SELECT url FROM responses'):
+            cached_response = response_cache.lookup(url)
+            if(cached_response is None):
+                continue
+
+            # Name the files by their contents, as the cache does, so that
+            # identical pages are only stored once.
+            file_name = hashlib.sha256(cached_response.body).hexdigest() + '.html'
+            file_path = os.path.join(corpus_dir, file_name)
+            if(not os.path.exists(file_path)):
+                with open(file_path, 'wb') as page_file:
+                    page_file.write(cached_response.body)
+
+            pages[pagePath(url)] = file_name
+    finally:
+        response_cache.close()
+
+    saveManifest(corpus_dir, pages, years, top_n)
+    return len(pages)
+
+def listPage(year, movie_ids, start, last_page):
+    '''
+    Return the HTML of a page of search results
+    listing movie_ids from rank start on, in the
+    same markup as IMDb's.
+    '''
+
+    items = ''.join('<div class="lister-item mode-advanced">'
+                    '<h3 class="lister-item-header">'
+                    '<span class="lister-item-index unbold text-primary">{}.</span>\n'
+                    '<a href="/title/{}/?ref_=adv_li_tt">Movie {}</a>'
+                    '</h3></div>\n'.format(start + i, movie_id, movie_id)
+                    for i, movie_id in enumerate(movie_ids))
+
+    next_link = '' if last_page else \
+        '<a href="{}&amp;start={}&amp;ref_=adv_nxt" ' \
+        'class="lister-page-next next-page">Next &#187;</a>'\
+        .format(paginator.list_path_template.format(year)
+                .replace('&', '&amp;'), start + len(movie_ids))
+
+    return ('<html><body><div class="lister-list">\n{}</div>\n'
+            '<div class="desc">{}</div></body></html>'.format(items, next_link))\
+           .encode('utf-8')
+
+def syntheticCorpus(titles, corpus_dir, top_n=paginator.DEFAULT_TOP_N):
+    '''
+    Build a corpus of titles made-up movies,
+    top_n per year from FIRST_YEAR on, whose
+    pages are the synthetic movie pages in
+    benchmarks/fixtures/ taken in turn.
+    '''
+
+    os.makedirs(corpus_dir, exist_ok=True)
+
+    fixture_names = []
+    for fixture_path in fixturePaths():
+        fixture_names.append(os.path.basename(fixture_path))
+        shutil.copyfile(fixture_path,
+                        os.path.join(corpus_dir, fixture_names[-1]))
+
+    pages = {}
+    years = []
+    for first in range(0, titles, top_n):
+        year = FIRST_YEAR + len(years)
+        years.append(year)
+
+        movie_ids = ['tt{:07d}'.format(8000000 + i)
+                     for i in range(first, min(first + top_n, titles))]
+        for movie_id in movie_ids:
+            pages['/title/{}/'.format(movie_id)] = \
+                fixture_names[len(pages) % len(fixture_names)]
+
+        # The first page of a year has no start parameter; the ones after
+        # it are reached through the Next links.
+        list_url = paginator.list_path_template.format(year)
+        for start in range(0, len(movie_ids), LIST_PAGE_SIZE):
+            file_name = 'list_{}_{}.html'.format(year, start + 1)
+            last_page = start + LIST_PAGE_SIZE >= len(movie_ids)
+            with open(os.path.join(corpus_dir, file_name), 'wb') as page_file:
+                page_file.write(listPage(year,
+                                         movie_ids[start:start + LIST_PAGE_SIZE],
+                                         start + 1, last_page))
+
+            pages[list_url] = file_name
+            list_url = '{}&start={}&ref_=adv_nxt'\
+                       .format(paginator.list_path_template.format(year),
+                               start + 1 + LIST_PAGE_SIZE)
+
+    saveManifest(corpus_dir, pages, years, top_n)
+    return len(pages)
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Build an offline page '
+                                                     'corpus.')
+    subparsers = arg_parser.add_subparsers(dest='mode', required=True)
+
+    record_parser = subparsers.add_parser('record', help='copy the pages of a '
+                                                         'real scrape out of '
+                                                         'the response cache')
+    record_parser.add_argument('--cache-dir', default='.imdb_cache')
+    record_parser.add_argument('--years', type=int, nargs='+', default=None,
+                               help='years the scrape covered')
+    record_parser.add_argument('--top-n', type=int, default=None,
+                               help='movies per year the scrape covered')
+
+    synthetic_parser = subparsers.add_parser('synthetic', help='make up list '
+                                                               'pages for any '
+                                                               'number of '
+                                                               'movies')
+    synthetic_parser.add_argument('--titles', type=int, default=1000)
+    synthetic_parser.add_argument('--top-n', type=int,
+                                  default=paginator.DEFAULT_TOP_N,
+                                  help='movies per year')
+
+    for subparser in (record_parser, synthetic_parser):
+        subparser.add_argument('--output', default='corpus',
+                               help='directory the corpus is written to')
+
+    args = arg_parser.parse_args()
+
+    if(args.mode == 'record'):
+        count = recordCorpus(args.cache_dir, args.output, args.years, args.top_n)
+    else:
+        count = syntheticCorpus(args.titles, args.output, args.top_n)
+
+    print('Saved {} pages to \'{}\'.'.format(count, args.output))
@@ -0,0 +1,90 @@
+# Local replay server for an offline page corpus.
+#
+# Serves the pages of a corpus (see corpus.py) at the same paths they had
+# on IMDb, so the scraper can be pointed at it with --base-url and run from
+# start to finish without a network connection.  Like the stub server it
+# is built on, it can add latency (a fixed delay plus random jitter), fail
+# a fraction of requests with 503 or throttle them with 429, and serve
+# HTTPS, compressed pages and a limited bandwidth.
+#
+# To browse a corpus or point a scraper at it by hand, run:
+#
+#     python -m benchmarks.replay_server corpus --port 8000
+
+import argparse
+import hashlib
+import time
+
+from benchmarks.corpus import loadPages
+from benchmarks.stub_server import (StubRequestHandler, StubServer,
+                                    certificateFiles)
+
+class ReplayRequestHandler(StubRequestHandler):
+    '''
+    Sends the corpus page saved for the
+    requested path, or 404 if there isn't one.
+    '''
+
+    def sendPage(self):
+        pages = self.server.pages
+
+        # Movie links carry tracking parameters that the saved page may
+        # have been recorded without.
+        page = pages.get(self.path) or pages.get(self.path.split('?')[0])
+        if(page is None):
+            self.sendError(404)
+            return
+
+        self.sendBody(page, '"{}"'.format(hashlib.sha1(page).hexdigest()))
+
+class ReplayServer(StubServer):
+    '''
+    Context manager that serves the pages of
+    the corpus in corpus_dir on a free local
+    port.  The remaining arguments are those of
+    StubServer.
+    '''
+
+    handler_class = ReplayRequestHandler
+
+    def __init__(self, corpus_dir, latency=0.0, error_rate=0.0, capacity=None,
+                 retry_after=None, seed=0, jitter=0.0, port=0, tls=False,
+                 compress=False, bandwidth=None):
+        super().__init__(latency, error_rate=error_rate, capacity=capacity,
+                         retry_after=retry_after, seed=seed, jitter=jitter,
+                         port=port, tls=tls, compress=compress,
+                         bandwidth=bandwidth)
+        self.httpd.pages = loadPages(corpus_dir)
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Serve an offline page '
+                                                     'corpus.')
+    arg_parser.add_argument('corpus', help='corpus directory')
+    arg_parser.add_argument('--port', type=int, default=8000)
+    arg_parser.add_argument('--latency', type=float, default=0.0,
+                            help='seconds the server waits per request')
+    arg_parser.add_argument('--jitter', type=float, default=0.0,
+                            help='most extra seconds added to the latency at '
+                                 'random')
+    arg_parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='fraction of requests failed with 503')
+    arg_parser.add_argument('--tls', action='store_true',
+                            help='serve HTTPS with a self-signed '
+                                 'certificate made at start-up')
+    arg_parser.add_argument('--compress', action='store_true',
+                            help='gzip or brotli compress the pages')
+    args = arg_parser.parse_args()
+
+    with ReplayServer(args.corpus, args.latency, args.error_rate,
+                      jitter=args.jitter, port=args.port, tls=args.tls,
+                      compress=args.compress) as server:
+        print('Serving {} pages on {}.'.format(len(server.httpd.pages),
+                                               server.url))
+        if(args.tls):
+            print('Clients have to trust the certificate in \'{}\'.'\
+                  .format(certificateFiles()[0]))
+        try:
+            while(True):
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
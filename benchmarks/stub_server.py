@@ -0,0 +1,321 @@
+# Local stub HTTP server used by the benchmarks.
+#
+# The server answers every GET request with the same HTML page after
+# sleeping for a fixed latency, which stands in for the round trip to
+# imdb.com.  It runs in a background thread so that a benchmark can start
+# it, point the scraper at it and shut it down again afterwards.
+#
+# To exercise the retry and backoff logic, the server can also fail a
+# fraction of requests with 503 Service Unavailable, and can answer 429
+# Too Many Requests (with a Retry-After header) whenever more than a set
+# number of requests are in flight at once, the way a throttling server
+# would.
+#
+# Like imdb.com, the server can also speak HTTPS, using a self-signed
+# certificate for localhost made with openssl when the benchmark starts
+# (so no private key is kept in the repository), compress its pages
+# with gzip or brotli for clients that accept it and send them no faster
+# than a set bandwidth.  This is what makes connection reuse, compressed
+# transfers and reading only part of a page measurable offline.
+
+import atexit
+import gzip
+import hashlib
+import os
+import random
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_PAGE = b'<html><body><h1>Stub movie page</h1></body></html>'
+WRITE_CHUNK_SIZE = 16384  # Bytes sent at a time when bandwidth is limited.
+BROTLI_QUALITY = 5        # Compression level web servers use on the fly.
+
+# Paths of the certificate and key the server uses for HTTPS, once they
+# have been made by certificateFiles().
+certificate_files = None
+
+def availableEncodings():
+    '''
+    Return the content codings the server can
+    compress pages with, most preferred first.
+    '''
+
+    encodings = ['gzip']
+    try:
+        import brotli
+        encodings.insert(0, 'br')
+    except ImportError:
+        pass
+
+    return encodings
+
+def compressPage(page, encoding):
+    if(encoding == 'br'):
+        import brotli
+        return brotli.compress(page, quality=BROTLI_QUALITY)
+
+    return gzip.compress(page)
+
+def certificateFiles():
+    '''
+    Return the paths of a self-signed
+    certificate for localhost and of its key.
+    They are made with the openssl command the
+    first time they are needed and deleted
+    when the process exits.  Clients have to be
+    told to trust the certificate, see
+    clientSSLContext().
+    '''
+
+    global certificate_files
+
+    if(certificate_files is None):
+        cert_dir = tempfile.mkdtemp(prefix='stub_server_')
+        atexit.register(shutil.rmtree, cert_dir, ignore_errors=True)
+
+        cert_file = os.path.join(cert_dir, 'localhost.pem')
+        key_file = os.path.join(cert_dir, 'localhost.key')
+        try:
+            subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048',
+                            '-nodes', '-days', '1', '-subj', '/CN=localhost',
+                            '-addext',
+                            'subjectAltName=DNS:localhost,IP:127.0.0.1',
+                            '-keyout', key_file, '-out', cert_file],
+                           check=True, capture_output=True)
+        except (OSError, subprocess.CalledProcessError) as error:
+            raise RuntimeError('Serving HTTPS needs the openssl command to '
+                               'make a certificate ({!r}).'.format(error))
+
+        certificate_files = (cert_file, key_file)
+
+    return certificate_files
+
+def clientSSLContext():
+    '''
+    Return an SSLContext that trusts the stub
+    server's certificate, for clients that
+    connect to it over HTTPS.
+    '''
+
+    return ssl.create_default_context(cafile=certificateFiles()[0])
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    '''
+    Sleep for the server's latency and then
+    send back the server's page, or one of the
+    errors the server has been set up to fail
+    with.
+    '''
+
+    protocol_version = 'HTTP/1.1'  # Allow keep-alive connections.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            overloaded = (server.capacity is not None and
+                          server.in_flight > server.capacity)
+            failing = server.random.random() < server.error_rate
+            latency = server.latency + server.random.uniform(0, server.jitter)
+
+        try:
+            time.sleep(latency)
+
+            if(overloaded):
+                self.sendError(429)
+            elif(failing):
+                self.sendError(503)
+            else:
+                self.sendPage()
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def sendError(self, status):
+        with self.server.lock:
+            self.server.errors += 1
+
+        self.send_response(status)
+        if(self.server.retry_after is not None):
+            self.send_header('Retry-After', str(self.server.retry_after))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def sendPage(self):
+        self.sendBody(self.server.page, self.server.etag)
+
+    def sendBody(self, page, etag):
+        '''
+        Send page, compressed if the server and
+        the client both allow it.
+        '''
+
+        # Answer revalidation requests the way IMDb would, so that the
+        # response cache can be exercised too.
+        if(self.headers.get('If-None-Match') == etag):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        accepted = [coding.split(';')[0].strip() for coding in
+                    self.headers.get('Accept-Encoding', '').split(',')]
+        encoding = next((encoding for encoding in self.server.encodings
+                         if encoding in accepted), None)
+
+        body = page
+        if(encoding is not None):
+            # Compress each page once and keep it, as a web server's
+            # cache would.
+            with self.server.lock:
+                key = (encoding, etag)
+                if(key not in self.server.compressed):
+                    self.server.compressed[key] = compressPage(page, encoding)
+                body = self.server.compressed[key]
+
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        if(encoding is not None):
+            self.send_header('Content-Encoding', encoding)
+            self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        bandwidth = self.server.bandwidth
+        chunk_size = WRITE_CHUNK_SIZE if bandwidth else len(body)
+
+        try:
+            for start in range(0, len(body), chunk_size):
+                chunk = body[start:start + chunk_size]
+                if(bandwidth):
+                    time.sleep(len(chunk) / bandwidth)
+                self.wfile.write(chunk)
+
+                with self.server.lock:
+                    self.server.bytes_sent += len(chunk)
+        except (BrokenPipeError, ConnectionResetError, ssl.SSLError):
+            # The client stopped reading part of the way through the page.
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass  # Keep the benchmark output readable.
+
+class StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # Don't refuse connections under load.
+    ssl_context = None        # Set to serve HTTPS.
+
+    def finish_request(self, request, client_address):
+        if(self.ssl_context is None):
+            super().finish_request(request, client_address)
+            return
+
+        # Do the TLS handshake in the connection's own thread rather than
+        # the one accepting connections, so handshakes don't queue up.
+        try:
+            tls_request = self.ssl_context.wrap_socket(request,
+                                                       server_side=True)
+        except (OSError, ssl.SSLError):
+            return
+
+        try:
+            super().finish_request(tls_request, client_address)
+        finally:
+            tls_request.close()
+
+    def process_request_thread(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        super().process_request_thread(request, client_address)
+
+class StubServer:
+    '''
+    Context manager that runs a stub server
+    on a free local port (or on port).  Every request gets
+    the bytes in page as its response (a small
+    placeholder page by default) after latency
+    seconds plus a random extra of up to jitter
+    seconds, except that a
+    fraction error_rate of them fail with 503
+    and, if capacity is set, requests beyond
+    that many in flight get 429.  Failures carry
+    a Retry-After of retry_after seconds unless
+    it is None.  With tls the server speaks
+    HTTPS, and with compress it gzip or brotli
+    compresses pages for clients that accept
+    it.  bandwidth caps the bytes per second
+    each response is sent at.  The base URL of the server is
+    available as .url while it is running, and
+    the number of requests and errors served,
+    connections accepted and body bytes sent as
+    .requests, .errors, .connections and
+    .bytes_sent.
+    '''
+
+    handler_class = StubRequestHandler
+
+    def __init__(self, latency=0.05, page=STUB_PAGE, error_rate=0.0,
+                 capacity=None, retry_after=None, seed=0, jitter=0.0, port=0,
+                 tls=False, compress=False, bandwidth=None):
+        self.httpd = StubHTTPServer(('127.0.0.1', port), self.handler_class)
+        self.httpd.latency = latency
+        self.httpd.jitter = jitter
+        self.httpd.page = page
+        self.httpd.error_rate = error_rate
+        self.httpd.capacity = capacity
+        self.httpd.retry_after = retry_after
+        self.httpd.random = random.Random(seed)
+        self.httpd.lock = threading.Lock()
+        self.httpd.requests = 0
+        self.httpd.errors = 0
+        self.httpd.in_flight = 0
+        self.httpd.connections = 0
+        self.httpd.bytes_sent = 0
+        self.httpd.bandwidth = bandwidth
+        self.httpd.encodings = availableEncodings() if compress else []
+        self.httpd.compressed = {}  # (encoding, ETag) -> compressed page
+        self.httpd.etag = '"{}"'.format(hashlib.sha1(page).hexdigest())
+
+        scheme = 'http'
+        if(tls):
+            scheme = 'https'
+            self.httpd.ssl_context = ssl.create_default_context(
+                ssl.Purpose.CLIENT_AUTH)
+            self.httpd.ssl_context.load_cert_chain(*certificateFiles())
+
+        self.url = '{}://127.0.0.1:{}'.format(scheme, self.httpd.server_port)
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def errors(self):
+        return self.httpd.errors
+
+    @property
+    def connections(self):
+        return self.httpd.connections
+
+    @property
+    def bytes_sent(self):
+        return self.httpd.bytes_sent
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,42 @@
+# Synthetic movie records for the benchmarks.
+#
+# Generates any number of MovieRecords with plausible values so that the
+# storage and analysis code can be measured at sizes far beyond what a
+# real scrape produces.
+
+import random
+
+from normalize import MONTH_NAMES
+from records import MovieRecord
+
+RATINGS = ['G', 'PG', 'PG-13', 'R', 'Not Rated']
+
+def syntheticRecords(count, seed=0):
+    '''
+    Return a list of count MovieRecords with
+    randomly generated (but reproducible)
+    values.
+    '''
+
+    random_generator = random.Random(seed)
+
+    movie_records = []
+    for i in range(count):
+        budget = random_generator.randint(1, 300) * 10**6
+        worldwide_gross = int(budget * random_generator.lognormvariate(0.8, 0.9))
+        domestic_gross = int(worldwide_gross * random_generator.uniform(0.2, 0.7))
+
+        movie_records.append(MovieRecord(
+            title='Synthetic Movie {}'.format(i),
+            year=random_generator.randint(2009, 2018),
+            release_month=random_generator.choice(MONTH_NAMES),
+            mpaa_rating=random_generator.choice(RATINGS),
+            runtime=random_generator.randint(75, 190),
+            budget=budget,
+            opening_weekend_gross=int(domestic_gross * random_generator.uniform(0.2, 0.5)),
+            total_domestic_gross=domestic_gross,
+            worldwide_gross=worldwide_gross,
+            user_rating=round(random_generator.uniform(3.0, 9.5), 1),
+            title_id='tt{:07d}'.format(9000000 + i)))
+
+    return movie_records
@@ -0,0 +1,291 @@
+# On-disk HTTP response cache for the IMDb scraper.
+#
+# Every page the scraper downloads is saved to a local cache directory so
+# that tweaking an extractor doesn't mean fetching all of IMDb again.  The
+# page bodies are stored content-addressed (named by the SHA-256 of their
+# bytes, so identical pages are only stored once) and a small SQLite index
+# maps each URL to its body along with the ETag and Last-Modified headers
+# needed to revalidate it, and the time the server last sent or confirmed
+# it.  The cache has a size cap and throws out the
+# least recently used pages first once it is exceeded.
+#
+# A page that was only read up to a marker (see fetcher.readBody()) is
+# kept too, marked partial and without its validators: it is good enough
+# for another run that stops at the marker, but a run that needs the
+# whole page fetches it in full rather than reusing or revalidating it.
+#
+# Several processes can share one cache directory, as the local workers of
+# a distributed run do (see distributed.py).
+
+import contextlib
+import hashlib
+import os
+import sqlite3
+import time
+from collections import namedtuple
+
+DEFAULT_CACHE_DIR = '.imdb_cache'         # Where cached pages are kept.
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024    # 1 GB of page bodies.
+
+# A single cached response.  fetched_at is None for pages cached before
+# fetch times were kept.
+CachedResponse = namedtuple('CachedResponse',
+                            ['body', 'encoding', 'etag', 'last_modified',
+                             'fetched_at'])
+
+# Columns added to the index since it was first made, with their
+# definitions.
+ADDED_COLUMNS = {
+    'partial': 'INTEGER NOT NULL DEFAULT 0',
+    'fetched_at': 'REAL',
+}
+
+class CacheMiss(Exception):
+    '''
+    Raised in cache-only mode when a page has
+    never been fetched, since it can't be
+    fetched now.
+    '''
+
+class ResponseCache:
+    '''
+    Cache of HTTP response bodies keyed by URL.
+    When offline is True the cache is never
+    revalidated against the server and pages
+    that aren't cached raise CacheMiss.
+    '''
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR,
+                 max_bytes=DEFAULT_MAX_BYTES, offline=False):
+        self.cache_dir = cache_dir
+        self.object_dir = os.path.join(cache_dir, 'objects')
+        self.max_bytes = max_bytes
+        self.offline = offline
+
+        os.makedirs(self.object_dir, exist_ok=True)
+
+        # Wait for other processes' transactions rather than failing, and
+        # use WAL so that they can look pages up while one of them writes.
+        self.db = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite'),
+                                  timeout=60)
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                encoding TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                last_used REAL NOT NULL,
+                partial INTEGER NOT NULL DEFAULT 0,
+                fetched_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS objects (
+                digest TEXT PRIMARY KEY,
+                size INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_last_used
+                ON responses (last_used);
+        ''')
+
+        # Bring the index of an older cache up to date.  Its pages are all
+        # whole ones, with unknown fetch times.
+        columns = [row[1] for row in
+                   self.db.execute('PRAGMA table_info(responses)')]
+        for column, definition in ADDED_COLUMNS.items():
+            if(column not in columns):
+                self.db.execute('ALTER TABLE responses ADD COLUMN '
+                                '{} {}'.format(column, definition))
+        self.db.commit()
+
+        # Total size of the stored bodies, kept up to date as pages are
+        # added and evicted, and counted again before evicting since other
+        # processes may have added pages too.
+        self.total_bytes = self.countBytes()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE takes the write lock before anything is read, so
+        # that another process can't change the index in between.
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.db.rollback()
+            raise
+        self.db.commit()
+
+    def countBytes(self):
+        return self.db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM objects').fetchone()[0]
+
+    def objectPath(self, digest):
+        return os.path.join(self.object_dir, digest[:2], digest)
+
+    def lookup(self, url, partial=False):
+        '''
+        Return the CachedResponse stored for url,
+        or None if the page isn't in the cache.
+        A page that was only partly read counts as
+        cached if partial is True.
+        '''
+
+        row = self.db.execute('SELECT digest, encoding, etag, last_modified, '
+                              'fetched_at, partial FROM responses '
+                              'WHERE url = ?', (url,)).fetchone()
+        if(row is None or (row[5] and not partial)):
+            return None
+
+        digest, encoding, etag, last_modified, fetched_at, _ = row
+
+        try:
+            with open(self.objectPath(digest), 'rb') as object_file:
+                body = object_file.read()
+        except FileNotFoundError:
+            # The body was deleted out from under the index.
+            self.forget(url)
+            return None
+
+        self.touch(url)
+
+        return CachedResponse(body, encoding, etag, last_modified, fetched_at)
+
+    def conditionalHeaders(self, cached_response):
+        '''
+        Build the request headers that ask the
+        server to answer 304 Not Modified if the
+        cached copy of the page is still current.
+        '''
+
+        headers = {}
+        if(cached_response.etag):
+            headers['If-None-Match'] = cached_response.etag
+        if(cached_response.last_modified):
+            headers['If-Modified-Since'] = cached_response.last_modified
+        return headers
+
+    def store(self, url, body, encoding=None, etag=None, last_modified=None,
+              partial=False, fetched_at=None):
+        '''
+        Save a response body for url, fetched at
+        fetched_at (now by default), replacing any
+        earlier copy, and evict old pages if the
+        cache has grown past its size cap.  A
+        partial body is stored without its
+        validators, which belong to the whole page.
+        '''
+
+        if(partial):
+            etag = last_modified = None
+        if(fetched_at is None):
+            fetched_at = time.time()
+
+        digest = hashlib.sha256(body).hexdigest()
+        object_path = self.objectPath(digest)
+
+        if(not os.path.exists(object_path)):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+
+            # Write to a temporary file first so that a crash can never
+            # leave a half-written body under its final name, named after
+            # the process so that two of them never write the same one.
+            temp_path = '{}.{}.tmp'.format(object_path, os.getpid())
+            with open(temp_path, 'wb') as object_file:
+                object_file.write(body)
+            os.replace(temp_path, object_path)
+
+        with self.transaction():
+            if(self.db.execute('INSERT OR IGNORE INTO objects VALUES (?, ?)',
+                               (digest, len(body))).rowcount):
+                self.total_bytes += len(body)
+
+            old_row = self.db.execute('SELECT digest FROM responses '
+                                      'WHERE url = ?', (url,)).fetchone()
+
+            self.db.execute('INSERT OR REPLACE INTO responses (url, digest, '
+                            'encoding, etag, last_modified, last_used, '
+                            'partial, fetched_at) '
+                            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                            (url, digest, encoding, etag, last_modified,
+                             time.time(), int(partial), fetched_at))
+
+            if(old_row is not None and old_row[0] != digest):
+                self.dropObjectIfUnused(old_row[0])
+
+            self.evict()
+
+    def touch(self, url):
+        '''
+        Mark url as just used, moving it to the
+        back of the eviction queue.
+        '''
+
+        self.db.execute('UPDATE responses SET last_used = ? WHERE url = ?',
+                        (time.time(), url))
+        self.db.commit()
+
+    def markCurrent(self, url, fetched_at=None):
+        '''
+        Record that the server confirmed at
+        fetched_at (now by default) that the cached
+        copy of url is still current.
+        '''
+
+        if(fetched_at is None):
+            fetched_at = time.time()
+
+        self.db.execute('UPDATE responses SET last_used = ?, fetched_at = ? '
+                        'WHERE url = ?', (time.time(), fetched_at, url))
+        self.db.commit()
+
+    def forget(self, url):
+        '''
+        Remove url from the cache.
+        '''
+
+        with self.transaction():
+            row = self.db.execute('SELECT digest FROM responses '
+                                  'WHERE url = ?', (url,)).fetchone()
+            if(row is not None):
+                self.db.execute('DELETE FROM responses WHERE url = ?', (url,))
+                self.dropObjectIfUnused(row[0])
+
+    def dropObjectIfUnused(self, digest):
+        '''
+        Delete a stored body once no URL points
+        at it anymore.
+        '''
+
+        if(self.db.execute('SELECT 1 FROM responses WHERE digest = ? LIMIT 1',
+                           (digest,)).fetchone() is not None):
+            return
+
+        row = self.db.execute('SELECT size FROM objects WHERE digest = ?',
+                              (digest,)).fetchone()
+        if(row is not None):
+            self.db.execute('DELETE FROM objects WHERE digest = ?', (digest,))
+            self.total_bytes -= row[0]
+
+        try:
+            os.remove(self.objectPath(digest))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        '''
+        Drop the least recently used pages until
+        the cache fits within max_bytes.
+        '''
+
+        self.total_bytes = self.countBytes()
+        while(self.total_bytes > self.max_bytes):
+            row = self.db.execute('SELECT url, digest FROM responses '
+                                  'ORDER BY last_used LIMIT 1').fetchone()
+            if(row is None):
+                break
+
+            self.db.execute('DELETE FROM responses WHERE url = ?', (row[0],))
+            self.dropObjectIfUnused(row[1])
+
+    def close(self):
+        self.db.close()
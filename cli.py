@@ -0,0 +1,47 @@
+# Command line interface for the IMDb scraper and analysis.
+#
+#     python cli.py scrape [options]     Scrape movie data from IMDb.
+#     python cli.py analyze [options]    Fit the regression and save plots.
+#     python cli.py evaluate [options]   Compare models by cross validation.
+#     python cli.py predict [options]    Score films with a saved model.
+#
+# Each subcommand lives in its own module, which is only imported once the
+# subcommand has been picked, so e.g. `cli.py analyze` never pays for
+# importing the scraper's HTTP and HTML libraries.  Run
+# `python cli.py <subcommand> --help` for the options of each one.
+
+import argparse
+import importlib
+import sys
+
+# Subcommand -> (module implementing it, one-line description)
+COMMANDS = {
+    'scrape': ('scraper', 'scrape movie data from IMDb into the dataset'),
+    'analyze': ('analysis', 'fit the regression and plot the dataset'),
+    'evaluate': ('models', 'compare models of the dataset by cross validation'),
+    'predict': ('predict', 'predict box office earnings with a saved model'),
+}
+
+def main(argv=None):
+    prog = 'cli.py'
+
+    arg_parser = argparse.ArgumentParser(
+        prog=prog,
+        description='Scrape and analyze IMDb movie data.',
+        epilog='subcommands:\n' + '\n'.join('  {:<10} {}'.format(command,
+                                                                 description)
+                                            for command, (module, description)
+                                            in COMMANDS.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('command', choices=COMMANDS,
+                            help='subcommand to run')
+    arg_parser.add_argument('args', nargs=argparse.REMAINDER,
+                            help='options for the subcommand')
+    args = arg_parser.parse_args(argv)
+
+    # Import the subcommand's module only now that we know which one runs.
+    module = importlib.import_module(COMMANDS[args.command][0])
+    module.main(args.args, prog='{} {}'.format(prog, args.command))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
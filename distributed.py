@@ -0,0 +1,381 @@
+# Distributed scrape runs.
+#
+# One process can only fetch and parse so many pages a second, so a scrape
+# can be split across processes and machines that share a work queue (see
+# workqueue.py):
+#
+#     python cli.py scrape --queue scrape_queue.sqlite --local-workers 4
+#
+# runs a coordinator, which reads the list pages and puts every movie page
+# on the queue, and four worker processes that lease pages off the queue
+# and scrape them.  More workers can join from other machines with
+#
+#     python cli.py scrape --queue /shared/scrape_queue.sqlite --role worker \
+#         --shard-dir /shared/scrape_shards
+#
+# Each worker writes the movies it scrapes to a shard of its own in
+# --shard-dir, a journal like the one a single-process run keeps, so
+# workers never write to the same file.  Once every page is done, the
+# coordinator merges the shards into the dataset, keeping each title ID
+# only once, and empties the queue.  A coordinator or worker that is
+# restarted picks up where it left off.
+
+import asyncio
+import functools
+import glob
+import multiprocessing
+import os
+import socket
+import time
+
+import fetcher
+import journal
+import metrics
+import normalize
+import paginator
+import records
+import scraper
+import workqueue
+
+POLL_INTERVAL = 0.5      # Seconds between looks at the queue while waiting.
+PROGRESS_INTERVAL = 5.0  # Seconds between progress reports while waiting.
+
+class ShardJournal(journal.ScrapeJournal):
+    '''
+    Journal of the pages one worker has
+    scraped, which also reports each page it
+    finishes to the work queue.  Pages that
+    failed to download are put back on the
+    queue for another try.
+    '''
+
+    def __init__(self, path, work_queue):
+        super().__init__(path)
+        self.work_queue = work_queue
+        self.outstanding = set()  # Leased pages that aren't finished yet
+
+    def recordQueued(self, movie_link_list):
+        super().recordQueued(movie_link_list)
+        self.outstanding.update(movie_link_list)
+
+    def recordDone(self, movie_url, movie_record):
+        # Only report the page once it is safely in the shard.
+        super().recordDone(movie_url, movie_record)
+        self.work_queue.complete(movie_url)
+        self.outstanding.discard(movie_url)
+
+    def recordFailed(self, movie_url, error, kind=None):
+        super().recordFailed(movie_url, error, kind)
+        self.work_queue.fail(movie_url, error, retry=kind == 'network')
+        self.outstanding.discard(movie_url)
+
+def workerId():
+    return '{}-{}'.format(socket.gethostname(), os.getpid())
+
+def shardPath(shard_dir, worker_id):
+    return os.path.join(shard_dir, '{}.jsonl'.format(worker_id))
+
+def shardPaths(shard_dir):
+    return sorted(glob.glob(os.path.join(shard_dir, '*.jsonl')))
+
+async def collectLinks(work_queue, years, top_n, rate_limiter, cache,
+                       known_title_ids=frozenset(), timings=None,
+                       timeout=fetcher.DEFAULT_TIMEOUT,
+                       retries=fetcher.DEFAULT_RETRIES,
+                       site_url=paginator.base_url, transport=None):
+    '''
+    Collect the movie pages of each year with
+    the paginator and push them onto the work
+    queue, a list page at a time, so workers
+    can start on the first ones straight away.
+    Movies whose title ID is in known_title_ids
+    are left out.  Returns the number of pages
+    pushed.
+    '''
+
+    list_url = functools.partial(paginator.yearListUrl, site_url=site_url)
+
+    batch = []
+    pushed = 0
+    async for movie_link in paginator.iterMovieLinks(years, top_n,
+                                                     rate_limit=rate_limiter,
+                                                     timings=timings,
+                                                     cache=cache,
+                                                     timeout=timeout,
+                                                     retries=retries,
+                                                     list_url=list_url,
+                                                     transport=transport):
+        if(normalize.parseTitleId(movie_link) in known_title_ids):
+            continue
+
+        batch.append(movie_link)
+        if(len(batch) >= paginator.DEFAULT_TOP_N):
+            work_queue.push(batch)
+            pushed += len(batch)
+            batch = []
+
+    work_queue.push(batch)
+    work_queue.markCollected()
+
+    return pushed + len(batch)
+
+async def leasedLinks(work_queue, shard, worker_id, batch_size,
+                      lease=workqueue.DEFAULT_LEASE):
+    '''
+    Asynchronous generator that leases pages
+    off the work queue batch_size at a time and
+    yields them, recording each batch in the
+    shard.  While the queue is empty it waits
+    for more pages (or for other workers'
+    leases to run out), and it stops once
+    every page on the queue is finished.
+    '''
+
+    while(True):
+        movie_links = work_queue.lease(worker_id, batch_size, lease)
+
+        if(not movie_links):
+            if(work_queue.finished()):
+                return
+            await asyncio.sleep(POLL_INTERVAL)
+            continue
+
+        shard.recordQueued(movie_links)
+        for movie_link in movie_links:
+            yield movie_link
+
+async def renewLeases(work_queue, shard, worker_id,
+                      lease=workqueue.DEFAULT_LEASE):
+    '''
+    Keep extending the leases on the pages the
+    worker is still busy with, so that a page
+    that takes long (e.g. after several
+    retries) isn't handed to another worker.
+    '''
+
+    while(True):
+        await asyncio.sleep(lease / 3)
+        work_queue.renew(worker_id, list(shard.outstanding), lease)
+
+async def work(args, work_queue, shard, worker_id, timings, response_cache):
+    rate_limiter = fetcher.HostRateLimiter(args.rate_limit)
+    transport = fetcher.Transport(http2=args.http2)
+
+    renewer = asyncio.ensure_future(renewLeases(work_queue, shard, worker_id,
+                                                args.lease))
+    try:
+        return await scraper.scrapeMovies(
+            leasedLinks(work_queue, shard, worker_id, args.concurrency,
+                        args.lease),
+            args.concurrency, rate_limiter, args.workers, timings,
+            response_cache, shard, args.parser, args.timeout, args.retries,
+            transport, args.stop_early)
+    finally:
+        renewer.cancel()
+
+def runWorker(args, worker_id=None):
+    '''
+    Scrape pages off the work queue until it is
+    finished, writing them to this worker's
+    shard.  Returns the Metrics of the run.
+    '''
+
+    worker_id = worker_id or args.worker_id or workerId()
+
+    work_queue = workqueue.openQueue(args.queue, args.queue_backend)
+    os.makedirs(args.shard_dir, exist_ok=True)
+    shard = ShardJournal(shardPath(args.shard_dir, worker_id), work_queue)
+
+    timings = metrics.Metrics()
+    response_cache = scraper.openCache(args)
+
+    try:
+        asyncio.run(work(args, work_queue, shard, worker_id, timings,
+                         response_cache))
+    finally:
+        shard.close()
+        work_queue.close()
+        if(response_cache is not None):
+            response_cache.close()
+
+    # Verbose output
+    print('Worker {} scraped {} pages.'.format(worker_id,
+                                               len(shard.completed)))
+
+    return timings
+
+def localWorker(args, index):
+    '''
+    Entry point of a worker process started by
+    the coordinator.  The workers share the
+    coordinator's response cache, so a
+    --cache-only run finds the pages an earlier
+    run fetched.
+    '''
+
+    worker_id = '{}-local{}'.format(socket.gethostname(), index)
+    runWorker(args, worker_id)
+
+def iterShardRecords(shard_dir):
+    '''
+    Generator over the MovieRecords in every
+    shard in shard_dir.  A page that two
+    workers both scraped (because a lease ran
+    out while the first was still on it) is
+    only yielded once.
+    '''
+
+    seen = set()
+    for shard_path in shardPaths(shard_dir):
+        shard = journal.ScrapeJournal(shard_path)
+        try:
+            for movie_record in shard.iterRecords():
+                if(movie_record.title_id is not None):
+                    if(movie_record.title_id in seen):
+                        continue
+                    seen.add(movie_record.title_id)
+                yield movie_record
+        finally:
+            shard.close()
+
+def waitForWorkers(work_queue, processes):
+    '''
+    Wait until every page on the queue is done
+    or failed, reporting progress as it goes.
+    '''
+
+    last_report = time.monotonic()
+    while(not work_queue.finished()):
+        # Stop waiting if every local worker has died and nobody else is
+        # there to finish the pages.
+        if(processes and not any(process.is_alive() for process in processes)):
+            raise RuntimeError('Every worker stopped before the queue was '
+                               'finished.')
+
+        time.sleep(POLL_INTERVAL)
+
+        if(time.monotonic() - last_report >= PROGRESS_INTERVAL):
+            last_report = time.monotonic()
+            counts = work_queue.counts()
+
+            # Verbose output
+            print('Queue: {} done, {} in progress, {} waiting, {} failed.'\
+                  .format(counts.get('done', 0), counts.get('leased', 0),
+                          counts.get('pending', 0), counts.get('failed', 0)))
+
+def runCoordinator(args):
+    '''
+    Put the movie pages on the work queue,
+    start any local workers, wait for the queue
+    to be finished and merge the shards into
+    the dataset.
+    '''
+
+    timings = metrics.Metrics()
+    profiler = metrics.Profiler(args.profile, args.profile_output).start()
+
+    work_queue = workqueue.openQueue(args.queue, args.queue_backend)
+    if(args.restart):
+        work_queue.reset()
+        for shard_path in shardPaths(args.shard_dir):
+            os.remove(shard_path)
+
+    # As with a journal, a restarted coordinator has to be the same kind of
+    # run as the one that filled the queue.
+    if(work_queue.mode() is None):
+        work_queue.setMode(scraper.scrapeMode(args))
+    else:
+        scraper.checkMode(work_queue.mode(), scraper.scrapeMode(args),
+                          args.queue)
+
+    # The workers are started first so that they can scrape the pages as
+    # they are collected.  Spawned processes don't inherit the open queue
+    # connection or event loop, which a forked one would.
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=localWorker, args=(args, index))
+                 for index in range(args.local_workers)]
+    for process in processes:
+        process.start()
+
+    try:
+        # A restarted coordinator doesn't need to collect the pages again.
+        if(not work_queue.collected() and args.refresh):
+            work_queue.push(scraper.refreshLinks(args))
+            work_queue.markCollected()
+        elif(not work_queue.collected()):
+            # Verbose output
+            print('Initiating movie URL collection...')
+
+            years, known_title_ids = scraper.scrapeScope(args)
+            response_cache = scraper.openCache(args)
+            try:
+                pushed = asyncio.run(collectLinks(
+                    work_queue, years, args.top_n,
+                    fetcher.HostRateLimiter(args.rate_limit), response_cache,
+                    known_title_ids, timings, args.timeout, args.retries,
+                    args.base_url.rstrip('/'),
+                    fetcher.Transport(http2=args.http2)))
+            finally:
+                if(response_cache is not None):
+                    response_cache.close()
+
+            # Verbose output
+            print('Queued {} movie pages.'.format(pushed))
+
+        waitForWorkers(work_queue, processes)
+    finally:
+        for process in processes:
+            process.join()
+
+    counts = work_queue.counts()
+    timings.count('pages', counts.get('done', 0) + counts.get('failed', 0))
+    timings.count('failed', counts.get('failed', 0))
+
+    # Verbose output
+    for movie_url, error in work_queue.failures().items():
+        print('Failed to scrape {} ({}).'.format(movie_url, error))
+
+    # Merge the shards of every worker into the dataset, reading them one
+    # record at a time like the journal of a single-process run.
+    if(args.incremental or args.refresh):
+        saved = records.mergeMovies(iterShardRecords(args.shard_dir),
+                                    args.output, timings, args.batch_size)
+    else:
+        saved = records.saveMovies(iterShardRecords(args.shard_dir),
+                                   args.output, timings, args.batch_size)
+
+    # Verbose output
+    print('Saved {} movies from {} shards to \'{}\' ({} pages failed).'\
+          .format(saved, len(shardPaths(args.shard_dir)), args.output,
+                  counts.get('failed', 0)))
+
+    # Everything is in the dataset now, so the next run starts afresh.
+    work_queue.reset()
+    work_queue.close()
+    for shard_path in shardPaths(args.shard_dir):
+        os.remove(shard_path)
+
+    profiler.stop()
+
+    return timings
+
+def run(args):
+    '''
+    Take the part in a distributed scrape given
+    by --role, with the other options parsed by
+    scraper.py.
+    '''
+
+    if(args.role == 'worker'):
+        timings = runWorker(args)
+    else:
+        timings = runCoordinator(args)
+
+    if(args.timings):
+        print(timings.report())
+
+    if(args.metrics):
+        timings.writeJson(args.metrics)
+
+        # Verbose output
+        print('Saved run metrics to \'{}\'.'.format(args.metrics))
@@ -0,0 +1,485 @@
+# Extractor functions for the IMDb scraper.
+#
+# These functions take the HTML of an individual IMDb movie page and pull
+# the movie's features out of it.  They live in their own module, apart
+# from the code that fetches pages, so that they can be imported by the
+# parser worker processes without starting a scrape.
+
+import time
+
+from bs4 import BeautifulSoup
+
+from normalize import (parseBudget, parseGross, parseMPAArating,
+                       parseOpeningWeekendGross, parseReleaseMonth,
+                       parseRuntime, parseTitle, parseUserRating,
+                       parseYear)
+from records import MovieRecord
+
+def getMPAArating(movie_soup):
+    '''
+    Take the BeautifulSoup object movie_soup
+    and extract the MPAA rating string from
+    the object by stripping away extraneous
+    information and whitespace until the only
+    thing left is the rating.
+    '''
+
+    # Extract the tag soup containing the title block
+    # of the page.
+    rating_soup = movie_soup.find('div', class_='subtext').text
+
+    return parseMPAArating(rating_soup)
+
+def getMovieBudget(movie_soup):
+    '''
+    Find the budget line of the box office
+    section and convert the dollar amount on it
+    to an integer.
+    '''
+
+    # Navigate to the section that contains box
+    # office information.
+    box_office_soup = movie_soup.find('h3', class_='subheading')\
+                                .find_next_sibling()
+
+    return parseBudget(box_office_soup.text)
+
+def fetchOpeningWeekendGross(movie_soup):
+    '''
+    Obtain the opening weekend gross revenue.
+    '''
+
+    box_office_soup = movie_soup.find('h3', class_='subheading')\
+                                .find_next_sibling()\
+                                .find_next_sibling()
+
+    return parseOpeningWeekendGross(box_office_soup.text)
+
+def fetchReleaseMonth(movie_soup):
+    '''
+    After finding the section of the page containing
+    the release month, search it for the name of a
+    month.  If the name of a month is found, that is
+    the movie's release month and its respective
+    string value is returned.
+    '''
+
+    # Obtain the section of the page containing the release date.
+    release_date = movie_soup.find('div', class_='subtext')\
+                             .find(title='See more release dates').text
+
+    return parseReleaseMonth(release_date)
+
+def parseMovieDataSoup(movie_html):
+    '''
+    This function takes the HTML of an IMDb
+    movie page as an argument and scrapes it
+    for a MovieRecord of its attributes by
+    searching the BeautifulSoup tree separately
+    for every feature.  parseMovieData() does
+    the same job in a single pass over the page
+    and is the one the scraper uses; this
+    version is kept for comparison in the
+    benchmarks.
+    '''
+
+    # Convert the HTML of the page to a BeautifulSoup object.
+    movie_soup = BeautifulSoup(movie_html, 'html.parser')
+
+    # Get the MPAA rating of the movie.
+    mpaa_rating = getMPAArating(movie_soup)
+
+    release_month = fetchReleaseMonth(movie_soup) # Obtain the string value
+                                                  # of the release month
+
+    # The movie title being scraped from the page
+    title = parseTitle(movie_soup.find('div', class_='subtext')\
+                                 .find_previous_sibling().text)
+
+    # The year the movie was released, shown next to the title.
+    year = parseYear(movie_soup.find('span', id='titleYear').text)
+
+    # The runtime of the movie.  This is found by taking the
+    # second element on the page tagged on the page as 'time'
+    # and then stripping all non-numeric values from the string.
+    tech_spec_soup = movie_soup.find_all('time')[1]
+    runtime = parseRuntime(tech_spec_soup.text)
+
+    # Obtain the budget of the movie.
+    budget = getMovieBudget(movie_soup)
+
+    # opening_weekend_gross is opening weekend gross
+    opening_weekend_gross = fetchOpeningWeekendGross(movie_soup)
+
+    # Fetch total domestic gross revenue for movie.
+    box_office_soup = movie_soup.find('h3', class_='subheading')\
+                                .find_next_sibling()\
+                                .find_next_sibling()\
+                                .find_next_sibling()
+
+    total_domestic_gross = parseGross(box_office_soup.text)
+
+    # Obtain the worldwide gross
+    box_office_soup = movie_soup.find('h3', class_='subheading')\
+                                .find_next_sibling()\
+                                .find_next_sibling()\
+                                .find_next_sibling()\
+                                .find_next_sibling()
+
+    worldwide_gross = parseGross(box_office_soup.text)
+
+    # Obtain the user ratings of the movie
+    rating_soup = movie_soup.find('div', class_='ratingValue')
+    user_rating = parseUserRating(rating_soup.text)
+
+    return MovieRecord(title, year, release_month, mpaa_rating, runtime,
+                       budget, opening_weekend_gross, total_domestic_gross,
+                       worldwide_gross, user_rating)
+
+# The single-pass extractor engine.
+#
+# Rather than searching the page once per feature, the engine walks every
+# element of the page exactly once, noting the handful of "anchor"
+# elements that the features hang off of.  Each feature is then read from
+# its anchor (or a sibling of it) and converted by one of the parse
+# functions above.  The engine can run on top of whichever HTML parser is
+# installed: selectolax and lxml are much faster than BeautifulSoup's
+# html.parser, which is used as the fallback.
+
+# Anchor elements found during the pass over the page.  Each anchor is
+# described as (tag, attribute, value, occurrence): the anchor is the
+# occurrence-th element (counting from 0) with that tag whose attribute
+# contains value.  A tag of None matches any tag and an attribute of None
+# matches any element with the tag.
+ANCHORS = {
+    'subtext':      ('div', 'class', 'subtext', 0),
+    'title_year':   ('span', 'id', 'titleYear', 0),
+    'release_date': (None, 'title', 'See more release dates', 0),
+    'box_office':   ('h3', 'class', 'subheading', 0),
+    'runtime':      ('time', None, None, 1),
+    'user_rating':  ('div', 'class', 'ratingValue', 0),
+}
+
+# Fields of MovieRecord read from the anchors, as (feature, anchor, step,
+# parse).  The step says which element holds the feature: 0 is the anchor
+# itself, a positive number is that many siblings after the anchor and a
+# negative number is that many siblings before it.
+FIELDS = [
+    ('title',                 'subtext',      -1, parseTitle),
+    ('year',                  'title_year',    0, parseYear),
+    ('mpaa_rating',           'subtext',       0, parseMPAArating),
+    ('release_month',         'release_date',  0, parseReleaseMonth),
+    ('runtime',               'runtime',       0, parseRuntime),
+    ('budget',                'box_office',    1, parseBudget),
+    ('opening_weekend_gross', 'box_office',    2, parseOpeningWeekendGross),
+    ('total_domestic_gross',  'box_office',    3, parseGross),
+    ('worldwide_gross',       'box_office',    4, parseGross),
+    ('user_rating',           'user_rating',   0, parseUserRating),
+]
+
+# The runtime, the last of the anchors on the page, is the first of the
+# technical specs, so nothing after the next one is needed.  A movie page
+# can be cut off once this has been read (see fetcher.readBody()).
+STOP_MARKER = b'Sound Mix:'
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+class SoupBackend:
+    '''
+    Engine backend built on BeautifulSoup and
+    Python's html.parser, which is always
+    available.
+    '''
+
+    name = 'html.parser'
+
+    def parse(self, movie_html):
+        return BeautifulSoup(movie_html, 'html.parser')
+
+    def release(self, root):
+        # Every element links back to its parent, so the tree would
+        # otherwise linger until the garbage collector finds the cycles.
+        root.decompose()
+
+    def iterElements(self, root):
+        return root.find_all(True)
+
+    def tag(self, element):
+        return element.name
+
+    def attribute(self, element, name):
+        value = element.get(name)
+        if(isinstance(value, list)):
+            value = ' '.join(value)   # BeautifulSoup splits up 'class'.
+        return value
+
+    def text(self, element):
+        return element.text
+
+    def nextElement(self, element):
+        return element.find_next_sibling()
+
+    def previousElement(self, element):
+        return element.find_previous_sibling()
+
+class LxmlBackend:
+    '''
+    Engine backend built on lxml.html.
+    '''
+
+    name = 'lxml'
+
+    def parse(self, movie_html):
+        return lxml.html.fromstring(movie_html)
+
+    def release(self, root):
+        pass  # Freed as soon as the last reference goes.
+
+    def iterElements(self, root):
+        # Comments and processing instructions have a function as their
+        # tag, so only plain string tags are real elements.
+        return (element for element in root.iter()
+                if isinstance(element.tag, str))
+
+    def tag(self, element):
+        return element.tag
+
+    def attribute(self, element, name):
+        return element.get(name)
+
+    def text(self, element):
+        return element.text_content()
+
+    def nextElement(self, element):
+        element = element.getnext()
+        while(element is not None and not isinstance(element.tag, str)):
+            element = element.getnext()
+        return element
+
+    def previousElement(self, element):
+        element = element.getprevious()
+        while(element is not None and not isinstance(element.tag, str)):
+            element = element.getprevious()
+        return element
+
+class SelectolaxBackend:
+    '''
+    Engine backend built on selectolax, the
+    fastest of the three.
+    '''
+
+    name = 'selectolax'
+
+    def parse(self, movie_html):
+        return LexborHTMLParser(movie_html)
+
+    def release(self, root):
+        pass  # Freed as soon as the last reference goes.
+
+    def iterElements(self, root):
+        return root.root.traverse()
+
+    def tag(self, element):
+        return element.tag
+
+    def attribute(self, element, name):
+        return element.attributes.get(name)
+
+    def text(self, element):
+        return element.text(deep=True)
+
+    def nextElement(self, element):
+        # Text and comment nodes have tags starting with '-'.
+        element = element.next
+        while(element is not None and element.tag.startswith('-')):
+            element = element.next
+        return element
+
+    def previousElement(self, element):
+        element = element.prev
+        while(element is not None and element.tag.startswith('-')):
+            element = element.prev
+        return element
+
+# Backends in order of preference, along with whether each one can be used.
+BACKENDS = [
+    (SelectolaxBackend, LexborHTMLParser is not None),
+    (LxmlBackend, lxml is not None),
+    (SoupBackend, True),
+]
+
+def availableParsers():
+    '''
+    Return the names of the parsers that are
+    installed, fastest first.
+    '''
+
+    return [backend.name for backend, available in BACKENDS if available]
+
+def chooseBackend(parser=None):
+    '''
+    Return the engine backend for the named
+    parser, or the fastest one installed if no
+    parser is named.
+    '''
+
+    for backend, available in BACKENDS:
+        if(available and parser in (None, backend.name)):
+            return backend()
+
+    raise ValueError('The {} parser is not available (installed parsers: {}).'\
+                     .format(parser, ', '.join(availableParsers())))
+
+DEFAULT_PARSER = availableParsers()[0]
+
+# Backends already created, by parser name.
+backend_cache = {}
+
+def findAnchors(backend, root):
+    '''
+    Walk every element of the page once and
+    return a dictionary mapping each anchor in
+    ANCHORS to the element found for it.
+    '''
+
+    # Group the anchors by tag so that each element only has to be checked
+    # against the anchors that could possibly match it.
+    anchors_by_tag = {}
+    for anchor, (tag, attribute, value, occurrence) in ANCHORS.items():
+        anchors_by_tag.setdefault(tag, []).append(
+            (anchor, attribute, value, occurrence))
+
+    any_tag_anchors = anchors_by_tag.pop(None, [])
+
+    found = {}
+    seen = dict.fromkeys(ANCHORS, 0)  # Matches so far for each anchor
+
+    for element in backend.iterElements(root):
+        candidates = anchors_by_tag.get(backend.tag(element), [])
+
+        for anchor, attribute, value, occurrence in candidates + any_tag_anchors:
+            if(anchor in found):
+                continue
+
+            if(attribute is not None):
+                element_value = backend.attribute(element, attribute)
+                if(element_value is None):
+                    continue
+                if(attribute == 'class'):
+                    if(value not in element_value.split()):
+                        continue
+                elif(value not in element_value):
+                    continue
+
+            if(seen[anchor] == occurrence):
+                found[anchor] = element
+            seen[anchor] += 1
+
+        # Stop walking as soon as every anchor has been found.
+        if(len(found) == len(ANCHORS)):
+            break
+
+    return found
+
+def extractFields(movie_html, parser=None, stage_seconds=None):
+    '''
+    Pull every feature in FIELDS out of the HTML
+    of a movie page in a single pass, using the
+    named parser (or the fastest one installed).
+    Returns a dictionary of feature values.  If
+    a stage_seconds dictionary is passed in, the
+    time taken by each step (building the tree,
+    finding the anchors, walking the siblings
+    and each field's parser) is stored in it.
+    '''
+
+    if(stage_seconds is None):
+        stage_seconds = {}
+    clock = time.perf_counter
+
+    parser = parser or DEFAULT_PARSER
+    if(parser not in backend_cache):
+        backend_cache[parser] = chooseBackend(parser)
+    backend = backend_cache[parser]
+
+    start = clock()
+    root = backend.parse(movie_html)
+    stage_seconds['parse.tree'] = clock() - start
+
+    # Free the tree as soon as the fields are read, even if reading them
+    # failed, rather than whenever the garbage collector gets to it.
+    try:
+        return readFields(backend, root, stage_seconds)
+    finally:
+        backend.release(root)
+
+def readFields(backend, root, stage_seconds):
+    '''
+    Read every feature in FIELDS out of a parsed
+    page for extractFields().
+    '''
+
+    clock = time.perf_counter
+
+    start = clock()
+    anchors = findAnchors(backend, root)
+    stage_seconds['parse.anchors'] = clock() - start
+
+    start = clock()
+
+    # Walk along the siblings of each anchor once, as far as the furthest
+    # step any feature needs, rather than once per feature.
+    siblings = {}
+    for feature, anchor, step, parse in FIELDS:
+        if(anchor not in anchors):
+            raise ValueError('Could not find the {} section of the page.'\
+                             .format(anchor))
+
+        steps = siblings.setdefault(anchor, {0: anchors[anchor]})
+        if(step in steps):
+            continue
+
+        direction = 1 if step > 0 else -1
+        position = max((s for s in steps if s * direction >= 0),
+                       key=abs)
+        element = steps[position]
+        while(position != step):
+            if(direction > 0):
+                element = backend.nextElement(element)
+            else:
+                element = backend.previousElement(element)
+            if(element is None):
+                raise ValueError('Could not find the {} of the movie.'\
+                                 .format(feature))
+            position += direction
+            steps[position] = element
+
+    stage_seconds['parse.siblings'] = clock() - start
+
+    fields = {}
+    for feature, anchor, step, parse in FIELDS:
+        start = clock()
+        fields[feature] = parse(backend.text(siblings[anchor][step]))
+        stage_seconds['field.' + feature] = clock() - start
+
+    return fields
+
+def parseMovieData(movie_html, parser=None, stage_seconds=None):
+    '''
+    This function takes the HTML of an IMDb
+    movie page as an argument and scrapes it
+    for movie attributes using the single-pass
+    extractor engine.  Returns a MovieRecord.
+    Timings go into the optional stage_seconds
+    dictionary, as for extractFields().
+    '''
+
+    return MovieRecord(**extractFields(movie_html, parser, stage_seconds))
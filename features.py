@@ -0,0 +1,138 @@
+# Feature engineering for the IMDb analysis.
+#
+# The dataset only stores the values scraped from each movie's page.  This
+# module turns those into the feature matrix the models are fitted on: the
+# numeric columns as they are or log transformed, one 0/1 column per MPAA
+# rating, release month and season, and the release year.  Every feature is
+# computed for the whole dataset at once with NumPy rather than movie by
+# movie, and the result is either a dense NumPy array or a SciPy sparse
+# matrix, both of which scikit-learn accepts as they are.  Features are
+# picked by name, so trying a new one means adding it here rather than
+# scraping the dataset again.
+
+import numpy as np
+import pandas as pd
+
+from normalize import MONTH_NAMES
+from records import COLUMN_NAMES, MPAA_RATINGS
+
+# Seasons of the year, each with the index of its months in MONTH_NAMES.
+SEASONS = ['Winter', 'Spring', 'Summer', 'Fall']
+MONTH_SEASONS = np.array([0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3, 0])
+
+TARGET_COLUMN = COLUMN_NAMES['worldwide_gross']
+
+def numericColumn(df, field):
+    return df[COLUMN_NAMES[field]].to_numpy(dtype=float)[:, np.newaxis]
+
+def logColumn(df, field):
+    '''
+    Return log(1 + x) of a numeric column, with
+    negative values treated as 0.
+    '''
+
+    return np.log1p(np.clip(numericColumn(df, field), 0, None))
+
+def categoryCodes(df, field, categories):
+    '''
+    Return the index in categories of the value
+    of a column in each row, or -1 for values
+    that aren't in the list.
+    '''
+
+    return df[COLUMN_NAMES[field]].astype(pd.CategoricalDtype(categories))\
+                                  .cat.codes.to_numpy()
+
+def oneHot(codes, n_categories, sparse=False):
+    '''
+    Return a matrix with one 0/1 column per
+    category, marking the category of each row.
+    Rows with the code -1 are all zeros.
+    '''
+
+    if(not sparse):
+        return (codes[:, np.newaxis] == np.arange(n_categories)).astype(float)
+
+    from scipy import sparse as sp
+
+    rows = np.flatnonzero(codes >= 0)
+    return sp.csr_matrix((np.ones(len(rows)), (rows, codes[rows])),
+                         shape=(len(codes), n_categories))
+
+def monthCodes(df):
+    return categoryCodes(df, 'release_month', MONTH_NAMES)
+
+def seasonCodes(df):
+    month_codes = monthCodes(df)
+    return np.where(month_codes >= 0, MONTH_SEASONS[month_codes], -1)
+
+# Feature name -> (function returning its block of columns from the
+# dataframe and whether to return it sparse, names of those columns).
+FEATURES = {
+    'budget': (lambda df, sparse: numericColumn(df, 'budget'),
+               ['Budget']),
+    'log_budget': (lambda df, sparse: logColumn(df, 'budget'),
+                   ['Log Budget']),
+    'runtime': (lambda df, sparse: numericColumn(df, 'runtime'),
+                ['Runtime']),
+    'year': (lambda df, sparse: numericColumn(df, 'year'),
+             ['Year']),
+    'log_opening_weekend_gross': (
+        lambda df, sparse: logColumn(df, 'opening_weekend_gross'),
+        ['Log Opening Weekend Box Office Earnings']),
+    'log_total_domestic_gross': (
+        lambda df, sparse: logColumn(df, 'total_domestic_gross'),
+        ['Log Total Domestic Gross Earnings']),
+    'release_month': (lambda df, sparse: oneHot(monthCodes(df),
+                                                len(MONTH_NAMES), sparse),
+                      list(MONTH_NAMES)),
+    'season': (lambda df, sparse: oneHot(seasonCodes(df), len(SEASONS),
+                                         sparse),
+               SEASONS),
+    'mpaa_rating': (lambda df, sparse: oneHot(categoryCodes(df, 'mpaa_rating',
+                                                            MPAA_RATINGS),
+                                              len(MPAA_RATINGS), sparse),
+                    ['{} Dummy'.format(rating) for rating in MPAA_RATINGS]),
+}
+
+# Features the regression of analysis.py is fitted on: the budget, the
+# runtime and a dummy variable for each release month and for each MPAA
+# rating.
+FEATURE_LIST = ['budget', 'runtime', 'release_month', 'mpaa_rating']
+
+def featureNames(feature_list):
+    '''
+    Return the names of the columns of the
+    matrix featureMatrix() builds for the given
+    features, in order.
+    '''
+
+    return [column for feature in feature_list
+            for column in FEATURES[feature][1]]
+
+def featureMatrix(df, feature_list, sparse=False):
+    '''
+    Build the feature matrix for the named
+    features (keys of FEATURES) from a dataframe
+    loaded by records.loadMovies().  Returns a
+    dense NumPy array, or a SciPy CSR matrix if
+    sparse is True.
+    '''
+
+    blocks = [FEATURES[feature][0](df, sparse) for feature in feature_list]
+
+    if(not sparse):
+        return np.hstack(blocks) if blocks else np.empty((len(df), 0))
+
+    from scipy import sparse as sp
+
+    return sp.hstack(blocks, format='csr')
+
+def targetVector(df, log=False):
+    '''
+    Return the worldwide gross earnings of each
+    movie, or log(1 + earnings) if log is True.
+    '''
+
+    y = df[TARGET_COLUMN].to_numpy(dtype=float)
+    return np.log1p(np.clip(y, 0, None)) if log else y
@@ -0,0 +1,805 @@
+# Concurrent fetch engine for the IMDb scraper.
+#
+# Fetching the movie pages one after another means the total run time is
+# the sum of every round trip to imdb.com.  This module fetches many pages
+# at once over a single pooled aiohttp session instead, while capping the
+# number of requests in flight and spacing out requests made to the same
+# host so that we stay polite.  When a response cache is supplied, pages
+# are served from it and only revalidated against the server.
+#
+# Requests that fail in a way that may clear up by itself (a timeout, a
+# dropped connection, 429 Too Many Requests or a 5xx error) are retried
+# after an exponential backoff with random jitter, or after the delay the
+# server asks for in its Retry-After header.  The number of requests in
+# flight adapts too: it is halved when the server starts throttling or
+# erroring and crept back up while requests succeed.
+#
+# Every fetch loop of a run can share one Transport, so that the list pages
+# and the movie pages go over the same pool of kept-alive connections
+# instead of a TLS handshake per page.  Responses come gzip, deflate or
+# (with the brotli package installed) brotli compressed, and a Transport can
+# speak HTTP/2 when httpx and h2 are installed.  Movie page bodies can also
+# be streamed and cut off as soon as the last section the extractors need
+# has arrived.
+
+import asyncio
+import contextlib
+import random
+import time
+import warnings
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import aiohttp
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+from cache import CacheMiss
+
+DEFAULT_CONCURRENCY = 10   # Maximum number of requests in flight at once.
+DEFAULT_RATE_LIMIT = None  # Maximum requests per second to a single host
+                           # (None means no limit).
+DEFAULT_TIMEOUT = 30.0     # Seconds allowed for a single request.
+DEFAULT_RETRIES = 3        # Extra attempts made after a transient failure.
+
+KEEPALIVE_TIMEOUT = 30.0   # Seconds an idle connection is kept open.
+STREAM_CHUNK_SIZE = 16384  # Bytes read at a time when streaming a body.
+
+BACKOFF_BASE = 0.5         # Seconds before the first retry, doubling after
+BACKOFF_MAX = 60.0         # each failed attempt, up to this cap.
+
+# HTTP statuses that mean "try again later" rather than "this page is bad".
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# Exceptions raised when a page couldn't be fetched, as opposed to fetched
+# and then failing to parse.
+NETWORK_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, CacheMiss)
+
+class HostRateLimiter:
+    '''
+    Keep requests to the same host at least
+    1 / rate seconds apart.  Each caller is
+    handed the next free time slot for its
+    host and sleeps until that slot arrives.
+    '''
+
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_slot = {}  # Host name -> earliest time of next request
+
+    async def wait(self, host):
+        now = time.monotonic()
+        slot = max(now, self.next_slot.get(host, now))
+
+        # Reserve the slot before sleeping so that the next caller for
+        # this host lines up behind us.
+        self.next_slot[host] = slot + self.interval
+
+        if(slot > now):
+            await asyncio.sleep(slot - now)
+
+    def pause(self, host, seconds):
+        '''
+        Hold back every request to host for the
+        next few seconds, e.g. when the server has
+        asked us to with a Retry-After header.
+        '''
+
+        resume = time.monotonic() + seconds
+        self.next_slot[host] = max(self.next_slot.get(host, resume), resume)
+
+class AdaptiveConcurrency:
+    '''
+    Async context manager that caps the number
+    of requests in flight, like a semaphore
+    whose size adapts to how the server copes.
+    Requests are judged in rounds of as many
+    requests as the current limit.  If any of a
+    round was throttled (429), or more than
+    ERROR_THRESHOLD of it failed some other
+    transient way, the limit is cut by the
+    factor DECREASE (down to min_limit);
+    otherwise it grows by one (up to max_limit).
+    Like TCP, it starts out cautiously, at no
+    more than DEFAULT_CONCURRENCY, and doubles
+    after each good round until the first cut.
+    Requests already in flight when the limit
+    is cut are left out of the next round, since
+    they were sent under the old limit.
+    '''
+
+    ERROR_THRESHOLD = 0.2
+    DECREASE = 0.7
+
+    def __init__(self, max_limit=DEFAULT_CONCURRENCY, min_limit=1):
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.limit = min(max_limit, max(self.min_limit, DEFAULT_CONCURRENCY))
+        self.slow_start = True      # Double the limit until the first cut
+        self.in_flight = 0
+        self.round_requests = 0     # Requests finished in this round
+        self.round_errors = 0       # ... how many of them failed
+        self.round_throttled = False  # ... and whether any got a 429
+        self.stale = 0              # Requests left that predate a decrease
+        self.slot_free = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self.slot_free:
+            await self.slot_free.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def __aexit__(self, *exc_info):
+        async with self.slot_free:
+            self.in_flight -= 1
+            # Only wake as many waiters as there are free slots; waking all
+            # of them on every request would cost time in proportion to the
+            # number of pages waiting.
+            self.slot_free.notify(max(0, self.limit - self.in_flight))
+
+    def record(self, failed=False, throttled=False):
+        '''
+        Report how a request went: whether it
+        failed transiently and whether the server
+        throttled it.
+        '''
+
+        if(self.stale > 0):
+            self.stale -= 1
+            return
+
+        self.round_requests += 1
+        self.round_errors += failed
+        self.round_throttled = self.round_throttled or throttled
+
+        if(self.round_requests < self.limit):
+            return
+
+        if(self.round_throttled or
+           self.round_errors > self.ERROR_THRESHOLD * self.round_requests):
+            self.limit = max(self.min_limit, int(self.limit * self.DECREASE))
+            self.stale = self.in_flight - 1  # Not counting this request
+            self.slow_start = False
+        elif(self.slow_start):
+            self.limit = min(self.max_limit, self.limit * 2)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1)
+
+        self.round_requests = 0
+        self.round_errors = 0
+        self.round_throttled = False
+
+def decodeBody(body, encoding):
+    return body.decode(encoding or 'utf-8', errors='replace')
+
+async def readBody(response, stop_marker=None):
+    '''
+    Read the body of a response.  With a
+    stop_marker (bytes), the body is streamed
+    and reading stops with the chunk in which
+    the marker turns up, so the rest of it is
+    never downloaded.  Returns the body and
+    whether all of it was read.
+    '''
+
+    if(stop_marker is None):
+        return await response.read(), True
+
+    chunks = []
+    tail = b''  # End of the body so far, in case the marker straddles chunks
+    async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+        chunks.append(chunk)
+        if(stop_marker in tail + chunk):
+            return b''.join(chunks), False
+        tail = (tail + chunk)[-len(stop_marker):]
+
+    return b''.join(chunks), True
+
+def isRetryable(error):
+    '''
+    Whether a failed request is worth trying
+    again: timeouts, dropped connections and
+    the HTTP statuses in RETRY_STATUSES.
+    '''
+
+    if(isinstance(error, aiohttp.ClientResponseError)):
+        return error.status in RETRY_STATUSES
+
+    return isinstance(error, (asyncio.TimeoutError,
+                              aiohttp.ClientConnectionError,
+                              aiohttp.ClientPayloadError))
+
+def retryAfter(error):
+    '''
+    Return the number of seconds the server
+    asked us to wait in the Retry-After header
+    of a failed response, or None.  The header
+    holds either a number of seconds or a date.
+    '''
+
+    headers = getattr(error, 'headers', None)
+    value = headers.get('Retry-After') if headers else None
+    if(not value):
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoffDelay(attempt, retry_after=None):
+    '''
+    Seconds to wait before retry number attempt
+    (counting from 0): a random delay of up to
+    BACKOFF_BASE * 2**attempt ("full jitter", so
+    that clients that failed together don't
+    retry together), but never less than the
+    server's Retry-After.
+    '''
+
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+
+    if(retry_after is not None):
+        delay = max(delay, retry_after)
+
+    return delay
+
+async def requestPage(session, page_url, limiter, rate_limiter, headers,
+                      cached_response, timings, cache, stop_marker=None):
+    '''
+    Make a single request for a page and return
+    its body, its encoding and the time it was
+    fetched, telling the limiter
+    whether the server coped with it.  The time
+    until the response headers arrive ('wait')
+    and spent reading the body ('transfer') are
+    recorded separately, along with the number
+    of bytes received.  The body is cut short
+    at stop_marker as in readBody(), in which
+    case the cache keeps what was read as a
+    partial page.
+    '''
+
+    async with limiter:
+        await rate_limiter.wait(urlsplit(page_url).hostname)
+
+        start = time.perf_counter()
+
+        try:
+            async with session.get(page_url, headers=headers) as response:
+                headers_received = time.perf_counter()
+
+                fetched_at = time.time()
+
+                if(response.status == 304 and cached_response is not None):
+                    # Our copy is still current, so there's no body to read.
+                    body = cached_response.body
+                    encoding = cached_response.encoding
+                    cache.markCurrent(page_url, fetched_at)
+
+                    if(timings is not None):
+                        timings.count('not_modified')
+
+                else:
+                    response.raise_for_status()
+                    body, complete = await readBody(response, stop_marker)
+                    encoding = response.get_encoding()
+
+                    if(timings is not None):
+                        timings.count('bytes', len(body))
+                        if(not complete):
+                            timings.count('stopped_early')
+
+                    if(cache is not None):
+                        cache.store(page_url, body, encoding,
+                                    response.headers.get('ETag'),
+                                    response.headers.get('Last-Modified'),
+                                    partial=not complete,
+                                    fetched_at=fetched_at)
+
+        except Exception as error:
+            limiter.record(failed=isRetryable(error),
+                           throttled=getattr(error, 'status', None) == 429)
+            if(timings is not None):
+                timings.count('request_errors')
+            raise
+
+        limiter.record()
+
+        if(timings is not None):
+            end = time.perf_counter()
+            timings.add('fetch', end - start)
+            timings.add('fetch.wait', headers_received - start)
+            timings.add('fetch.transfer', end - headers_received)
+            timings.count('requests')
+
+        return body, encoding, fetched_at
+
+async def fetchPage(session, page_url, limiter, rate_limiter, timings=None,
+                    cache=None, retries=DEFAULT_RETRIES, stop_marker=None):
+    '''
+    Fetch a single page and return its HTML
+    as a string, as fetchTimedPage() does.
+    '''
+
+    page_html, fetched_at = await fetchTimedPage(session, page_url, limiter,
+                                                 rate_limiter, timings, cache,
+                                                 retries, stop_marker)
+    return page_html
+
+async def fetchTimedPage(session, page_url, limiter, rate_limiter,
+                         timings=None, cache=None, retries=DEFAULT_RETRIES,
+                         stop_marker=None):
+    '''
+    Fetch a single page and return its HTML
+    as a string along with the time (in
+    seconds since the epoch) the server sent
+    it or confirmed the cached copy.  The limiter (an
+    AdaptiveConcurrency) caps how many pages
+    are fetched at the same time and the rate
+    limiter spaces out requests to the same
+    host.  Transient failures are retried up to
+    retries times with a backoff, and the last
+    error is raised if they all fail.  If a
+    timings object is given, the seconds spent
+    on the request are added to its 'fetch'
+    stage (and its 'fetch.wait' and
+    'fetch.transfer' parts) and the time spent
+    backing off to its 'backoff' stage.
+
+    With a ResponseCache, a cached page is
+    revalidated using its ETag/Last-Modified
+    headers and reused if the server answers
+    304 Not Modified.  In cache-only mode the
+    server is never contacted at all.  With a
+    stop_marker, only the body up to the marker
+    is read (see readBody()), and a page cached
+    that way can be reused; without one, only a
+    whole cached page can.  A page read from
+    the cache in cache-only mode has the time
+    it was cached, or None for pages cached
+    before fetch times were kept.
+    '''
+
+    cached_response = None
+    if(cache is not None):
+        cached_response = cache.lookup(page_url,
+                                       partial=stop_marker is not None)
+
+    if(cache is not None and cache.offline):
+        if(cached_response is None):
+            raise CacheMiss(page_url)
+        if(timings is not None):
+            timings.count('cache_hits')
+        return (decodeBody(cached_response.body, cached_response.encoding),
+                cached_response.fetched_at)
+
+    headers = {}
+    if(cached_response is not None):
+        headers = cache.conditionalHeaders(cached_response)
+
+    for attempt in range(retries + 1):
+        try:
+            body, encoding, fetched_at = await requestPage(
+                session, page_url, limiter, rate_limiter, headers,
+                cached_response, timings, cache, stop_marker)
+            return decodeBody(body, encoding), fetched_at
+
+        except Exception as error:
+            if(attempt == retries or not isRetryable(error)):
+                raise
+
+            delay = backoffDelay(attempt, retryAfter(error))
+
+            # A server that names a delay wants every request to it held
+            # back, not just this one.
+            if(retryAfter(error) is not None):
+                rate_limiter.pause(urlsplit(page_url).hostname, delay)
+
+            if(timings is not None):
+                timings.add('backoff', delay)
+                timings.count('retries')
+
+        # Back off outside the limiter so other pages can use the slot.
+        await asyncio.sleep(delay)
+
+def traceConfig(timings):
+    '''
+    Build an aiohttp trace config that records
+    the time spent on DNS lookups ('dns') and
+    on opening new connections ('connect',
+    which includes the DNS lookup and the TLS
+    handshake) in timings, and counts the
+    connections opened ('connections') and
+    reused ('connections.reused').
+    '''
+
+    trace_config = aiohttp.TraceConfig()
+
+    def timeStage(stage):
+        async def onStart(session, context, params):
+            setattr(context, stage, time.perf_counter())
+
+        async def onEnd(session, context, params):
+            timings.add(stage, time.perf_counter() - getattr(context, stage))
+
+        return onStart, onEnd
+
+    dns_start, dns_end = timeStage('dns')
+    trace_config.on_dns_resolvehost_start.append(dns_start)
+    trace_config.on_dns_resolvehost_end.append(dns_end)
+
+    connect_start, connect_end = timeStage('connect')
+    trace_config.on_connection_create_start.append(connect_start)
+    trace_config.on_connection_create_end.append(connect_end)
+
+    async def countConnection(session, context, params):
+        timings.count('connections')
+
+    async def countReuse(session, context, params):
+        timings.count('connections.reused')
+
+    trace_config.on_connection_create_end.append(countConnection)
+    trace_config.on_connection_reuseconn.append(countReuse)
+
+    return trace_config
+
+def openSession(concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+                timings=None, keep_alive=True, ssl=None):
+    '''
+    Open an aiohttp session with a pool of up
+    to concurrency connections and a timeout
+    of timeout seconds per request.  With a
+    timings object, DNS lookups and new
+    connections are timed too.  Connections are
+    kept alive between requests unless
+    keep_alive is False, and servers are
+    verified with the SSLContext ssl (or the
+    default one).
+    '''
+
+    # One pooled session is shared by every request so that connections
+    # to imdb.com are kept alive and reused.  The DNS lookup is cached for
+    # as long as an idle connection is kept.
+    connector = aiohttp.TCPConnector(limit=concurrency,
+                                     force_close=not keep_alive,
+                                     keepalive_timeout=KEEPALIVE_TIMEOUT
+                                     if keep_alive else None,
+                                     ttl_dns_cache=KEEPALIVE_TIMEOUT,
+                                     ssl=ssl if ssl is not None else True)
+
+    trace_configs = [traceConfig(timings)] if timings is not None else []
+
+    return aiohttp.ClientSession(connector=connector,
+                                 timeout=aiohttp.ClientTimeout(total=timeout),
+                                 trace_configs=trace_configs)
+
+def http2Available():
+    '''
+    Whether httpx and h2, which HTTP/2 needs,
+    are installed.
+    '''
+
+    try:
+        import h2
+        import httpx
+    except ImportError:
+        return False
+
+    return True
+
+class Http2Response:
+    '''
+    An httpx response with the parts of an
+    aiohttp response the fetch engine uses.
+    '''
+
+    def __init__(self, response):
+        self.response = response
+        self.status = response.status_code
+        self.headers = response.headers
+        self.content = self  # For content.iter_chunked()
+
+    def raise_for_status(self):
+        # Raise the same error aiohttp would, so that retries and failure
+        # reports work the same way over either transport.
+        if(self.status >= 400):
+            request_info = aiohttp.RequestInfo(
+                URL(str(self.response.url)), 'GET',
+                CIMultiDictProxy(CIMultiDict(self.response.request.headers)))
+            raise aiohttp.ClientResponseError(request_info, (),
+                                              status=self.status,
+                                              message=self.response.reason_phrase,
+                                              headers=self.headers)
+
+    async def read(self):
+        return await self.response.aread()
+
+    def iter_chunked(self, size):
+        return self.response.aiter_bytes(size)
+
+    def get_encoding(self):
+        return self.response.charset_encoding or 'utf-8'
+
+class Http2Session:
+    '''
+    Stands in for an aiohttp session, but makes
+    its requests with httpx over HTTP/2, so
+    that all of them share a few connections.
+    Servers that don't offer HTTP/2 are spoken
+    to over HTTP/1.1.  httpx errors are raised
+    as the matching aiohttp ones.  The
+    arguments are those of openSession().
+    '''
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY,
+                 timeout=DEFAULT_TIMEOUT, timings=None, keep_alive=True,
+                 ssl=None):
+        import httpx
+
+        limits = httpx.Limits(max_connections=concurrency,
+                              max_keepalive_connections=concurrency
+                              if keep_alive else 0,
+                              keepalive_expiry=KEEPALIVE_TIMEOUT)
+        self.client = httpx.AsyncClient(http2=True, limits=limits,
+                                        timeout=timeout,
+                                        verify=ssl if ssl is not None else True)
+        self.timings = timings
+
+    def trace(self, page_url):
+        # httpcore reports the steps of each request to this callback,
+        # which times and counts new connections like traceConfig() does.
+        # A connection is ready once it is open, or once the TLS handshake
+        # is done for https.
+        ready_event = 'connection.start_tls.complete' \
+            if page_url.startswith('https:') else 'connection.connect_tcp.complete'
+        started = {}
+
+        async def onEvent(event_name, info):
+            if(event_name == 'connection.connect_tcp.started'):
+                started['connect'] = time.perf_counter()
+            elif(event_name == ready_event):
+                self.timings.count('connections')
+                self.timings.add('connect',
+                                 time.perf_counter() - started['connect'])
+
+        return onEvent
+
+    @contextlib.asynccontextmanager
+    async def get(self, page_url, headers=None):
+        import httpx
+
+        extensions = {}
+        if(self.timings is not None):
+            extensions['trace'] = self.trace(page_url)
+
+        try:
+            async with self.client.stream('GET', page_url, headers=headers,
+                                          extensions=extensions) as response:
+                yield Http2Response(response)
+        except httpx.TimeoutException as error:
+            raise asyncio.TimeoutError(repr(error)) from error
+        except httpx.TransportError as error:
+            raise aiohttp.ClientConnectionError(repr(error)) from error
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+class Transport:
+    '''
+    How pages are requested.  Fetch loops that
+    are handed the same Transport share one
+    session, and so one pool of connections,
+    for as long as any of them is running.
+    With http2, HTTP/2 is used where httpx and
+    h2 are installed (and HTTP/1.1 otherwise,
+    with a warning).  keep_alive and ssl are
+    passed on to openSession(); turning
+    keep_alive off opens a connection for every
+    request, as requests.get() does.
+    '''
+
+    def __init__(self, http2=False, keep_alive=True, ssl=None):
+        self.http2 = http2 and http2Available()
+        if(http2 and not self.http2):
+            warnings.warn('HTTP/2 needs httpx and h2 to be installed; '
+                          'using HTTP/1.1 instead.')
+
+        self.keep_alive = keep_alive
+        self.ssl = ssl
+        self.shared = None  # [event loop, session, users] of the open session
+
+    def open(self, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+             timings=None):
+        if(self.http2):
+            return Http2Session(concurrency, timeout, timings, self.keep_alive,
+                                self.ssl)
+
+        return openSession(concurrency, timeout, timings, self.keep_alive,
+                           self.ssl)
+
+    @contextlib.asynccontextmanager
+    async def session(self, concurrency=DEFAULT_CONCURRENCY,
+                      timeout=DEFAULT_TIMEOUT, timings=None):
+        '''
+        Async context manager giving the session
+        of the running event loop, which is opened
+        with these arguments by the first user
+        and closed when the last one is done.
+        '''
+
+        # A session can't outlive its event loop, so a new loop (e.g. the
+        # retry pass of the scraper) gets a session of its own.
+        loop = asyncio.get_running_loop()
+        if(self.shared is None or self.shared[0] is not loop):
+            self.shared = [loop, self.open(concurrency, timeout, timings), 0]
+
+        shared = self.shared
+        shared[2] += 1
+        try:
+            yield shared[1]
+        finally:
+            shared[2] -= 1
+            if(shared[2] == 0):
+                await shared[1].close()
+                if(self.shared is shared):
+                    self.shared = None
+
+def rateLimiter(rate_limit):
+    '''
+    Return a HostRateLimiter for rate_limit
+    requests per second.  An existing limiter
+    is returned as it is, which lets several
+    fetch loops share one limit.
+    '''
+
+    if(isinstance(rate_limit, HostRateLimiter)):
+        return rate_limit
+
+    return HostRateLimiter(rate_limit)
+
+async def iterUrls(page_urls):
+    '''
+    Asynchronous generator over page_urls, which
+    can be either a plain iterable of URLs or
+    an asynchronous one.
+    '''
+
+    if(hasattr(page_urls, '__aiter__')):
+        async for page_url in page_urls:
+            yield page_url
+    else:
+        for page_url in page_urls:
+            yield page_url
+
+async def iterPages(page_urls, concurrency=DEFAULT_CONCURRENCY,
+                    rate_limit=DEFAULT_RATE_LIMIT, timings=None, cache=None,
+                    timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                    transport=None, stop_marker=None):
+    '''
+    Asynchronous generator that fetches every
+    URL in page_urls and yields a tuple of
+    (index, url, html, fetched_at) for each
+    page as soon as it arrives (see
+    fetchTimedPage()), so pages come back in
+    completion order rather than list order.
+    If a page
+    could not be fetched, the exception is
+    yielded in place of the HTML.
+
+    page_urls can also be an asynchronous
+    iterable, in which case each page is
+    fetched as soon as its URL comes in.  The
+    rate limit can be a number or a shared
+    HostRateLimiter.  At most concurrency
+    requests are in flight, fewer while the
+    server is struggling, and each one is given
+    timeout seconds.  The optional timings and
+    cache objects, the number of retries and
+    the stop_marker are passed on to
+    fetchPage().  Pages are requested through
+    transport, which can be a Transport shared
+    with other fetch loops (a new one with the
+    default settings otherwise).
+    '''
+
+    limiter = AdaptiveConcurrency(concurrency)
+    rate_limiter = rateLimiter(rate_limit)
+    transport = transport or Transport()
+
+    async with transport.session(concurrency, timeout, timings) as session:
+
+        finished = asyncio.Queue()  # (index, url, html, fetched_at) of
+                                    # finished pages
+        tasks = set()               # Fetches that haven't finished yet
+
+        # Only start a few more fetches than can be in flight at once (the
+        # rest of them wait for the limiter or sleep between retries), so
+        # that a long list of URLs isn't turned into a task per page all
+        # at once.  A page holds its place until it has been handed on,
+        # so pages that come in faster than the caller takes them don't
+        # pile up in memory either.
+        started = asyncio.Semaphore(2 * concurrency)
+
+        async def fetchIndexed(i, page_url):
+            try:
+                page_html, fetched_at = await fetchTimedPage(
+                    session, page_url, limiter, rate_limiter, timings, cache,
+                    retries, stop_marker)
+            except Exception as error:
+                page_html, fetched_at = error, None
+            finished.put_nowait((i, page_url, page_html, fetched_at))
+
+        def handOn(finished_page):
+            started.release()
+            return finished_page
+
+        async def schedule():
+            # Start fetching each page as soon as its URL is known and
+            # there is room.  Returns the number of pages once every URL
+            # has been read.
+            count = 0
+            async for page_url in iterUrls(page_urls):
+                await started.acquire()
+                task = asyncio.ensure_future(fetchIndexed(count, page_url))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                count += 1
+            return count
+
+        scheduler = asyncio.ensure_future(schedule())
+        yielded = 0
+
+        try:
+            while(not scheduler.done() or yielded < scheduler.result()):
+                if(scheduler.done()):
+                    yield handOn(await finished.get())
+                    yielded += 1
+                    continue
+
+                # Wait for the next page, but wake up when the last URL has
+                # been read too so the loop knows how many pages to expect.
+                next_page = asyncio.ensure_future(finished.get())
+                await asyncio.wait([next_page, scheduler],
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if(not next_page.done()):
+                    next_page.cancel()
+                    continue
+
+                yield handOn(next_page.result())
+                yielded += 1
+        finally:
+            # Don't leave requests running if the caller stops early.
+            scheduler.cancel()
+            for task in list(tasks):
+                task.cancel()
+
+def fetchPages(page_urls, concurrency=DEFAULT_CONCURRENCY,
+               rate_limit=DEFAULT_RATE_LIMIT, cache=None, timings=None,
+               transport=None, stop_marker=None):
+    '''
+    Blocking wrapper around iterPages().  Returns
+    a list with the HTML of each page in the same
+    order as page_urls (or the exception raised
+    for pages that failed).
+    '''
+
+    async def collect():
+        pages = [None] * len(page_urls)
+        async for i, page_url, page_html, fetched_at in iterPages(
+                page_urls, concurrency, rate_limit, timings, cache,
+                transport=transport, stop_marker=stop_marker):
+            pages[i] = page_html
+        return pages
+
+    return asyncio.run(collect())
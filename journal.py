@@ -0,0 +1,190 @@
+# Job journal for resumable scrape runs.
+#
+# The journal is an append-only JSON-lines file recording the kind of run
+# that began it, the movie pages the run intends to scrape as they are found, a marker once every page has
+# been found and, as each page is finished, either its movie record or the
+# reason it failed.  If the scraper is interrupted it
+# can read the journal back, skip every page that was already scraped and
+# pick up with only the pages that failed or were never reached.
+#
+# The movie records themselves are only kept in the file, not in memory:
+# once the run is over they are streamed back out of it into the dataset,
+# so a scrape of any size needs about as much memory as a small one.
+
+import json
+import os
+
+from records import recordFromDict, recordToDict
+
+DEFAULT_JOURNAL_PATH = 'scrape_journal.jsonl'
+
+class ScrapeJournal:
+    '''
+    Append-only record of a scrape run.  Any
+    entries already in the file at path are
+    loaded when the journal is opened, with
+    the latest entry for a URL taking effect.
+    '''
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        self.path = path
+
+        self.queued = []     # Movie URLs in the order they were collected
+        self.queued_set = set()  # The same URLs, for quick lookups
+        self.completed = {}  # URL -> line of its latest 'done' entry
+        self.failed = {}     # URL -> description of the last error
+        self.collected = False  # Whether every page to scrape is queued
+        self.mode = None     # Kind of run that began the journal
+        self.lines = 0       # Number of lines in the file
+
+        if(os.path.exists(path)):
+            self.load()
+
+        self.journal_file = open(path, 'a', encoding='utf-8')
+
+        # Finish off a partial last line, so the next entry starts a line
+        # of its own.
+        if(self.journal_file.tell() > 0):
+            with open(path, 'rb') as journal_file:
+                journal_file.seek(-1, os.SEEK_END)
+                if(journal_file.read(1) != b'\n'):
+                    self.journal_file.write('\n')
+                    self.journal_file.flush()
+
+    def load(self):
+        with open(self.path, encoding='utf-8') as journal_file:
+            for line_number, line in enumerate(journal_file):
+                self.lines = line_number + 1
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A run killed mid-write can leave a partial last line.
+                    continue
+
+                if(entry['status'] == 'started'):
+                    self.mode = entry['mode']
+                    continue
+
+                if(entry['status'] == 'collected'):
+                    self.collected = True
+                    continue
+
+                movie_url = entry['url']
+
+                if(entry['status'] == 'queued' and
+                   movie_url not in self.queued_set):
+                    self.queued_set.add(movie_url)
+                    self.queued.append(movie_url)
+
+                elif(entry['status'] == 'done'):
+                    self.completed[movie_url] = line_number
+                    self.failed.pop(movie_url, None)
+
+                elif(entry['status'] == 'failed'):
+                    self.failed[movie_url] = entry['error']
+
+    def write(self, entry):
+        # Flush after every entry so that nothing finished is lost if the
+        # run is interrupted.
+        self.journal_file.write(json.dumps(entry) + '\n')
+        self.journal_file.flush()
+        self.lines += 1
+
+    def recordStarted(self, mode):
+        '''
+        Record the kind of run ('full',
+        'incremental' or 'refresh') the journal is
+        for, since that decides how its movies are
+        saved.
+        '''
+
+        self.mode = mode
+        self.write({'status': 'started', 'mode': mode})
+
+    def recordQueued(self, movie_link_list):
+        '''
+        Record pages this run is going to scrape.
+        Pages that are already queued are skipped,
+        so the same list can be queued again when
+        a run is resumed.
+        '''
+
+        for movie_url in movie_link_list:
+            if(movie_url not in self.queued_set):
+                self.queued_set.add(movie_url)
+                self.queued.append(movie_url)
+                self.write({'url': movie_url, 'status': 'queued'})
+
+    def recordCollected(self):
+        '''
+        Record that every page this run is going
+        to scrape has been queued, so a resumed
+        run doesn't need to look for more.
+        '''
+
+        self.collected = True
+        self.write({'status': 'collected'})
+
+    def recordDone(self, movie_url, movie_record):
+        self.completed[movie_url] = self.lines
+        self.failed.pop(movie_url, None)
+        self.write({'url': movie_url, 'status': 'done',
+                    'record': recordToDict(movie_record)})
+
+    def recordFailed(self, movie_url, error, kind=None):
+        self.failed[movie_url] = repr(error)
+        self.write({'url': movie_url, 'status': 'failed', 'kind': kind,
+                    'error': repr(error)})
+
+    def pending(self):
+        '''
+        Return the queued pages that haven't been
+        scraped successfully yet, in their original
+        order.  This includes pages that failed.
+        '''
+
+        return [movie_url for movie_url in self.queued
+                if movie_url not in self.completed]
+
+    def iterRecords(self):
+        '''
+        Generator that reads the MovieRecord of
+        every scraped page back from the file, in
+        the order the pages were finished, one at
+        a time.
+        '''
+
+        self.journal_file.flush()
+
+        with open(self.path, encoding='utf-8') as journal_file:
+            for line_number, line in enumerate(journal_file):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+
+                # Only the latest 'done' entry for a page counts, and its
+                # line number is all that is kept in memory.
+                if(entry['status'] == 'done' and
+                   self.completed.get(entry['url']) == line_number):
+                    yield recordFromDict(entry['record'])
+
+    def reset(self):
+        '''
+        Throw away everything recorded so far and
+        start a new journal.
+        '''
+
+        self.journal_file.close()
+        self.journal_file = open(self.path, 'w', encoding='utf-8')
+
+        self.queued = []
+        self.queued_set = set()
+        self.completed = {}
+        self.failed = {}
+        self.collected = False
+        self.mode = None
+        self.lines = 0
+
+    def close(self):
+        self.journal_file.close()
@@ -0,0 +1,241 @@
+# Run metrics and profiling hooks for the IMDb scraper and analysis.
+#
+# A Metrics object collects how long every page spent in each stage of a
+# run (DNS, connecting, waiting for the server, transferring the body,
+# building the HTML tree, each extractor, ...) along with counters such
+# as the number of pages and bytes transferred.  At the end of a run it
+# can print a table of latency percentiles per stage or write the same
+# numbers out as JSON.
+#
+# The optional profilers wrap a whole run: cProfile is always available,
+# and pyinstrument is used if it is installed.
+
+import contextlib
+import cProfile
+import importlib.util
+import io
+import json
+import math
+import pstats
+import random
+import time
+
+DEFAULT_PROFILE_OUTPUT = 'profile'  # File name (without extension) for
+                                    # profiler output.
+MAX_SAMPLES = 10000                 # Samples kept per stage for working out
+                                    # percentiles.
+
+def percentile(sorted_samples, fraction):
+    '''
+    Return the value below which the given
+    fraction of the samples fall (nearest-rank
+    method).  The samples must be sorted.
+    '''
+
+    if(not sorted_samples):
+        return 0.0
+
+    rank = max(1, math.ceil(fraction * len(sorted_samples)))
+    return sorted_samples[rank - 1]
+
+class Metrics:
+    '''
+    Per-stage timings and counters for a run.
+    Every call to add() records one sample of
+    a stage, so percentiles can be worked out
+    for each stage at the end.  Past
+    MAX_SAMPLES samples of a stage, a random
+    subset of that many is kept for the
+    percentiles (so memory use stays the same
+    however long the run), while the count,
+    total and maximum stay exact.
+    '''
+
+    def __init__(self):
+        self.samples = {}   # Stage name -> list of seconds
+        self.totals = {}    # Stage name -> [count, total seconds, maximum]
+        self.counters = {}  # Counter name -> total
+        self.start = time.perf_counter()
+        self.random = random.Random(0)
+
+    def add(self, stage, seconds):
+        if(stage not in self.totals):
+            self.samples[stage] = []
+            self.totals[stage] = [0, 0.0, 0.0]
+
+        totals = self.totals[stage]
+        totals[0] += 1
+        totals[1] += seconds
+        totals[2] = max(totals[2], seconds)
+
+        # Reservoir sampling: every sample so far has the same chance of
+        # being among the ones kept.
+        samples = self.samples[stage]
+        if(len(samples) < MAX_SAMPLES):
+            samples.append(seconds)
+        else:
+            slot = self.random.randrange(totals[0])
+            if(slot < MAX_SAMPLES):
+                samples[slot] = seconds
+
+    def addAll(self, stage_seconds):
+        '''
+        Record one sample for each stage in a
+        dictionary of stage name -> seconds.
+        '''
+
+        for stage, seconds in stage_seconds.items():
+            self.add(stage, seconds)
+
+    def count(self, counter, amount=1):
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    @contextlib.contextmanager
+    def timed(self, stage):
+        '''
+        Context manager that records how long its
+        block took as one sample of stage.
+        '''
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def stageSummary(self, stage):
+        samples = sorted(self.samples[stage])
+        count, total, maximum = self.totals[stage]
+
+        return {
+            'count': count,
+            'total_seconds': total,
+            'mean_ms': 1000 * total / count,
+            'p50_ms': 1000 * percentile(samples, 0.50),
+            'p95_ms': 1000 * percentile(samples, 0.95),
+            'p99_ms': 1000 * percentile(samples, 0.99),
+            'max_ms': 1000 * maximum,
+        }
+
+    def summary(self):
+        '''
+        Return every stage and counter as a
+        dictionary ready to be written as JSON,
+        including the pages per second over the
+        whole run if pages were counted.
+        '''
+
+        elapsed = self.elapsed()
+
+        return {
+            'elapsed_seconds': elapsed,
+            'pages_per_second': self.counters.get('pages', 0) / elapsed,
+            'counters': dict(self.counters),
+            'stages': {stage: self.stageSummary(stage)
+                       for stage in self.samples},
+        }
+
+    def report(self):
+        '''
+        Return a printable table of the time spent
+        in each stage, with its percentiles, and
+        the counters.
+        '''
+
+        lines = ['{:<28} {:>7} {:>10} {:>9} {:>9} {:>9}'\
+                 .format('stage', 'count', 'seconds', 'p50 ms', 'p95 ms',
+                         'p99 ms')]
+
+        for stage in self.samples:
+            stage_summary = self.stageSummary(stage)
+            lines.append('{:<28} {:>7} {:>10.2f} {:>9.2f} {:>9.2f} {:>9.2f}'\
+                         .format(stage, stage_summary['count'],
+                                 stage_summary['total_seconds'],
+                                 stage_summary['p50_ms'],
+                                 stage_summary['p95_ms'],
+                                 stage_summary['p99_ms']))
+
+        for counter, total in self.counters.items():
+            lines.append('{:<28} {:>7}'.format(counter, total))
+
+        return '\n'.join(lines)
+
+    def writeJson(self, path):
+        with open(path, 'w', encoding='utf-8') as json_file:
+            json.dump(self.summary(), json_file, indent=2)
+
+def availableProfilers():
+    '''
+    Return the names of the profilers that can
+    be used on this machine.
+    '''
+
+    # Only check whether pyinstrument is installed; it is imported when a
+    # profile is actually started.
+    profilers = ['cprofile']
+    if(importlib.util.find_spec('pyinstrument') is not None):
+        profilers.append('pyinstrument')
+    return profilers
+
+class Profiler:
+    '''
+    Profile everything between start() and
+    stop() (or the body of a with block) with
+    the named profiler, or do nothing if
+    profiler is None.  On stop the results are
+    saved next to output (output.prof for
+    cProfile, output.html for pyinstrument)
+    and a short summary is printed.
+    '''
+
+    def __init__(self, profiler=None, output=DEFAULT_PROFILE_OUTPUT):
+        if(profiler is not None and profiler not in availableProfilers()):
+            raise ValueError('The {} profiler is not installed.'\
+                             .format(profiler))
+
+        self.profiler = profiler
+        self.output = output
+        self.session = None
+
+    def start(self):
+        if(self.profiler == 'cprofile'):
+            self.session = cProfile.Profile()
+            self.session.enable()
+        elif(self.profiler == 'pyinstrument'):
+            import pyinstrument
+            self.session = pyinstrument.Profiler(async_mode='enabled')
+            self.session.start()
+        return self
+
+    def stop(self):
+        if(self.session is None):
+            return
+
+        if(self.profiler == 'cprofile'):
+            self.session.disable()
+            self.session.dump_stats(self.output + '.prof')
+
+            summary = io.StringIO()
+            pstats.Stats(self.session, stream=summary)\
+                  .sort_stats('cumulative').print_stats(20)
+            print(summary.getvalue())
+            print('Saved profile as \'{}.prof\'.'.format(self.output))
+
+        else:
+            self.session.stop()
+            with open(self.output + '.html', 'w', encoding='utf-8') as html_file:
+                html_file.write(self.session.output_html())
+
+            print(self.session.output_text(unicode=True, color=False))
+            print('Saved profile as \'{}.html\'.'.format(self.output))
+
+        self.session = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,231 @@
+# Model evaluation harness for the IMDb analysis.
+#
+# analysis.py fits a single linear regression.  This module compares a grid
+# of candidate models (ridge and lasso regressions, a regression on the log
+# of the earnings, gradient boosting, ...) over several sets of features by
+# cross validation, and prints the combinations ranked by their mean r^2.
+#
+# Every fold of every combination is an independent fit, so the folds are
+# run in parallel with joblib, and each fitted fold is cached on disk: a
+# fold is only fitted again if its model, features or data have changed,
+# so adding a model to the grid only costs the folds of the new model.
+
+import argparse
+import time
+
+import features
+import metrics
+import records
+
+DEFAULT_CACHE_DIR = '.model_cache'  # Where fitted folds are kept.
+DEFAULT_FOLDS = 5                   # Number of cross validation folds.
+DEFAULT_JOBS = -1                   # Number of processes fitting folds
+                                    # (-1 uses one per CPU).
+RANDOM_STATE = 10                   # Seed for the fold split and models.
+
+# Names of the candidate models (see makeModel()).
+MODELS = ['linear', 'ridge', 'lasso', 'log-linear', 'gradient-boosting']
+
+# Feature set name -> features (see features.FEATURES).
+FEATURE_SETS = {
+    'budget': ['budget'],
+    'budget+runtime': ['budget', 'runtime'],
+    'budget+rating': ['budget', 'mpaa_rating'],
+    'all': features.FEATURE_LIST,
+    'log+season': ['log_budget', 'runtime', 'year', 'season', 'mpaa_rating'],
+}
+
+def makeModel(name):
+    '''
+    Return a new, unfitted estimator for one of
+    the model names in MODELS.
+    '''
+
+    import numpy as np
+    from sklearn.compose import TransformedTargetRegressor
+    from sklearn.ensemble import GradientBoostingRegressor
+    from sklearn.linear_model import Lasso, LinearRegression, Ridge
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    if(name == 'linear'):
+        return LinearRegression()
+    if(name == 'ridge'):
+        return make_pipeline(StandardScaler(), Ridge(alpha=1.0))
+    if(name == 'lasso'):
+        return make_pipeline(StandardScaler(),
+                             Lasso(alpha=1.0, max_iter=10000))
+    if(name == 'log-linear'):
+        # Earnings are heavily skewed, so fit the regression on their log
+        # and transform the predictions back into dollars.
+        return TransformedTargetRegressor(LinearRegression(),
+                                          func=np.log1p, inverse_func=np.expm1)
+    if(name == 'gradient-boosting'):
+        return GradientBoostingRegressor(random_state=RANDOM_STATE)
+
+    raise ValueError('Unknown model {!r}.'.format(name))
+
+def fitFold(model_name, X, y, train_index, test_index, sklearn_version):
+    '''
+    Fit a model on one training fold and score
+    it on the matching test fold.  Returns a
+    tuple of the fitted model, its r^2 and
+    root mean squared error on the test fold
+    and how long the fit took.  The sklearn
+    version is only passed in so that the disk
+    cache is not reused across versions.
+    '''
+
+    import numpy as np
+    from sklearn.metrics import mean_squared_error, r2_score
+
+    model = makeModel(model_name)
+
+    start = time.perf_counter()
+    model.fit(X[train_index], y[train_index])
+    fit_seconds = time.perf_counter() - start
+
+    predicted = model.predict(X[test_index])
+    r_squared = r2_score(y[test_index], predicted)
+    rmse = np.sqrt(mean_squared_error(y[test_index], predicted))
+
+    return model, r_squared, rmse, fit_seconds
+
+def evaluateModels(df, models=MODELS, feature_sets=FEATURE_SETS,
+                   folds=DEFAULT_FOLDS, n_jobs=DEFAULT_JOBS,
+                   cache_dir=DEFAULT_CACHE_DIR, timings=None):
+    '''
+    Cross validate every model in models on
+    every feature set in feature_sets (a dict of
+    name -> features), fitting the folds in
+    n_jobs parallel processes and caching the
+    fitted folds in cache_dir (None disables
+    the cache).  Returns one dictionary of
+    results per combination, best mean r^2
+    first.
+    '''
+
+    import numpy as np
+    import sklearn
+    from joblib import Memory, Parallel, delayed
+    from sklearn.model_selection import KFold
+
+    timings = timings or metrics.Metrics()
+
+    fit = Memory(cache_dir, verbose=0).cache(fitFold)
+
+    y = features.targetVector(df)
+    splits = list(KFold(folds, shuffle=True,
+                        random_state=RANDOM_STATE).split(y))
+
+    # One job per fold of every combination, so the pool stays busy even
+    # when one model is much slower to fit than the others.
+    combinations = []
+    jobs = []
+    for feature_set, feature_list in feature_sets.items():
+        X = features.featureMatrix(df, feature_list)
+        for model_name in models:
+            combinations.append((model_name, feature_set))
+            jobs.extend(delayed(fit)(model_name, X, y, train_index,
+                                     test_index, sklearn.__version__)
+                        for train_index, test_index in splits)
+
+    with timings.timed('evaluate'):
+        fold_results = Parallel(n_jobs=n_jobs)(jobs)
+
+    results = []
+    for i, (model_name, feature_set) in enumerate(combinations):
+        scores = fold_results[i * folds:(i + 1) * folds]
+        r_squared = np.array([score[1] for score in scores])
+
+        for score in scores:
+            timings.add('fit.{}'.format(model_name), score[3])
+
+        results.append({
+            'model': model_name,
+            'features': feature_set,
+            'r2_mean': r_squared.mean(),
+            'r2_std': r_squared.std(),
+            'rmse_mean': np.mean([score[2] for score in scores]),
+            'fit_seconds': sum(score[3] for score in scores),
+        })
+
+    return sorted(results, key=lambda result: result['r2_mean'], reverse=True)
+
+def resultsTable(results):
+    '''
+    Return a printable table of the results of
+    evaluateModels(), one row per combination.
+    '''
+
+    lines = ['{:>4} {:<18} {:<15} {:>8} {:>8} {:>14} {:>9}'\
+             .format('rank', 'model', 'features', 'r2 mean', 'r2 std',
+                     'rmse mean', 'fit secs')]
+
+    for rank, result in enumerate(results, 1):
+        lines.append('{:>4} {:<18} {:<15} {:>8.3f} {:>8.3f} {:>14,.0f} {:>9.2f}'\
+                     .format(rank, result['model'], result['features'],
+                             result['r2_mean'], result['r2_std'],
+                             result['rmse_mean'], result['fit_seconds']))
+
+    return '\n'.join(lines)
+
+def addArguments(arg_parser):
+    '''
+    Add the command line options of the model
+    evaluation to an argparse parser.
+    '''
+
+    arg_parser.add_argument('--dataset', default=records.DEFAULT_DATASET_PATH,
+                            help='movie dataset created by scraper.py')
+    arg_parser.add_argument('--models', nargs='+', choices=MODELS,
+                            default=MODELS, help='models to evaluate')
+    arg_parser.add_argument('--features', nargs='+', choices=FEATURE_SETS,
+                            default=list(FEATURE_SETS),
+                            help='feature sets to evaluate each model on')
+    arg_parser.add_argument('--folds', type=int, default=DEFAULT_FOLDS,
+                            help='number of cross validation folds')
+    arg_parser.add_argument('--jobs', type=int, default=DEFAULT_JOBS,
+                            help='number of processes fitting folds '
+                                 '(-1 uses one per CPU)')
+    arg_parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                            help='directory fitted folds are cached in')
+    arg_parser.add_argument('--no-cache', action='store_true',
+                            help='fit every fold, without caching it')
+    arg_parser.add_argument('--timings', action='store_true',
+                            help='print how long each stage of the '
+                                 'evaluation took')
+
+def run(args):
+    '''
+    Run the model evaluation with the options
+    parsed from the command line.
+    '''
+
+    timings = metrics.Metrics()
+
+    with timings.timed('load'):
+        df = records.loadMovies(args.dataset)
+
+    results = evaluateModels(df, args.models,
+                             {name: FEATURE_SETS[name]
+                              for name in args.features},
+                             args.folds, args.jobs,
+                             None if args.no_cache else args.cache_dir,
+                             timings)
+
+    print(resultsTable(results))
+
+    if(args.timings):
+        print(timings.report())
+
+def main(argv=None, prog=None):
+    arg_parser = argparse.ArgumentParser(prog=prog,
+                                         description='Compare models of the '
+                                                     'scraped movie data by '
+                                                     'cross validation.')
+    addArguments(arg_parser)
+    run(arg_parser.parse_args(argv))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# Normalization of the text scraped from IMDb movie pages.
+#
+# Each feature on a movie page comes out of the HTML as a string like
+# 'Budget:$220,000,000 (estimated)' or '4 May 2012 (USA)', which has to be
+# boiled down to a number or a name.  The functions here do that with
+# patterns compiled once, when the module is imported, and make a single
+# pass over each string instead of a chain of substitutions that each
+# build a new copy of it.
+
+import re
+
+# A dollar amount: a '$' followed by digits with optional thousands
+# separators, e.g. '$1,518,812,988'.
+DOLLAR_PATTERN = re.compile(r'\$\s*([0-9][0-9,]*)')
+
+# Everything that isn't a digit.
+NON_DIGIT_PATTERN = re.compile(r'[^0-9]+')
+
+# The IMDb title ID in the path of a movie page, e.g. '/title/tt0848228/'.
+TITLE_ID_PATTERN = re.compile(r'/title/(tt[0-9]+)')
+
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June',
+               'July', 'August', 'September', 'October', 'November',
+               'December']
+
+# Any month name, spelled as a whole word the way IMDb writes it, found
+# with a single scan of the string.
+MONTH_PATTERN = re.compile(r'\b(?:' + '|'.join(MONTH_NAMES) + r')\b')
+
+def parseDollars(text):
+    '''
+    Return the first dollar amount in text as
+    an integer, ignoring thousands separators
+    and anything around the amount.  Raises
+    ValueError if there is no dollar amount.
+    '''
+
+    match = DOLLAR_PATTERN.search(text)
+    if(match is None):
+        raise ValueError('No dollar amount in {!r}.'.format(text))
+
+    return int(match.group(1).replace(',', ''))
+
+def parseDigits(text):
+    '''
+    Strip every non-numeric character out of
+    text and return what remains as an integer.
+    '''
+
+    return int(NON_DIGIT_PATTERN.sub('', text))
+
+def parseTitleId(movie_url):
+    '''
+    Return the IMDb title ID from the URL of a
+    movie page, or None if the URL doesn't
+    contain one.
+    '''
+
+    match = TITLE_ID_PATTERN.search(movie_url)
+    if(match is None):
+        return None
+
+    return match.group(1)
+
+def parseTitle(title):
+    '''
+    Strip the whitespace from around the title.
+    '''
+
+    return title.strip()
+
+def parseMPAArating(rating_text):
+    '''
+    Strip the text of the title block down to
+    the MPAA rating, which is everything before
+    the first pipe.
+    '''
+
+    return rating_text.partition('|')[0].replace('\n', '').strip()
+
+def parseReleaseMonth(release_date):
+    '''
+    Return the name of the month that appears
+    in the release date string, or None if no
+    month can be found.
+    '''
+
+    match = MONTH_PATTERN.search(release_date)
+    if(match is None):
+        return None
+
+    return match.group()
+
+def parseUserRating(user_rating):
+    '''
+    Convert the 'X.X/10' user rating string to
+    a float.
+    '''
+
+    return float(user_rating.partition('/')[0])
+
+# The budget and opening weekend lines both hold a single dollar amount
+# (followed by '(estimated)' or the date of the weekend), while the year,
+# runtime and gross lines are read by keeping only their digits.
+parseBudget = parseDollars
+parseOpeningWeekendGross = parseDollars
+parseYear = parseDigits
+parseRuntime = parseDigits
+parseGross = parseDigits
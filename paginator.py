@@ -0,0 +1,115 @@
+# Streaming list-page paginator for the IMDb scraper.
+#
+# The movies to scrape come from IMDb's search results for each year,
+# sorted by box office revenue and split into pages of 50.  Rather than
+# guessing the URLs of those pages, the paginator starts from the first
+# page of each year and follows its "Next" link until it has found the
+# top N movies of the year (or the results run out).  Movie page URLs are
+# yielded as soon as each list page has been parsed, so that the movie
+# pages can be fetched while the rest of the list is still being read.
+
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+import fetcher
+
+DEFAULT_TOP_N = 100  # Number of movies collected for each year.
+
+base_url = 'https://www.imdb.com'
+
+# The first page of the highest-grossing films released in a given year,
+# relative to the site's base URL.
+list_path_template = '/search/title/?title_type=feature&year={0}-01-01,{0}-12-31&sort=boxoffice_gross_us,desc'
+
+def yearListUrl(year, site_url=base_url):
+    return site_url + list_path_template.format(year)
+
+def parseListPage(list_html, page_url=base_url):
+    '''
+    Return a tuple of (movie_links, next_url)
+    for a page of search results: the full URLs
+    of the movie pages listed on it, in rank
+    order, and the URL of the next page, which
+    is None on the last page.
+    '''
+
+    page_soup = BeautifulSoup(list_html, 'html.parser')
+
+    # Each listing has a rank followed by a link to the movie's page.
+    movie_links = []
+    for index_tag in page_soup.find_all('span', class_='lister-item-index'):
+        link_tag = index_tag.find_next_sibling('a')
+        if(link_tag is not None and link_tag.get('href')):
+            movie_links.append(urljoin(page_url, link_tag['href']))
+
+    next_tag = page_soup.find('a', class_='lister-page-next')
+    next_url = urljoin(page_url, next_tag['href']) \
+               if next_tag is not None and next_tag.get('href') else None
+
+    return movie_links, next_url
+
+async def iterMovieLinks(years, top_n=DEFAULT_TOP_N,
+                         concurrency=fetcher.DEFAULT_CONCURRENCY,
+                         rate_limit=fetcher.DEFAULT_RATE_LIMIT, timings=None,
+                         cache=None, timeout=fetcher.DEFAULT_TIMEOUT,
+                         retries=fetcher.DEFAULT_RETRIES, list_url=yearListUrl,
+                         transport=None):
+    '''
+    Asynchronous generator that yields the URLs
+    of the top_n highest-grossing movies of each
+    year in years, year by year, following each
+    year's "Next" links as far as needed.  A
+    list page that can't be fetched ends that
+    year early (after the fetch engine's own
+    retries); the error is printed and the
+    paginator moves on.  list_url maps a year to
+    the URL of its first page.  The remaining
+    arguments are passed on to the fetch engine,
+    and rate_limit and transport can be a
+    HostRateLimiter and a Transport shared with
+    the movie page fetches.
+    '''
+
+    limiter = fetcher.AdaptiveConcurrency(concurrency)
+    rate_limiter = fetcher.rateLimiter(rate_limit)
+
+    # The list pages are read one at a time, since each one is needed to
+    # find the next.  That is plenty to stay ahead of the movie pages,
+    # 50 of which are found with every list page.
+    transport = transport or fetcher.Transport()
+
+    async with transport.session(concurrency, timeout, timings) as session:
+        for year in years:
+            seen = set()
+            page_url = list_url(year)
+
+            while(page_url is not None and len(seen) < top_n):
+                try:
+                    list_html = await fetcher.fetchPage(session, page_url,
+                                                        limiter, rate_limiter,
+                                                        timings, cache, retries)
+                except Exception as error:
+                    # Verbose output
+                    print('Failed to collect URLs for {} from {}: {!r}'\
+                          .format(year, page_url, error))
+                    break
+
+                movie_links, page_url = parseListPage(list_html, page_url)
+
+                # Results can shift between pages while we read them, so the
+                # same movie may turn up twice.
+                new_links = [movie_link for movie_link in dict.fromkeys(movie_links)
+                             if movie_link not in seen]
+
+                # A page with nothing new means the "Next" links have gone
+                # round in a circle, so don't follow them any further.
+                if(not new_links):
+                    break
+
+                for movie_link in new_links[:top_n - len(seen)]:
+                    seen.add(movie_link)
+                    yield movie_link
+
+            # Verbose output
+            print('Collected {} movie URLs for {}.'.format(len(seen), year))
@@ -0,0 +1,194 @@
+# Fetch/parse pipeline for the IMDb scraper.
+#
+# Turning a movie page into a movie record is CPU-bound work, while
+# fetching pages is almost entirely waiting on the network.  This module
+# runs the two stages side by side: the fetch engine keeps downloading
+# pages while the raw HTML of each finished page is handed to a pool of
+# parser worker processes, and the parsed results are streamed back to the
+# caller in the same order as the list of URLs.
+
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import fetcher
+from extractors import STOP_MARKER, parseMovieData
+from metrics import Metrics
+
+DEFAULT_WORKERS = 0  # Number of parser processes (0 parses in the main
+                     # process, between fetches).
+
+def failureKind(error):
+    '''
+    Classify an exception yielded in place of a
+    movie record as 'network' if the page could
+    not be fetched or 'parse' if it was fetched
+    but could not be turned into a record.
+    '''
+
+    if(isinstance(error, fetcher.NETWORK_ERRORS)):
+        return 'network'
+
+    return 'parse'
+
+def timedParse(movie_html, parser=None):
+    '''
+    Parse a movie page and time how long it
+    took, in total ('parse') and in each step
+    of the extractor engine.  Runs inside the
+    worker processes, so any exception is
+    returned rather than raised in order to
+    reach the main process alongside the
+    timings.  Returns a tuple of the record and
+    a dictionary of stage name -> seconds.
+    '''
+
+    stage_seconds = {}
+
+    start = time.perf_counter()
+
+    try:
+        movie_record = parseMovieData(movie_html, parser, stage_seconds)
+    except Exception as error:
+        movie_record = error
+
+    stage_seconds['parse'] = time.perf_counter() - start
+
+    return movie_record, stage_seconds
+
+async def iterMovieData(movie_links, concurrency=fetcher.DEFAULT_CONCURRENCY,
+                        rate_limit=fetcher.DEFAULT_RATE_LIMIT,
+                        workers=DEFAULT_WORKERS, timings=None, cache=None,
+                        parser=None, timeout=fetcher.DEFAULT_TIMEOUT,
+                        retries=fetcher.DEFAULT_RETRIES, transport=None,
+                        stop_early=False):
+    '''
+    Asynchronous generator that fetches and
+    parses every page in movie_links and yields
+    (index, url, movie_record) in the order the
+    URLs were given, each record with the time
+    its page was fetched.  movie_links can be a list
+    or an asynchronous iterable that is still
+    discovering URLs, in which case fetching
+    starts with the first URL.  If a page could
+    not be fetched or parsed, the exception is
+    yielded in place of the record (see
+    failureKind()).  When a Metrics object is
+    passed in, the time spent in each stage of
+    fetching and parsing is added to it.  Pages are looked
+    up in the optional ResponseCache before
+    being fetched, and parsed with the named
+    HTML parser (the fastest one installed by
+    default).  The timeout, retries and
+    transport are passed on to the fetch
+    engine.  With stop_early, each page is only
+    downloaded as far as the extractors need.
+    '''
+
+    loop = asyncio.get_running_loop()
+
+    stop_marker = STOP_MARKER if stop_early else None
+
+    if(timings is None):
+        timings = Metrics()
+
+    # One future per URL, resolved once that page has been parsed, and
+    # queued up in the order the URLs arrived.  Waiting on them in that
+    # order is what puts the results back in order no matter which pages
+    # finish first.  None marks the end of the URLs.  A future is dropped
+    # once its result has been handed on, so finished records don't pile
+    # up in memory over a long run.
+    parsed = {}
+    in_order = asyncio.Queue()
+    fetch_times = {}  # Index -> time its page was fetched
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers else None
+
+    # Pages waiting for a worker hold on to their HTML, so only a couple
+    # per worker are handed over at a time and fetching waits for the
+    # rest.
+    parsing = asyncio.Semaphore(2 * workers) if workers else None
+
+    def resolve(i, movie_record, stage_seconds):
+        timings.addAll(stage_seconds)
+        if(not parsed[i].done()):
+            parsed[i].set_result(movie_record)
+
+    def resolveFromWorker(i, future):
+        parsing.release()
+        if(future.cancelled()):
+            return
+
+        # A worker that died outright (rather than failing to parse)
+        # still has to resolve its page so the output doesn't stall.
+        if(future.exception() is not None):
+            resolve(i, future.exception(), {})
+        else:
+            resolve(i, *future.result())
+
+    async def queueLinks():
+        i = 0
+        async for movie_url in fetcher.iterUrls(movie_links):
+            parsed[i] = loop.create_future()
+            in_order.put_nowait((i, movie_url))
+            i += 1
+            yield movie_url
+        in_order.put_nowait(None)
+
+    async def fetchStage():
+        async for i, movie_url, movie_html, fetched_at in fetcher.iterPages(
+                queueLinks(), concurrency, rate_limit, timings, cache,
+                timeout, retries, transport, stop_marker):
+            fetch_times[i] = fetched_at
+
+            if(isinstance(movie_html, Exception)):
+                parsed[i].set_result(movie_html)
+
+            elif(executor is None):
+                resolve(i, *timedParse(movie_html, parser))
+
+            else:
+                # Hand the page over to a worker and go straight back
+                # to fetching.
+                await parsing.acquire()
+                future = loop.run_in_executor(executor, timedParse, movie_html,
+                                              parser)
+                future.add_done_callback(
+                    lambda future, i=i: resolveFromWorker(i, future))
+
+    fetch_task = asyncio.ensure_future(fetchStage())
+
+    async def waitFor(awaitable):
+        # Surface a crash in the fetch stage rather than waiting forever
+        # on a page that will never arrive.
+        waiting = asyncio.ensure_future(awaitable)
+        await asyncio.wait([waiting, fetch_task],
+                           return_when=asyncio.FIRST_COMPLETED)
+        if(not waiting.done()):
+            # The fetch stage can finish while workers are still parsing,
+            # which is fine; only give up if it crashed.
+            if(fetch_task.exception() is not None):
+                waiting.cancel()
+            fetch_task.result()
+        return await waiting
+
+    try:
+        while(True):
+            next_link = await waitFor(in_order.get())
+            if(next_link is None):
+                break
+
+            i, movie_url = next_link
+            movie_record = await waitFor(parsed[i])
+            del parsed[i]
+
+            fetched_at = fetch_times.pop(i, None)
+            if(not isinstance(movie_record, Exception)):
+                movie_record.fetched_at = fetched_at
+
+            yield i, movie_url, movie_record
+
+    finally:
+        fetch_task.cancel()
+        if(executor is not None):
+            executor.shutdown(cancel_futures=True)
@@ -0,0 +1,181 @@
+# Figure rendering for the IMDb analysis.
+#
+# Every figure the analysis saves is described by a small spec (its file
+# name, the kind of plot and which movies it shows).  The figures are
+# rendered side by side in a pool of worker processes, since fitting the
+# bootstrapped confidence band of each regression plot is CPU-bound, and
+# each figure is closed as soon as it has been saved so a long run doesn't
+# hold on to all of them.
+#
+# A figure is only rendered again if something that goes into it has
+# changed: a hash of its slice of the dataset and of its plot parameters is
+# kept in a small JSON manifest next to the figures, and figures whose hash
+# matches (and whose file is still there) are skipped.
+
+import hashlib
+import json
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from metrics import Metrics
+
+DEFAULT_PLOT_DIR = '.'                    # Where figures are saved.
+DEFAULT_MANIFEST = 'plot_hashes.json'     # Hashes of the rendered figures,
+                                          # kept in the plot directory.
+DEFAULT_BOOTSTRAP = 1000                  # Bootstrap resamples for the
+                                          # confidence bands (seaborn's
+                                          # default; 0 draws no band).
+DEFAULT_WORKERS = None                    # Number of rendering processes
+                                          # (None uses one per CPU, 0
+                                          # renders in the main process).
+
+X_COLUMN = 'Budget'
+Y_COLUMN = 'Total Worldwide Gross Earnings'
+
+# A figure to render: the file it is saved as, 'scatter' or 'lmplot', and
+# the MPAA rating of the movies it shows (None for every movie).
+PlotSpec = namedtuple('PlotSpec', ['file_name', 'kind', 'rating'])
+
+PLOTS = [
+    PlotSpec('budget_worldwide_gross_scatterplot.png', 'scatter', None),
+    PlotSpec('budget_worldwide_gross_linreg.png', 'lmplot', None),
+    PlotSpec('earnings_g.png', 'lmplot', 'G'),
+    PlotSpec('earnings_pg.png', 'lmplot', 'PG'),
+    PlotSpec('earnings_pg13.png', 'lmplot', 'PG-13'),
+    PlotSpec('earnings_r.png', 'lmplot', 'R'),
+]
+
+def plotData(df, spec):
+    '''
+    Return the slice of the dataset a figure
+    shows: the budget and earnings columns of
+    the movies with its rating.
+    '''
+
+    if(spec.rating is not None):
+        df = df.loc[df['MPAA Rating'] == spec.rating]
+
+    return df[[X_COLUMN, Y_COLUMN]]
+
+def plotHash(data, spec, n_boot):
+    '''
+    Return a hash of everything that goes into
+    a figure: its data, its spec, the number of
+    bootstrap resamples and the seaborn version.
+    '''
+
+    import pandas as pd
+    from importlib.metadata import version
+
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(data, index=False).values.tobytes())
+    digest.update(json.dumps([list(spec), n_boot,
+                              version('seaborn')]).encode('utf-8'))
+    return digest.hexdigest()
+
+def renderPlot(data, spec, n_boot, path):
+    '''
+    Render a single figure and save it to path,
+    then close it.  Runs inside the worker
+    processes.  Returns how long it took.
+    '''
+
+    start = time.perf_counter()
+
+    # Render off-screen; the workers have no display to draw on.
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    if(spec.kind == 'scatter'):
+        figure = sns.scatterplot(x=X_COLUMN, y=Y_COLUMN, data=data).figure
+    else:
+        figure = sns.lmplot(x=X_COLUMN, y=Y_COLUMN, data=data, fit_reg=True,
+                            ci=95 if n_boot else None,
+                            n_boot=n_boot or 1).figure
+
+    figure.savefig(path)
+    plt.close(figure)
+
+    return time.perf_counter() - start
+
+def loadManifest(path):
+    try:
+        with open(path, encoding='utf-8') as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+
+def saveManifest(path, manifest):
+    with open(path, 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+
+def renderPlots(df, plots=PLOTS, plot_dir=DEFAULT_PLOT_DIR,
+                n_boot=DEFAULT_BOOTSTRAP, workers=DEFAULT_WORKERS,
+                force=False, timings=None):
+    '''
+    Render every figure in plots from the
+    dataset into plot_dir, skipping the ones
+    whose data and parameters haven't changed
+    since they were last rendered unless force
+    is True.  n_boot is the number of bootstrap
+    resamples behind each confidence band; a
+    small number makes quick draft figures.
+    Returns the file names that were rendered.
+    '''
+
+    timings = timings or Metrics()
+
+    os.makedirs(plot_dir, exist_ok=True)
+    manifest_path = os.path.join(plot_dir, DEFAULT_MANIFEST)
+    manifest = loadManifest(manifest_path)
+
+    stale = []
+    for spec in plots:
+        data = plotData(df, spec)
+        path = os.path.join(plot_dir, spec.file_name)
+        plot_hash = plotHash(data, spec, n_boot)
+
+        if(not force and manifest.get(spec.file_name) == plot_hash
+           and os.path.exists(path)):
+            timings.count('plots.skipped')
+
+            # Verbose output
+            print('\'{}\' is up to date.'.format(spec.file_name))
+            continue
+
+        stale.append((spec, data, path, plot_hash))
+
+    if(workers is None):
+        workers = min(len(stale), os.cpu_count() or 1)
+
+    def rendered(spec, path, plot_hash, seconds):
+        timings.add('plot', seconds)
+        timings.count('plots.rendered')
+        manifest[spec.file_name] = plot_hash
+
+        # Verbose output
+        print('Saved \'{}\'.'.format(path))
+
+    try:
+        if(workers and len(stale) > 1):
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [(spec, path, plot_hash,
+                            executor.submit(renderPlot, data, spec, n_boot, path))
+                           for spec, data, path, plot_hash in stale]
+                for spec, path, plot_hash, future in futures:
+                    rendered(spec, path, plot_hash, future.result())
+        else:
+            for spec, data, path, plot_hash in stale:
+                rendered(spec, path, plot_hash,
+                         renderPlot(data, spec, n_boot, path))
+
+    finally:
+        # Keep the hashes of whatever was rendered, even if a later figure
+        # failed.
+        saveManifest(manifest_path, manifest)
+
+    return [spec.file_name for spec, data, path, plot_hash in stale]
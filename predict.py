@@ -0,0 +1,451 @@
+# Box office predictions from a trained model.
+#
+# `analysis.py --save-model` saves the fitted regression, together with the
+# list of features it was fitted on and the names of the columns they were
+# expanded into, as a new version of a model artifact.
+# This module loads an artifact once and uses it to predict the worldwide
+# gross earnings of films that haven't been released, or of what-if
+# scenarios (the same film with a different budget or release month, say):
+#
+#     python predict.py candidates.csv --output predictions.csv
+#     python predict.py --serve --port 8080
+#
+# Files are scored in chunks, each chunk as a single vectorized call to
+# the model, so files far larger than memory can be scored.  The HTTP
+# endpoint collects the requests that arrive within a few milliseconds of
+# each other and scores them together for the same reason.
+
+import argparse
+import asyncio
+import glob
+import os
+import re
+import time
+
+import features
+import metrics
+from records import COLUMN_NAMES
+
+DEFAULT_ARTIFACT_DIR = 'model_artifacts'  # Where model versions are saved.
+ARTIFACT_FORMAT = 2                       # Bumped whenever the layout of an
+                                          # artifact changes.
+DEFAULT_CHUNK_SIZE = 100000               # Rows of a file scored at once.
+DEFAULT_PORT = 8080
+DEFAULT_MAX_BATCH = 1024                  # Most rows scored at once by the
+                                          # HTTP endpoint.
+DEFAULT_MAX_DELAY = 0.005                 # Seconds a request waits for
+                                          # others to batch with.
+
+PREDICTION_COLUMN = 'predicted_worldwide_gross'
+
+def artifactPaths(artifact_dir):
+    return sorted(glob.glob(os.path.join(artifact_dir, 'v*.joblib')))
+
+def artifactVersion(path):
+    return int(re.search(r'v(\d+)\.joblib$', path).group(1))
+
+def saveArtifact(model, feature_list, info=None,
+                 artifact_dir=DEFAULT_ARTIFACT_DIR):
+    '''
+    Save a fitted model, the features it was
+    fitted on and the columns of its feature
+    matrix as the next version in
+    artifact_dir (v0001.joblib, v0002.joblib,
+    ...), along with any extra information such
+    as its scores.  Returns the path it was
+    saved to.
+    '''
+
+    import joblib
+    import sklearn
+
+    os.makedirs(artifact_dir, exist_ok=True)
+
+    paths = artifactPaths(artifact_dir)
+    version = artifactVersion(paths[-1]) + 1 if paths else 1
+    path = os.path.join(artifact_dir, 'v{:04d}.joblib'.format(version))
+
+    joblib.dump({
+        'format': ARTIFACT_FORMAT,
+        'version': version,
+        'created': time.time(),
+        'sklearn_version': sklearn.__version__,
+        'feature_list': list(feature_list),
+        'feature_names': features.featureNames(feature_list),
+        'info': info or {},
+        'model': model,
+    }, path)
+
+    return path
+
+def loadArtifact(path=DEFAULT_ARTIFACT_DIR):
+    '''
+    Load a model artifact from a file, or the
+    latest version from a directory of them.
+    Raises ValueError if the features it was
+    fitted on are no longer encoded into the
+    same columns (e.g. a category was added),
+    since it would then score the wrong ones.
+    '''
+
+    import joblib
+    import sklearn
+
+    if(os.path.isdir(path)):
+        paths = artifactPaths(path)
+        if(not paths):
+            raise FileNotFoundError('No model artifacts in \'{}\'; run '
+                                    'analysis.py --save-model first.'\
+                                    .format(path))
+        path = paths[-1]
+
+    artifact = joblib.load(path)
+
+    if(artifact.get('format') != ARTIFACT_FORMAT):
+        raise ValueError('\'{}\' is in an unsupported artifact format.'\
+                         .format(path))
+
+    feature_names = features.featureNames(artifact['feature_list'])
+    if(artifact['feature_names'] != feature_names):
+        changed = set(artifact['feature_names']) ^ set(feature_names)
+        raise ValueError('The model in \'{}\' was fitted on other feature '
+                         'columns than features.py builds now (differing: '
+                         '{}).  Fit and save the model again.'\
+                         .format(path, ', '.join(sorted(changed))
+                                       or 'the order of the columns'))
+
+    if(artifact['sklearn_version'] != sklearn.__version__):
+        # Verbose output
+        print('Warning: \'{}\' was saved with scikit-learn {} but {} is '
+              'installed.'.format(path, artifact['sklearn_version'],
+                                  sklearn.__version__))
+
+    return artifact
+
+def predictFrame(artifact, df):
+    '''
+    Return the predicted worldwide gross of
+    every film in a dataframe.  Columns can be
+    named after either the MovieRecord fields
+    ('budget') or the dataset's columns
+    ('Budget').
+    '''
+
+    df = df.rename(columns=COLUMN_NAMES)
+    X = features.featureMatrix(df, artifact['feature_list'])
+    return artifact['model'].predict(X)
+
+def iterChunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Yield a CSV or Parquet file as dataframes
+    of at most chunk_size rows.
+    '''
+
+    import pandas as pd
+
+    if(path.endswith('.parquet')):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+class ChunkWriter:
+    '''
+    Writes dataframes one after another to a
+    single CSV or Parquet file.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet_writer = None
+        self.rows = 0
+
+    def write(self, df):
+        if(self.path.endswith('.parquet')):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if(self.parquet_writer is None):
+                self.parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self.parquet_writer.write_table(table)
+        else:
+            df.to_csv(self.path, mode='w' if self.rows == 0 else 'a',
+                      header=self.rows == 0, index=False)
+
+        self.rows += len(df)
+
+    def close(self):
+        if(self.parquet_writer is not None):
+            self.parquet_writer.close()
+
+def scoreFile(artifact, input_path, output_path,
+              chunk_size=DEFAULT_CHUNK_SIZE, timings=None):
+    '''
+    Predict the worldwide gross of every film in
+    a CSV or Parquet file, chunk by chunk, and
+    write the rows with an added prediction
+    column to output_path.  Returns the number
+    of rows scored.
+    '''
+
+    timings = timings or metrics.Metrics()
+
+    writer = ChunkWriter(output_path)
+    try:
+        for chunk in iterChunks(input_path, chunk_size):
+            with timings.timed('predict'):
+                chunk[PREDICTION_COLUMN] = predictFrame(artifact, chunk)
+
+            with timings.timed('write'):
+                writer.write(chunk)
+
+            timings.count('rows', len(chunk))
+    finally:
+        writer.close()
+
+    return writer.rows
+
+class MicroBatcher:
+    '''
+    Scores the films of concurrent requests
+    together: each request waits up to
+    max_delay seconds for others to arrive, and
+    up to max_batch films are predicted in a
+    single call to the model.
+    '''
+
+    def __init__(self, artifact, max_batch=DEFAULT_MAX_BATCH,
+                 max_delay=DEFAULT_MAX_DELAY, timings=None):
+        self.artifact = artifact
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.timings = timings or metrics.Metrics()
+        self.queue = asyncio.Queue()
+        self.task = None
+
+    async def predict(self, movies):
+        '''
+        Return the predictions for a list of
+        films, each a dictionary of columns.
+        '''
+
+        if(self.task is None):
+            self.task = asyncio.ensure_future(self.run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((movies, future))
+        return await future
+
+    async def nextBatch(self, batch):
+        '''
+        Add the next request, and those that
+        arrive within max_delay of it, to the list
+        batch until it holds max_batch films.
+        '''
+
+        batch.append(await self.queue.get())
+        size = len(batch[0][0])
+        deadline = asyncio.get_running_loop().time() + self.max_delay
+
+        while(size < self.max_batch):
+            remaining = deadline - asyncio.get_running_loop().time()
+            if(remaining <= 0):
+                break
+            try:
+                request = await asyncio.wait_for(self.queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            batch.append(request)
+            size += len(request[0])
+
+    def score(self, movies):
+        import pandas as pd
+
+        with self.timings.timed('predict'):
+            return predictFrame(self.artifact, pd.DataFrame(movies)).tolist()
+
+    def scoreBatch(self, batch):
+        movies = [movie for request_movies, future in batch
+                  for movie in request_movies]
+
+        try:
+            predictions = self.score(movies)
+        except Exception:
+            # One bad request shouldn't fail the others it was batched
+            # with, so score them one at a time to find out which.
+            for request_movies, future in batch:
+                if(future.done()):
+                    continue
+                try:
+                    future.set_result(self.score(request_movies))
+                except Exception as error:
+                    future.set_exception(error)
+            return
+
+        self.timings.count('batches')
+        self.timings.count('rows', len(movies))
+
+        # Hand each request back its own slice of the predictions.  A
+        # request whose client has gone away is already cancelled.
+        start = 0
+        for request_movies, future in batch:
+            if(not future.done()):
+                future.set_result(predictions[start:start +
+                                              len(request_movies)])
+            start += len(request_movies)
+
+    async def run(self):
+        while(True):
+            batch = []
+            try:
+                await self.nextBatch(batch)
+                self.scoreBatch(batch)
+            except Exception as error:
+                # Whatever went wrong, every request of the batch gets an
+                # answer, or its handler would wait for ever, and the next
+                # batch is scored as usual.
+                for request_movies, future in batch:
+                    if(not future.done()):
+                        future.set_exception(error)
+
+    def close(self):
+        if(self.task is not None):
+            self.task.cancel()
+
+def makeApp(artifact, max_batch=DEFAULT_MAX_BATCH,
+            max_delay=DEFAULT_MAX_DELAY, timings=None):
+    '''
+    Return an aiohttp application that answers
+    POST /predict with the predictions for a
+    JSON film or list of films, and GET /model
+    with the artifact's details.
+    '''
+
+    from aiohttp import web
+
+    batcher = MicroBatcher(artifact, max_batch, max_delay, timings)
+
+    async def predict(request):
+        try:
+            movies = await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(text='The body must be JSON.')
+
+        single = isinstance(movies, dict)
+        if(single):
+            movies = [movies]
+        if(not isinstance(movies, list)
+           or not all(isinstance(movie, dict) for movie in movies)):
+            raise web.HTTPBadRequest(text='The body must be a film or a list '
+                                          'of films, each a JSON object.')
+
+        try:
+            predictions = await batcher.predict(movies)
+        except (KeyError, TypeError, ValueError) as error:
+            raise web.HTTPBadRequest(text='Could not score the films: '
+                                          '{!r}'.format(error))
+
+        return web.json_response({PREDICTION_COLUMN: predictions[0] if single
+                                                     else predictions})
+
+    async def model(request):
+        return web.json_response({key: artifact[key]
+                                  for key in ['version', 'created',
+                                              'sklearn_version',
+                                              'feature_list', 'feature_names',
+                                              'info']})
+
+    async def closeBatcher(app):
+        batcher.close()
+
+    app = web.Application()
+    app.add_routes([web.post('/predict', predict), web.get('/model', model)])
+    app.on_cleanup.append(closeBatcher)
+
+    return app
+
+def addArguments(arg_parser):
+    '''
+    Add the command line options of the
+    predictions to an argparse parser.
+    '''
+
+    arg_parser.add_argument('input', nargs='?', default=None,
+                            help='CSV or Parquet file of films to score')
+    arg_parser.add_argument('--output', default=None,
+                            help='file the scored films are written to '
+                                 '(default: the input name with '
+                                 '_predictions added)')
+    arg_parser.add_argument('--model', default=DEFAULT_ARTIFACT_DIR,
+                            help='model artifact, or a directory whose '
+                                 'latest artifact is used')
+    arg_parser.add_argument('--chunk-size', type=int,
+                            default=DEFAULT_CHUNK_SIZE,
+                            help='number of rows scored at once')
+    arg_parser.add_argument('--serve', action='store_true',
+                            help='answer predictions over HTTP instead of '
+                                 'scoring a file')
+    arg_parser.add_argument('--host', default='127.0.0.1',
+                            help='address the HTTP endpoint listens on')
+    arg_parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                            help='port the HTTP endpoint listens on')
+    arg_parser.add_argument('--max-batch', type=int, default=DEFAULT_MAX_BATCH,
+                            help='most films the HTTP endpoint scores at once')
+    arg_parser.add_argument('--max-delay', type=float,
+                            default=DEFAULT_MAX_DELAY,
+                            help='seconds a request waits for others to be '
+                                 'scored with')
+    arg_parser.add_argument('--timings', action='store_true',
+                            help='print how long scoring took')
+
+def run(args):
+    '''
+    Score a file or serve predictions with the
+    options parsed from the command line.
+    '''
+
+    timings = metrics.Metrics()
+    artifact = loadArtifact(args.model)
+
+    # Verbose output
+    print('Loaded model version {} (features: {}).'\
+          .format(artifact['version'], ', '.join(artifact['feature_list'])))
+
+    if(args.serve):
+        from aiohttp import web
+
+        web.run_app(makeApp(artifact, args.max_batch, args.max_delay, timings),
+                    host=args.host, port=args.port)
+
+    elif(args.input is None):
+        raise SystemExit('Give a file to score, or --serve.')
+
+    else:
+        output = args.output
+        if(output is None):
+            root, extension = os.path.splitext(args.input)
+            output = root + '_predictions' + extension
+
+        rows = scoreFile(artifact, args.input, output, args.chunk_size,
+                         timings)
+
+        # Verbose output
+        print('Scored {} films in {:.2f} seconds; saved to \'{}\'.'\
+              .format(rows, timings.elapsed(), output))
+
+    if(args.timings):
+        print(timings.report())
+
+def main(argv=None, prog=None):
+    arg_parser = argparse.ArgumentParser(prog=prog,
+                                         description='Predict the box office '
+                                                     'earnings of films with '
+                                                     'a trained model.')
+    addArguments(arg_parser)
+    run(arg_parser.parse_args(argv))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,533 @@
+# Movie records and the on-disk movie dataset.
+#
+# Each scraped movie is held as a MovieRecord, which names every feature
+# rather than relying on its position in a tuple.  The dataset is a
+# directory of columnar Parquet files, one per release year, in which the
+# MPAA rating and release month are stored as categorical columns.  New
+# movies can be merged into it year by year without rewriting the rest of
+# the dataset, and a movie scraped twice is kept only once, identified by
+# its IMDb title ID.  Each movie also records when its page was fetched,
+# and a TitleIndex finds any stored movie by its title ID without loading
+# the dataset.  Only the scraped values are stored; the features used in
+# the regression are derived from them when the dataset is loaded (see
+# features.py).
+
+import glob
+import os
+from collections import namedtuple
+from dataclasses import asdict, dataclass, fields
+
+import numpy as np
+import pandas as pd
+
+from metrics import Metrics
+from normalize import MONTH_NAMES
+
+DEFAULT_DATASET_PATH = 'movie_dataset'
+DEFAULT_BATCH_SIZE = 10000  # Records held in memory before they are written
+                            # out as a row group.
+
+# The MPAA ratings that get a dummy variable of their own.
+MPAA_RATINGS = ['G', 'PG', 'PG-13', 'R']
+
+@dataclass(slots=True)
+class MovieRecord:
+    '''
+    The features scraped from the IMDb page of
+    a single movie.  The title ID (e.g.
+    'tt0848228') comes from the page's URL
+    rather than its contents, so it is filled
+    in after the page has been parsed, along
+    with the time the page was fetched (in
+    seconds since the epoch).
+    '''
+
+    title: str
+    year: int
+    release_month: str
+    mpaa_rating: str
+    runtime: int
+    budget: int
+    opening_weekend_gross: int
+    total_domestic_gross: int
+    worldwide_gross: int
+    user_rating: float
+    title_id: str = None
+    fetched_at: float = None
+
+# MovieRecord field -> name of its column in the dataframe.
+COLUMN_NAMES = {
+    'title': 'Title',
+    'year': 'Year',
+    'release_month': 'Release Month',
+    'mpaa_rating': 'MPAA Rating',
+    'runtime': 'Runtime',
+    'budget': 'Budget',
+    'opening_weekend_gross': 'Opening Weekend Box Office Earnings',
+    'total_domestic_gross': 'Total Domestic Gross Earnings',
+    'worldwide_gross': 'Total Worldwide Gross Earnings',
+    'user_rating': 'IMDb User Ratings',
+    'title_id': 'Title ID',
+    'fetched_at': 'Fetched At',
+}
+
+# Column names of the original pickled dataframe, in the order in which
+# the scraper used to store them.
+LEGACY_COLUMNS = ['Title', 'Release Month', 'MPAA Rating', 'G Dummy',
+                  'PG Dummy', 'PG-13 Dummy', 'R Dummy', 'January',
+                  'February', 'March', 'April', 'May', 'June', 'July',
+                  'August', 'September', 'October', 'November', 'December',
+                  'Runtime', 'Budget', 'Opening Weekend Box Office Earnings',
+                  'Total Domestic Gross Earnings',
+                  'Total Worldwide Gross Earnings', 'IMDb User Ratings']
+
+def recordToDict(movie_record):
+    return asdict(movie_record)
+
+def recordFromDict(record_dict):
+    return MovieRecord(**record_dict)
+
+def applyColumnTypes(df):
+    '''
+    Make the MPAA rating and the release month
+    categorical columns.
+    '''
+
+    df['release_month'] = pd.Categorical(df['release_month'],
+                                         categories=MONTH_NAMES)
+    df['mpaa_rating'] = df['mpaa_rating'].astype('category')
+
+    return df
+
+def recordsToDataframe(movie_records):
+    '''
+    Build a dataframe with one column per field
+    of MovieRecord, with the MPAA rating and the
+    release month as categorical columns.
+    '''
+
+    df = pd.DataFrame([asdict(movie_record) for movie_record in movie_records],
+                      columns=[field.name for field in fields(MovieRecord)])
+
+    return applyColumnTypes(df)
+
+def partitionPath(path, year):
+    return os.path.join(path, '{}.parquet'.format(year))
+
+def partitionPaths(path):
+    return sorted(glob.glob(os.path.join(path, '*.parquet')))
+
+def partitionYear(partition_path):
+    return os.path.basename(partition_path)[:-len('.parquet')]
+
+def datasetSchema():
+    '''
+    Return the Arrow schema every file of the
+    dataset is written with, so that files
+    written at different times can be read
+    together.
+    '''
+
+    import pyarrow as pa
+
+    types = {str: pa.string(), int: pa.int64(), float: pa.float64()}
+    category = pa.dictionary(pa.int32(), pa.string())
+
+    return pa.schema([(field.name, category
+                       if field.name in ('release_month', 'mpaa_rating')
+                       else types[field.type])
+                      for field in fields(MovieRecord)])
+
+def writePartition(df, path, year):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Write to a temporary file first so that an interrupted save can't
+    # leave a damaged partition behind.
+    temp_path = partitionPath(path, year) + '.tmp'
+    pq.write_table(pa.Table.from_pandas(df, schema=datasetSchema(),
+                                        preserve_index=False), temp_path)
+    os.replace(temp_path, partitionPath(path, year))
+
+class DatasetWriter:
+    '''
+    Streams MovieRecords into the dataset at
+    path as they come in.  Records are held
+    until batch_size of them have arrived and
+    then each year's share is appended to that
+    year's file as a row group, so memory use
+    doesn't grow with the number of records.
+    The files are written under temporary names
+    and only replace the stored years on
+    close().  Use it as a context manager to
+    throw the temporary files away if anything
+    goes wrong.
+    '''
+
+    def __init__(self, path=DEFAULT_DATASET_PATH,
+                 batch_size=DEFAULT_BATCH_SIZE, timings=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.timings = timings or Metrics()
+        self.schema = datasetSchema()
+        self.batch = []
+        self.writers = {}  # Year -> ParquetWriter of its temporary file
+        self.count = 0
+
+        os.makedirs(path, exist_ok=True)
+
+    def tempPath(self, year):
+        return partitionPath(self.path, year) + '.tmp'
+
+    def write(self, movie_record):
+        self.batch.append(recordToDict(movie_record))
+        self.count += 1
+        if(len(self.batch) >= self.batch_size):
+            self.flush()
+
+    def writeAll(self, movie_records):
+        for movie_record in movie_records:
+            self.write(movie_record)
+
+    def flush(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        years = {}
+        for record_dict in self.batch:
+            years.setdefault(record_dict['year'], []).append(record_dict)
+        self.batch = []
+
+        with self.timings.timed('save.write'):
+            for year, record_dicts in years.items():
+                if(year not in self.writers):
+                    self.writers[year] = pq.ParquetWriter(self.tempPath(year),
+                                                          self.schema)
+                self.writers[year].write_table(
+                    pa.Table.from_pylist(record_dicts, schema=self.schema))
+
+    def close(self):
+        '''
+        Write out the last batch and put every
+        year's new file in place.  Returns the
+        years written.
+        '''
+
+        self.flush()
+
+        for year, writer in self.writers.items():
+            writer.close()
+            os.replace(self.tempPath(year), partitionPath(self.path, year))
+
+        return sorted(self.writers)
+
+    def abort(self):
+        for year, writer in self.writers.items():
+            writer.close()
+            os.remove(self.tempPath(year))
+        self.writers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if(exc_type is not None):
+            self.abort()
+
+def saveMovies(movie_records, path=DEFAULT_DATASET_PATH, timings=None,
+               batch_size=DEFAULT_BATCH_SIZE):
+    '''
+    Save MovieRecords (a list, or any iterable
+    such as a generator) as the movie dataset at
+    path, replacing whatever was there before.
+    The records are written batch_size at a
+    time (see DatasetWriter).  With a Metrics
+    object, the time spent writing is recorded.
+    Returns the number of records saved.
+    '''
+
+    with DatasetWriter(path, batch_size, timings) as writer:
+        writer.writeAll(movie_records)
+        years = writer.close()
+
+    # Years that had movies before but not now are left over.
+    written = {partitionPath(path, year) for year in years}
+    for partition_path in partitionPaths(path):
+        if(partition_path not in written):
+            os.remove(partition_path)
+
+    return writer.count
+
+def dropDuplicateTitles(df):
+    '''
+    Keep only the last row for each title ID.
+    Rows without a title ID are all kept.
+    '''
+
+    duplicated = df['title_id'].notna() & df.duplicated('title_id', keep='last')
+    return df[~duplicated]
+
+def mergeMovies(movie_records, path=DEFAULT_DATASET_PATH, timings=None,
+                batch_size=DEFAULT_BATCH_SIZE):
+    '''
+    Add MovieRecords (a list or any iterable) to
+    the movie dataset at path.  Only the years
+    the new records belong to are rewritten, and
+    a new record replaces any stored record with
+    the same title ID, in whichever year it was
+    stored (a movie's year can change, e.g.
+    once its release date is known).  The years
+    that only held such replaced records are
+    rewritten without them.  The new records are
+    first streamed to a staging directory, so
+    only one year is ever held in memory.
+    Timings are recorded as for saveMovies().
+    Returns the number of records merged.
+    '''
+
+    timings = timings or Metrics()
+
+    staging_path = os.path.join(path, '.incoming')
+    with DatasetWriter(staging_path, batch_size, timings) as writer:
+        writer.writeAll(movie_records)
+        years = writer.close()
+
+    with timings.timed('save.merge'):
+        # Only the title IDs of the new records are held in memory, to find
+        # the stored records they replace in every year.
+        merged_title_ids = set()
+        for year in years:
+            merged_title_ids.update(pd.read_parquet(
+                partitionPath(staging_path, year),
+                columns=['title_id'])['title_id'].dropna())
+
+        for year in years:
+            year_df = pd.read_parquet(partitionPath(staging_path, year))
+            if(os.path.exists(partitionPath(path, year))):
+                stored_df = pd.read_parquet(partitionPath(path, year))
+                stored_df = stored_df[~stored_df['title_id']
+                                       .isin(merged_title_ids)]
+                year_df = pd.concat([stored_df, year_df], ignore_index=True)
+
+            writePartition(dropDuplicateTitles(year_df), path, year)
+            os.remove(partitionPath(staging_path, year))
+
+        # The other years are only rewritten if one of their movies was
+        # merged into a different year.  This comes after the new records
+        # are saved, so an interrupted merge can't lose a movie.
+        merged_paths = {partitionPath(path, year) for year in years}
+        for partition_path in partitionPaths(path):
+            if(partition_path in merged_paths):
+                continue
+
+            title_ids = pd.read_parquet(partition_path,
+                                        columns=['title_id'])['title_id']
+            moved = title_ids.isin(merged_title_ids)
+            if(not moved.any()):
+                continue
+
+            if(moved.all()):
+                os.remove(partition_path)
+                continue
+
+            # Files from before a column was added get it, empty.
+            year_df = pd.read_parquet(partition_path, schema=datasetSchema())
+            writePartition(year_df[~moved.to_numpy()], path,
+                           partitionYear(partition_path))
+
+    os.rmdir(staging_path)
+
+    return writer.count
+
+def storedTitleIds(path=DEFAULT_DATASET_PATH):
+    '''
+    Return a dictionary mapping each year in the
+    movie dataset at path to the set of title
+    IDs stored for that year.  Only the year and
+    title ID columns are read.
+    '''
+
+    stored = {}
+    for partition_path in partitionPaths(path):
+        df = pd.read_parquet(partition_path, columns=['year', 'title_id'])
+        for year, title_ids in df.groupby('year')['title_id']:
+            stored.setdefault(int(year), set()).update(title_ids.dropna())
+
+    return stored
+
+# Where a movie is stored and how old its data is, as kept by TitleIndex.
+IndexEntry = namedtuple('IndexEntry', ['year', 'release_month', 'fetched_at'])
+
+class TitleIndex:
+    '''
+    Index of the movie dataset at path by IMDb
+    title ID.  Only the title ID, year, release
+    month and fetch time columns are read, once,
+    into arrays with a row per movie, and a
+    dictionary maps each title ID to its row,
+    so any movie can then be looked up in
+    constant time, or loaded from the one file
+    of its year.  Movies saved before fetch
+    times were recorded have a fetched_at of
+    None (NaN in the array).
+    '''
+
+    def __init__(self, path=DEFAULT_DATASET_PATH):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.path = path
+
+        # Reading with the dataset's schema fills in a fetch time column
+        # missing from older files.
+        partition_paths = partitionPaths(path)
+        columns = ['title_id', 'year', 'release_month', 'fetched_at']
+        if(partition_paths):
+            table = pa.concat_tables([pq.read_table(partition_path,
+                                                    schema=datasetSchema(),
+                                                    columns=columns)
+                                      for partition_path in partition_paths])
+        else:
+            table = datasetSchema().empty_table().select(columns)
+
+        df = table.to_pandas()
+        df = df[df['title_id'].notna()]
+
+        self.title_ids = df['title_id'].to_numpy()
+        self.years = df['year'].to_numpy(dtype=float)
+        self.month_codes = pd.Categorical(df['release_month'],
+                                          categories=MONTH_NAMES).codes
+        self.fetched_at = df['fetched_at'].to_numpy(dtype=float)
+
+        # Title ID -> row.  mergeMovies() stores each title ID once, even
+        # when a movie's year changes, so this finds its only row.  Rows
+        # of a title written twice by an older version are resolved to
+        # the last one.
+        self.rows = dict(zip(self.title_ids.tolist(),
+                             range(len(self.title_ids))))
+
+    def __contains__(self, title_id):
+        return title_id in self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def get(self, title_id):
+        '''
+        Return the IndexEntry of a title ID, or
+        None if it isn't stored.
+        '''
+
+        row = self.rows.get(title_id)
+        if(row is None):
+            return None
+
+        year, fetched_at = self.years[row], self.fetched_at[row]
+        month_code = self.month_codes[row]
+
+        return IndexEntry(None if np.isnan(year) else int(year),
+                          MONTH_NAMES[month_code] if month_code >= 0 else None,
+                          None if np.isnan(fetched_at) else float(fetched_at))
+
+    def loadMovie(self, title_id):
+        '''
+        Return the stored MovieRecord with the
+        given title ID, or None if there isn't
+        one.
+        '''
+
+        import pyarrow.parquet as pq
+
+        entry = self.get(title_id)
+        if(entry is None):
+            return None
+
+        table = pq.read_table(partitionPath(self.path, entry.year),
+                              schema=datasetSchema(),
+                              filters=[('title_id', '==', title_id)])
+        rows = table.to_pylist()
+
+        return recordFromDict(rows[-1]) if rows else None
+
+def readDataset(path=DEFAULT_DATASET_PATH):
+    '''
+    Read every year of the movie dataset at path
+    (or a single Parquet file) into one
+    dataframe with MovieRecord field names.
+    '''
+
+    if(not os.path.isdir(path)):
+        return pd.read_parquet(path)
+
+    partition_paths = partitionPaths(path)
+    if(not partition_paths):
+        return recordsToDataframe([])
+
+    import pyarrow.parquet as pq
+
+    # Reading all of the years as a single table is much quicker than
+    # reading them one by one and concatenating the dataframes.
+    return applyColumnTypes(pq.read_table(partition_paths,
+                                          schema=datasetSchema()).to_pandas())
+
+def countMovies(path=DEFAULT_DATASET_PATH):
+    '''
+    Return the number of movies in the dataset
+    at path (or a single Parquet file), from the
+    files' metadata alone.
+    '''
+
+    import pyarrow.parquet as pq
+
+    partition_paths = partitionPaths(path) if os.path.isdir(path) else [path]
+    return sum(pq.ParquetFile(partition_path).metadata.num_rows
+               for partition_path in partition_paths)
+
+def iterDatasetChunks(path=DEFAULT_DATASET_PATH, chunk_size=DEFAULT_BATCH_SIZE,
+                      fields=None):
+    '''
+    Generator over the movie dataset at path (or
+    a single Parquet file) as dataframes of at
+    most chunk_size movies, with named columns
+    like those of loadMovies().
+    Only the MovieRecord fields listed in fields
+    are read (all of them by default), and only
+    one chunk is held in memory at a time.
+    '''
+
+    import pyarrow.parquet as pq
+
+    partition_paths = partitionPaths(path) if os.path.isdir(path) else [path]
+
+    for partition_path in partition_paths:
+        parquet_file = pq.ParquetFile(partition_path)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size,
+                                               columns=fields):
+            df = batch.to_pandas()
+            if('release_month' in df):
+                df['release_month'] = pd.Categorical(df['release_month'],
+                                                     categories=MONTH_NAMES)
+            yield df.rename(columns=COLUMN_NAMES)
+
+def loadMovies(path=DEFAULT_DATASET_PATH):
+    '''
+    Load the movie dataset as a dataframe with
+    named columns holding the stored values
+    (see features.featureMatrix() for the
+    regression features).  A pickle file written
+    by an older version of the scraper can be
+    loaded too.
+    '''
+
+    if(path.endswith('.pkl')):
+        df = pd.read_pickle(path)
+        df.columns = LEGACY_COLUMNS
+        df = df[[column for column in COLUMN_NAMES.values()
+                 if column in LEGACY_COLUMNS]]
+    else:
+        df = readDataset(path).rename(columns=COLUMN_NAMES)
+
+    return df
@@ -0,0 +1,73 @@
+# Refresh policy for the box office figures in the movie dataset.
+#
+# The gross earnings of a movie keep changing for months after its
+# release, but a movie released years ago won't change any more.  Rather
+# than scraping everything again, a refresh run (`scraper.py --refresh`)
+# fetches again only the movies whose data is older than --max-age days,
+# most recent releases first, and merges them back into the dataset.
+# Movies that were last fetched more than --settled-after days after their
+# release have their final figures already and are left alone, so a daily
+# refresh only touches the movies still in or near theatres.  Movies saved
+# before fetch times were recorded are refreshed once to get one.
+
+import time
+
+import numpy as np
+
+DEFAULT_MAX_AGE = 7.0          # Days before a movie's data is refreshed.
+DEFAULT_SETTLED_AFTER = 365.0  # Days after release once the figures are
+                               # final.
+
+DAY = 24 * 60 * 60
+
+def releaseTimes(years, month_codes):
+    '''
+    Return the start of each movie's release
+    month (or year, if the month isn't known,
+    i.e. its code is -1) in seconds since the
+    epoch, or 0 if the year isn't known either.
+    Takes arrays of years and of indices into
+    MONTH_NAMES.
+    '''
+
+    known = ~np.isnan(years)
+    months = (np.where(known, years, 1970) - 1970) * 12 \
+             + np.maximum(month_codes, 0)
+
+    seconds = months.astype('datetime64[M]').astype('datetime64[s]')\
+                    .astype(float)
+    return np.where(known, seconds, 0.0)
+
+def staleTitles(title_index, max_age=DEFAULT_MAX_AGE,
+                settled_after=DEFAULT_SETTLED_AFTER, limit=None, now=None):
+    '''
+    Return the title IDs in a records.TitleIndex
+    whose data needs to be fetched again, the
+    most recent releases first and, among
+    those, the ones fetched longest ago.  With a
+    limit, only that many are returned.
+    '''
+
+    now = time.time() if now is None else now
+
+    # The policy is applied to every movie in the index at once.
+    rows = np.fromiter(title_index.rows.values(), dtype=int,
+                       count=len(title_index))
+    fetched_at = title_index.fetched_at[rows]
+    released = releaseTimes(title_index.years[rows],
+                            title_index.month_codes[rows])
+
+    # Once a movie has been fetched long enough after its release, its
+    # figures have stopped changing.
+    never_fetched = np.isnan(fetched_at)
+    with np.errstate(invalid='ignore'):
+        stale = never_fetched | ((now - fetched_at >= max_age * DAY)
+                                 & (fetched_at - released < settled_after * DAY))
+
+    rows, fetched_at, released = rows[stale], fetched_at[stale], released[stale]
+    order = np.lexsort((np.nan_to_num(fetched_at), -released))[:limit]
+
+    return title_index.title_ids[rows[order]].tolist()
+
+def titleUrl(title_id, site_url):
+    return '{}/title/{}/'.format(site_url, title_id)
@@ -8,438 +8,511 @@
 # use the HTML code present in the webpage to determine which elements to
 # scrape.
 
-import requests
-import urllib.request
-import time
-import pandas as pd
-from bs4 import BeautifulSoup
-import pickle
-import re
-
-# Set the URLs for collecting the links to the 100 highest-grossing
-# films for each year from 2009 to 2018 listed on the IMDb website.
-# This is done by first creating the list of strings url[] and then
-# setting the value of each element to the string representing the
-# respective URL.
-#
-# NB: IMDb only shows 50 results per page, so there are 2 links for
-# each year of movies.
+import argparse
+import asyncio
+import functools
+
+import cache
+import extractors
+import fetcher
+import journal
+import metrics
+import normalize
+import paginator
+import pipeline
+import records
+import refresh
+import workqueue
+
+# The links to the highest-grossing films of each year are collected from
+# IMDb's search results, sorted by box office revenue.  The paginator
+# follows each year's list pages until it has the top N movies, and hands
+# over every movie page it finds straight away so that scraping can start
+# before the whole list has been read.
+
+DEFAULT_YEARS = '2009-2018'
+
+def parseYears(years):
+    '''
+    Turn a string of years such as '2009-2018'
+    or '2015,2017-2019' into a list of years,
+    newest first.
+    '''
 
-# Create the list url[] with 20 elements.
-url = [None] * 20
-
-# 2018
-url[0] = 'https://www.imdb.com/search/title/?title_type=feature&year=2018-01-01,2018-12-31&sort=boxoffice_gross_us,desc'
-url[1] = 'https://www.imdb.com/search/title/?title_type=feature&year=2018-01-01,2018-12-31&sort=boxoffice_gross_us,desc&start=51&ref_=adv_nxt'
-
-# 2017
-url[2] = 'https://www.imdb.com/search/title/?title_type=feature&year=2017-01-01,2017-12-31&sort=boxoffice_gross_us,desc'
-url[3] = 'https://www.imdb.com/search/title/?title_type=feature&year=2017-01-01,2017-12-31&sort=boxoffice_gross_us,desc&start=51&ref_=adv_nxt'
-
-# 2016
-url[4] = 'https://www.imdb.com/search/title/?title_type=feature&year=2016-01-01,2016-12-31&sort=boxoffice_gross_us,desc'
-url[5] = 'https://www.imdb.com/search/title/?title_type=feature&year=2016-01-01,2016-12-31&sort=boxoffice_gross_us,desc&start=51&ref_=adv_nxt'
-
-# 2015
-url[6] = 'https://www.imdb.com/search/title/?title_type=feature&year=2015-01-01,2015-12-31&sort=boxoffice_gross_us,desc'
-url[7] = 'https://www.imdb.com/search/title/?title_type=feature&year=2015-01-01,2015-12-31&sort=boxoffice_gross_us,desc&start=51&ref_=adv_nxt'
-
-# 2014
-url[8] = 'https://www.imdb.com/search/title/?title_type=feature&year=2014-01-01,2014-12-31&sort=boxoffice_gross_us,desc'
-url[9] = 'https://www.imdb.com/search/title/?title_type=feature&year=2014-01-01,2014-12-31&sort=boxoffice_gross_us,desc&start=51&ref_=adv_nxt'
-
-# 2013
-url[10] = 'https://www.imdb.com/search/title/?title_type=feature&year=2013-01-01,2013-12-31&sort=boxoffice_gross_us,desc'
-url[11] = 'https://www.imdb.com/search/title/?title_type=feature&year=2013-01-01,2013-12-31&sort=boxoffice_gross_us,desc&start=51&ref_=adv_nxt'
-
-# 2012
-url[12] = 'https://www.imdb.com/search/title/?title_type=feature&year=2012-01-01,2012-12-31&sort=boxoffice_gross_us,desc'
-url[13] = 'https://www.imdb.com/search/title/?title_type=feature&year=2012-01-01,2012-12-31&sort=boxoffice_gross_us,desc&start=51&ref_=adv_nxt'
-
-# 2011
-url[14] = 'https://www.imdb.com/search/title/?title_type=feature&year=2011-01-01,2011-12-31&sort=boxoffice_gross_us,desc'
-url[15] = 'https://www.imdb.com/search/title/?title_type=feature&year=2011-01-01,2011-12-31&sort=boxoffice_gross_us,desc&start=51&ref_=adv_nxt'
-
-# 2010
-url[16] = 'https://www.imdb.com/search/title/?title_type=feature&year=2010-01-01,2010-12-31&sort=boxoffice_gross_us,desc'
-url[17] = 'https://www.imdb.com/search/title/?title_type=feature&year=2010-01-01,2010-12-31&sort=boxoffice_gross_us,desc&start=51&ref_=adv_nxt'
-
-# 2009
-url[18] = 'https://www.imdb.com/search/title/?title_type=feature&year=2009-01-01,2009-12-31&sort=boxoffice_gross_us,desc'
-url[19] = 'https://www.imdb.com/search/title/?title_type=feature&year=2009-01-01,2009-12-31&sort=boxoffice_gross_us,desc&start=51&ref_=adv_nxt'
-
-# Each webpage linked to by each element of url[] is itself just a list
-# of movies, ranked by box office revenue, and each of those listings
-# contains another link, this time to the IMDb page with information about
-# the individual movie.  The next step is to iterate through url[] and
-# collect and follow these links, after which we scrape the information
-# for each movie.
-
-base_url = 'https://www.imdb.com'
-
-movie_link_list = [] # List of webpages to be scraped for movie data
-
-movie_features = []  # List of tuples returned by the getMovieData() function,
-                     # which will then be converted to a pandas dataframe for
-                     # analasys.
-
-unscraped_pages = [] # A list of pages that did not scrape properly on the
-                     # first pass.  They will be attempted one more time
-                     # after the other pages have been scraped.
-
-i = 0                # Index value for use in the while loop below.
-
-# Verbose output
-print('Initiating movie URL collection...')
-
-# Iterate through the list of URLs 
-while(i < len(url)):
-    # Obtain the response to the request for the URLs from above (response
-    # 200 means the request was successful).  The HTML contents of the page
-    # can be found in page_response.text
-    page_response = requests.get(url[i])
-
-    # Convert the HTML code found in page_response.text to a BeautifulSoup
-    # object, which makes for easier web scraping
-    page_soup = BeautifulSoup(page_response.text, 'html.parser')
-
-    # Create a list of tags which contain the link subdirectory for the movie
-    # to be scraped.
-    link_list = page_soup.find_all('span', class_='lister-item-index unbold text-primary')
-
-    i += 1 # Increment the index for the current loop
-    
-    j = 0  # Index for the nested while loop below.
-
-    # For each film listed on the page stored in url[i],
-    # pull the link to that particular film and store it
-    # in the list 'movie_link_list'.
-    while(j < len(link_list)):
-        # The tag that includes the string for the
-        # page related to the movie.
-        link_subdirectory_tag = link_list[j].find_next_sibling()
-
-        # Pull the specific string for the link subdirectory
-        # out of the tag.
-        link_subdirectory = link_subdirectory_tag['href']
-
-        # Append the string for the link subdirectory
-        # to the base url 'https://www.imdb.com',
-        # which assigns the full URL string to the
-        # variable 'movie_link'.
-        movie_link = base_url + link_subdirectory
-
-        # Append the string value of 'movie_link' to the list
-        # movie_link_list[].  This will be the list of pages
-        # that will be scraped for movie data in the next
-        # part of this program.
-        movie_link_list.append(movie_link)
-
-        # Verbose output: confirm each time 50 movie URLs have
-        # been scraped.
-        if((j+1) % 50 == 0):
-            scraped_url_count = (j + 1) * (i + 1) # Number of URLs scraped
-            total_url_count = len(url) * 50       # Total length of url[]
+    year_list = set()
+    for year_range in years.split(','):
+        first, dash, last = year_range.partition('-')
+        year_list.update(range(int(first), int(last or first) + 1))
 
-            # Verbose output
-            print('Collected {} out of {} URLs.'\
-                  .format(scraped_url_count, total_url_count)
-                  )
-            
-        j += 1 # Increment the index of the current nested loop.
-        
-def getMPAArating(movie_soup):
+    return sorted(year_list, reverse=True)
+
+async def queueMovieLinks(years, top_n, rate_limiter, cache, journal,
+                          known_title_ids=frozenset(), timings=None,
+                          timeout=fetcher.DEFAULT_TIMEOUT,
+                          retries=fetcher.DEFAULT_RETRIES,
+                          site_url=paginator.base_url, transport=None):
     '''
-    Take the BeautifulSoup object movie_soup
-    and extract the MPAA rating string from
-    the object by stripping away extraneous
-    information and whitespace until the only
-    thing left is the rating.
+    Asynchronous generator that collects the
+    movie pages of each year with the paginator,
+    records them in the journal and yields the
+    ones that still need to be scraped.  Movies
+    whose title ID is in known_title_ids are
+    left out.  Once the paginator runs out, the
+    journal is marked as fully collected.  The
+    list pages are read from site_url, which
+    can point at a mirror of IMDb instead, over
+    the optional shared fetcher.Transport.
     '''
 
-    # Extract the tag soup containing the title block
-    # of the page.
-    rating_soup = movie_soup.find('div', class_='subtext').text
-    
-    rating = str(rating_soup)       # Convert the tag soup to a string
-                                              
-    rating = re.sub('\n','',rating) # Remove newline characters because Regex
-                                    # does not define the wildcard '.' so as
-                                    # to include '\n'.
-                                              
-    rating = re.sub('\|.*','',rating).strip() # Capture the remaining
-                                              # characters from the beginning
-                                              # of what's left of the string
-                                              # to the first pipe, and then
-                                              # strip away the whitespace.
-
-    return rating
-
-def getMovieBudget(movie_soup):
+    list_url = functools.partial(paginator.yearListUrl, site_url=site_url)
+
+    async for movie_link in paginator.iterMovieLinks(years, top_n,
+                                                     rate_limit=rate_limiter,
+                                                     timings=timings,
+                                                     cache=cache,
+                                                     timeout=timeout,
+                                                     retries=retries,
+                                                     list_url=list_url,
+                                                     transport=transport):
+        if(normalize.parseTitleId(movie_link) in known_title_ids):
+            continue
+
+        journal.recordQueued([movie_link])
+
+        # A resumed run finds the pages it already scraped again.
+        if(movie_link not in journal.completed):
+            yield movie_link
+
+    journal.recordCollected()
+
+async def scrapeMovies(movie_links, concurrency, rate_limit, workers,
+                       timings, cache, journal, parser=None,
+                       timeout=fetcher.DEFAULT_TIMEOUT,
+                       retries=fetcher.DEFAULT_RETRIES, transport=None,
+                       stop_early=False):
     '''
-    Use regex to strip non-numerical characters
-    out of the budget string and then use int()
-    to convert it to an integer.
+    Fetch every page in movie_links (a list, or
+    an asynchronous iterable of pages as they
+    are found) using the concurrent fetch
+    engine and parse the pages with the named
+    HTML parser, either in between fetches or
+    in a pool of worker processes.  The pages
+    are requested over transport, and with
+    stop_early only as much of each one as the
+    extractors need is downloaded.  Each record
+    is tagged with the title ID from its URL and
+    written to the journal as soon as it comes
+    in.  Returns a dictionary with the lists of
+    pages that failed to scrape because of the
+    'network' and because of a 'parse' error.
     '''
 
-    # Navigate to the section that contains box
-    # office information.
-    box_office_soup = movie_soup.find('h3', class_='subheading')\
-                                .find_next_sibling()
+    failed_pages = {'network': [], 'parse': []}
+
+    async for i, movie_url, movie_record in pipeline.iterMovieData(movie_links,
+                                                                  concurrency,
+                                                                  rate_limit,
+                                                                  workers,
+                                                                  timings,
+                                                                  cache,
+                                                                  parser,
+                                                                  timeout,
+                                                                  retries,
+                                                                  transport,
+                                                                  stop_early):
+        # Error handling.  If anything went wrong while fetching or parsing
+        # the page, the exception is handed back instead of a record so that
+        # it doesn't derail the whole algorithm and force the scraping
+        # process to be restarted.
+        timings.count('pages')
+
+        if(isinstance(movie_record, Exception)):
+            kind = pipeline.failureKind(movie_record)
+            timings.count('failed.' + kind)
+            journal.recordFailed(movie_url, movie_record, kind)
+            failed_pages[kind].append(movie_url)
+
+            # Verbose output
+            print('Failed to scrape {} ({} error: {!r}).'\
+                  .format(movie_url, kind, movie_record))
+
+        else:
+            movie_record.title_id = normalize.parseTitleId(movie_url)
+            journal.recordDone(movie_url, movie_record)
+
+            # Verbose output
+            print('Scraped {} of {} movies found so far.'\
+                  .format(len(journal.completed), len(journal.queued)))
+
+    return failed_pages
+
+def addArguments(arg_parser):
+    '''
+    Add the command line options of the
+    scraper to an argparse parser.
+    '''
 
-    budget = re.sub('\n','',box_office_soup.text)  # Use regex to strip the
-    budget = re.sub('.*\$','',budget)              # budget value down to
-    budget = re.sub(',','',budget)                 # numerical characters.
-    budget = re.sub('\(estimated\)','',budget).strip()
+    # Options for tuning how hard the movie pages are fetched and how many
+    # processes are used to parse them.
+    arg_parser.add_argument('--concurrency', type=int,
+                            default=fetcher.DEFAULT_CONCURRENCY,
+                            help='maximum number of movie pages fetched at once')
+    arg_parser.add_argument('--rate-limit', type=float,
+                            default=fetcher.DEFAULT_RATE_LIMIT,
+                            help='maximum requests per second sent to IMDb')
+    arg_parser.add_argument('--timeout', type=float,
+                            default=fetcher.DEFAULT_TIMEOUT,
+                            help='seconds allowed for each request')
+    arg_parser.add_argument('--retries', type=int,
+                            default=fetcher.DEFAULT_RETRIES,
+                            help='number of times a request is retried after '
+                                 'a timeout, connection error, 429 or 5xx')
+    arg_parser.add_argument('--workers', type=int,
+                            default=pipeline.DEFAULT_WORKERS,
+                            help='number of parser processes (0 parses in '
+                                 'the main process)')
+    arg_parser.add_argument('--http2', action='store_true',
+                            help='use HTTP/2 where the server offers it '
+                                 '(needs httpx and h2)')
+    arg_parser.add_argument('--stop-early', action='store_true',
+                            help='stop downloading each movie page once the '
+                                 'sections that are scraped have arrived')
+    arg_parser.add_argument('--parser', choices=extractors.availableParsers(),
+                            default=extractors.DEFAULT_PARSER,
+                            help='HTML parser used to read the movie pages')
+    arg_parser.add_argument('--timings', action='store_true',
+                            help='print how long each stage of the scrape '
+                                 'took, with percentiles')
+    arg_parser.add_argument('--metrics', default=None,
+                            help='write the timings and counters of the run '
+                                 'to this JSON file')
+    arg_parser.add_argument('--profile', choices=metrics.availableProfilers(),
+                            default=None,
+                            help='profile the run with this profiler')
+    arg_parser.add_argument('--profile-output',
+                            default=metrics.DEFAULT_PROFILE_OUTPUT,
+                            help='file name (without extension) the profile '
+                                 'is saved under')
+    arg_parser.add_argument('--cache-dir', default=cache.DEFAULT_CACHE_DIR,
+                            help='directory where fetched pages are cached')
+    arg_parser.add_argument('--cache-size', type=int,
+                            default=cache.DEFAULT_MAX_BYTES // 2**20,
+                            help='maximum size of the page cache in MB')
+    arg_parser.add_argument('--no-cache', action='store_true',
+                            help='always fetch pages from IMDb')
+    arg_parser.add_argument('--cache-only', action='store_true',
+                            help='only use cached pages and never contact '
+                                 'IMDb (for re-parsing after changing an '
+                                 'extractor)')
+    arg_parser.add_argument('--base-url', default=paginator.base_url,
+                            help='site the list pages are read from, e.g. a '
+                                 'local replay server (default: %(default)s)')
+    arg_parser.add_argument('--years', default=DEFAULT_YEARS,
+                            help='release years to scrape, e.g. 2009-2018 or '
+                                 '2015,2017-2019')
+    arg_parser.add_argument('--top-n', type=int,
+                            default=paginator.DEFAULT_TOP_N,
+                            help='number of highest-grossing movies to '
+                                 'scrape for each year')
+    arg_parser.add_argument('--output', default=records.DEFAULT_DATASET_PATH,
+                            help='directory the movie dataset is saved to')
+    arg_parser.add_argument('--batch-size', type=int,
+                            default=records.DEFAULT_BATCH_SIZE,
+                            help='number of movies written to the dataset at '
+                                 'a time')
+    arg_parser.add_argument('--incremental', action='store_true',
+                            help='only scrape movies that are not in the '
+                                 'dataset yet and merge them into it')
+    arg_parser.add_argument('--new-years-only', action='store_true',
+                            help='with --incremental, skip the list pages of '
+                                 'years already in the dataset')
+    arg_parser.add_argument('--refresh', action='store_true',
+                            help='instead of reading the list pages, fetch '
+                                 'the stored movies whose data is out of '
+                                 'date again and merge them into the dataset')
+    arg_parser.add_argument('--max-age', type=float,
+                            default=refresh.DEFAULT_MAX_AGE,
+                            help='with --refresh, days after which a movie\'s '
+                                 'data is out of date')
+    arg_parser.add_argument('--settled-after', type=float,
+                            default=refresh.DEFAULT_SETTLED_AFTER,
+                            help='with --refresh, days after its release '
+                                 'after which a movie\'s figures no longer '
+                                 'change')
+    arg_parser.add_argument('--refresh-limit', type=int, default=None,
+                            help='with --refresh, the most movies fetched '
+                                 'again in one run')
+    arg_parser.add_argument('--journal', default=journal.DEFAULT_JOURNAL_PATH,
+                            help='file recording the progress of the scrape, '
+                                 'used to resume an interrupted run')
+    arg_parser.add_argument('--restart', action='store_true',
+                            help='ignore the journal and scrape everything '
+                                 'again')
+
+    # Options for a distributed scrape, in which a coordinator puts the
+    # movie pages on a shared work queue for any number of workers.
+    arg_parser.add_argument('--queue', default=None,
+                            help='take part in a distributed scrape through '
+                                 'the work queue at this location, e.g. a '
+                                 'SQLite file on a shared disk')
+    arg_parser.add_argument('--queue-backend',
+                            choices=workqueue.availableBackends(),
+                            default=workqueue.DEFAULT_BACKEND,
+                            help='kind of work queue')
+    arg_parser.add_argument('--role', choices=['coordinator', 'worker'],
+                            default='coordinator',
+                            help='with --queue, whether this process collects '
+                                 'the pages and saves the dataset or scrapes '
+                                 'pages off the queue')
+    arg_parser.add_argument('--local-workers', type=int, default=0,
+                            help='number of worker processes the coordinator '
+                                 'starts on this machine')
+    arg_parser.add_argument('--shard-dir', default='scrape_shards',
+                            help='directory, shared by every worker, where '
+                                 'each worker writes what it scraped')
+    arg_parser.add_argument('--worker-id', default=None,
+                            help='name of this worker (host name and process '
+                                 'ID by default)')
+    arg_parser.add_argument('--lease', type=float,
+                            default=workqueue.DEFAULT_LEASE,
+                            help='seconds a worker holds a page before it is '
+                                 'handed to another worker')
+
+def openCache(args):
+    '''
+    Open the response cache named on the
+    command line, or return None if caching is
+    turned off.
+    '''
 
-    budget = int(budget) # Convert the budget value from a string
-                         # to an integer.
+    # Keep every page we download so that re-running the scraper after a
+    # tweak doesn't mean downloading everything again.
+    if(args.no_cache):
+        return None
 
-    return budget
+    return cache.ResponseCache(args.cache_dir,
+                               args.cache_size * 2**20,
+                               offline=args.cache_only)
 
-def fetchOpeningWeekendGross(movie_soup):
+def scrapeScope(args):
     '''
-    Obtain the opening weekend gross revenue.
+    Return the years whose list pages are read
+    and the frozenset of title IDs to leave out,
+    as chosen on the command line.
     '''
 
-    box_office_soup = movie_soup.find('h3', class_='subheading')\
-                                .find_next_sibling()\
-                                .find_next_sibling()
+    years = parseYears(args.years)
 
-    # Remove the first newline character in order to enable other
-    # irrelevant information to be more easily removed.
-    opening_weekend_gross = re.sub('\nO','',box_office_soup.text)
+    # In incremental mode, look up which movies are already stored so that
+    # only new ones are scraped.  Only the year and title ID columns of the
+    # dataset are read for this.
+    known_title_ids = frozenset()
+    if(args.incremental):
+        stored_title_ids = records.storedTitleIds(args.output)
+        known_title_ids = frozenset().union(*stored_title_ids.values())
+        if(args.new_years_only):
+            years = [year for year in years if year not in stored_title_ids]
 
-    opening_weekend_gross = re.search('.*',opening_weekend_gross)
-    opening_weekend_gross = str(opening_weekend_gross)
-    opening_weekend_gross = re.sub('.*\$','',opening_weekend_gross)
-    opening_weekend_gross = re.sub('[^0-9]','',opening_weekend_gross)
+    return years, known_title_ids
 
-    opening_weekend_gross = int(opening_weekend_gross) # Convert opening
-                                                       # weekend gross string
-                                                       # to integer.
+def scrapeMode(args):
+    '''
+    Return the kind of run chosen on the
+    command line: 'refresh', 'incremental' or
+    'full'.
+    '''
 
-    return opening_weekend_gross
+    if(args.refresh):
+        return 'refresh'
+    if(args.incremental):
+        return 'incremental'
+    return 'full'
 
-def fetchReleaseMonth(movie_soup):
+def checkMode(started_mode, mode, location):
     '''
-    After finding the section of the page containing
-    the release month, the re.search() function is
-    used to search for the string for each month.  If
-    the name of the month is found, that is the movie's
-    release month and its respective string value is
-    returned.
+    Stop a run that would resume a job begun
+    as a different kind of run, e.g. a full
+    scrape that would save the movies of an
+    interrupted refresh in place of the whole
+    dataset.
     '''
 
-    # Obtain the section of the page containing the release date.
-    release_date = movie_soup.find('div', class_='subtext')\
-                             .find(title='See more release dates').text
-
-    # Each if() statement corresponds to a release month.  If that string
-    # has a match within the section of the page found in release_date,
-    # this function will return the string for that month.
-    if(re.search('January', release_date) != None):
-        return 'January'
-    if(re.search('February', release_date) != None):
-        return 'February'
-    if(re.search('March', release_date) != None):
-        return 'March'
-    if(re.search('April', release_date) != None):
-        return 'April'
-    if(re.search('May', release_date) != None):
-        return 'May'
-    if(re.search('June', release_date) != None):
-        return 'June'
-    if(re.search('July', release_date) != None):
-        return 'July'
-    if(re.search('August', release_date) != None):
-        return 'August'
-    if(re.search('September', release_date) != None):
-        return 'September'
-    if(re.search('October', release_date) != None):
-        return 'October'
-    if(re.search('November', release_date) != None):
-        return 'November'
-    if(re.search('December', release_date) != None):
-        return 'December'
-
-def getMovieData(movie_url):
+    if(started_mode != mode):
+        raise SystemExit('\'{}\' holds an interrupted {} run, but this is a '
+                         '{} run.  Resume it with the same options, or start '
+                         'over with --restart.'.format(location, started_mode,
+                                                       mode))
+
+def refreshLinks(args):
     '''
-    This function takes an IMDb URL as an
-    argument and scrapes the page for movie
-    attributes.
+    Return the movie pages a refresh run fetches
+    again: those of the stored movies whose data
+    is out of date, the most recent releases
+    first.
     '''
 
-    # Obtain a response object for the IMDb page of the individual movie.
-    movie_response = requests.get(movie_url)
-
-    # Convert the response object for the page to a BeautifulSoup object.
-    movie_soup = BeautifulSoup(movie_response.text, 'html.parser')
-
-    # Get the MPAA rating of the movie.
-    mpaa_rating = getMPAArating(movie_soup)
-
-    # Set dummy variables initially to 0.
-    dummy_g = 0
-    dummy_pg = 0
-    dummy_pg13 = 0
-    dummy_r = 0
-
-    # Now set the dummy variable that corresponds to rating to 1.
-    if(mpaa_rating == 'G'):
-        dummy_g = 1
-    if(mpaa_rating == 'PG'):
-        dummy_pg = 1
-    if(mpaa_rating == 'PG-13'):
-        dummy_pg13 = 1
-    if(mpaa_rating == 'R'):
-        dummy_r = 1
-        
-    release_month = fetchReleaseMonth(movie_soup) # Obtain the string value
-                                                  # of the release month
-                                                  
-    # Set dummy variables for months of the year to 0
-    jan_dummy = 0
-    feb_dummy = 0
-    mar_dummy = 0
-    apr_dummy = 0
-    may_dummy = 0
-    jun_dummy = 0
-    jul_dummy = 0
-    aug_dummy = 0
-    sep_dummy = 0
-    oct_dummy = 0
-    nov_dummy = 0
-    dec_dummy = 0
-
-    # Based on the value of the string release_month, set the corresponding
-    # dummy variable to 1.
-    if(release_month == 'January'):
-        jan_dummy = 1
-    if(release_month == 'February'):
-        feb_dummy = 1
-    if(release_month == 'March'):
-        mar_dummy = 1
-    if(release_month == 'April'):
-        apr_dummy = 1
-    if(release_month == 'May'):
-        may_dummy = 1
-    if(release_month == 'June'):
-        jun_dummy = 1
-    if(release_month == 'July'):
-        jul_dummy = 1
-    if(release_month == 'August'):
-        aug_dummy = 1
-    if(release_month == 'September'):
-        sep_dummy = 1
-    if(release_month == 'October'):
-        oct_dummy = 1
-    if(release_month == 'November'):
-        nov_dummy = 1
-    if(release_month == 'December'):
-        dec_dummy = 1
-
-    # The movie title being scraped from the page
-    title = movie_soup.find('div', class_='subtext')\
-                      .find_previous_sibling().text.strip()
-
-    
-    # The runtime of the movie.  This is found by taking the
-    # second element on the page tagged on the page as 'time'
-    # and then using regex to strip all non-numeric values from
-    # the string.  The regex function is itself passed into the
-    # int() function, leaving 'runtime' as an integer value of
-    # the runtime of the movie in minutes.
-    tech_spec_soup = movie_soup.find_all('time')[1]
-    runtime = int(re.sub('[^0-9]','',tech_spec_soup.text))
-
-    # Obtain the budget of the movie.
-    budget = getMovieBudget(movie_soup)
-
-    # opening_weekend_gross is opening weekend gross
-    opening_weekend_gross = fetchOpeningWeekendGross(movie_soup)
-
-    # Fetch total domestic gross revenue for movie.
-    box_office_soup = movie_soup.find('h3', class_='subheading')\
-                                .find_next_sibling()\
-                                .find_next_sibling()\
-                                .find_next_sibling()
-
-    # Strip non-numeric characters from string and convert what remains
-    # to integer.
-    total_domestic_gross = int(re.sub('[^0-9]','',box_office_soup.text))
-
-    # Obtain the worldwide gross
-    box_office_soup = movie_soup.find('h3', class_='subheading')\
-                                .find_next_sibling()\
-                                .find_next_sibling()\
-                                .find_next_sibling()\
-                                .find_next_sibling()
-
-    # Strip non-numeric characters from worldwide gross string and then
-    # convert to integer value.
-    worldwide_gross = int(re.sub('[^0-9]','',box_office_soup.text))
-
-    # Obtain the user ratings of the movie
-    rating_soup = movie_soup.find('div', class_='ratingValue')
-    user_rating = re.sub('\n','',rating_soup.text)
-    user_rating = float(re.sub('/.*','',user_rating))
-
-    # The features to be analyzed are stored in a tuple, which
-    # will be returned by the function and then appended to a
-    # list which will be converted to a dataframe.
-    feature_tuple = (title, release_month, mpaa_rating, dummy_g,
-                     dummy_pg, dummy_pg13, dummy_r, jan_dummy,
-                     feb_dummy, mar_dummy, apr_dummy, may_dummy,
-                     jun_dummy, jul_dummy, aug_dummy, sep_dummy,
-                     oct_dummy, nov_dummy, dec_dummy, runtime,
-                     budget, opening_weekend_gross,
-                     total_domestic_gross, worldwide_gross,
-                     user_rating)
-
-    return feature_tuple
-
-i = 0
-scraped_movie_count = 0
-failed_scrapes = 0
-
-total_movie_count = len(movie_link_list)
-
-# Verbose output
-print('Initiating scraping process...')
-
-# Now for the fun part: scraping the actual movie
-# data from the individual movie webpages.
-while(i < len(movie_link_list)):
-
-    # Error handling.  If anything goes wrong in the getMovieData()
-    # function, the exception is handled so that it doesn't derail the
-    # whole algorithm and force the scraping process to be restarted.
-    try:
-        movie_tuple = getMovieData(movie_link_list[i])
-
-        movie_features.append(movie_tuple)
+    title_index = records.TitleIndex(args.output)
+    title_ids = refresh.staleTitles(title_index, args.max_age,
+                                    args.settled_after, args.refresh_limit)
 
-        # Verbose output
-        scraped_movie_count += 1
-        print('Scraped movie {} of {}.'.format(i+1, total_movie_count))
-    
-    except:
-        failed_scrapes += 1
+    # Verbose output
+    print('Refreshing {} of the {} stored movies.'.format(len(title_ids),
+                                                          len(title_index)))
 
+    site_url = args.base_url.rstrip('/')
+    return [refresh.titleUrl(title_id, site_url) for title_id in title_ids]
+
+def run(args):
+    '''
+    Run a whole scrape with the options parsed
+    from the command line: collect the movie
+    pages, scrape them and save the dataset.
+    With --refresh, the stored movies that are
+    out of date are scraped again instead.
+    With --queue, this process instead takes
+    its part in a distributed scrape (see
+    distributed.py).
+    '''
+
+    if(args.queue is not None):
+        import distributed
+        distributed.run(args)
+        return
+
+    # Timings and counters for every stage of the run, and the optional
+    # profiler wrapped around all of it.
+    timings = metrics.Metrics()
+    profiler = metrics.Profiler(args.profile, args.profile_output).start()
+
+    response_cache = openCache(args)
+
+    # Every finished page is written to the journal, so an interrupted run
+    # can pick up where it left off.
+    scrape_journal = journal.ScrapeJournal(args.journal)
+    if(args.restart):
+        scrape_journal.reset()
+
+    # How the movies are saved depends on the kind of run, so a resumed
+    # run has to be the same kind as the one that began the journal.
+    if(scrape_journal.mode is None):
+        scrape_journal.recordStarted(scrapeMode(args))
+    else:
+        checkMode(scrape_journal.mode, scrapeMode(args), args.journal)
+
+    # The list pages and the movie pages share one rate limit, and one pool
+    # of kept-alive connections.
+    rate_limiter = fetcher.HostRateLimiter(args.rate_limit)
+    transport = fetcher.Transport(http2=args.http2)
+
+    # The movie pages are found by the paginator while the first ones are
+    # already being scraped.  A resumed run whose list was collected in
+    # full takes the remaining pages from the journal instead.
+    if(scrape_journal.collected):
+        movie_links = scrape_journal.pending()
+        start_message = 'Initiating scraping process...'
+    elif(args.refresh):
+        movie_links = refreshLinks(args)
+        scrape_journal.recordQueued(movie_links)
+        scrape_journal.recordCollected()
+        start_message = 'Initiating scraping process...'
+    else:
+        years, known_title_ids = scrapeScope(args)
+        movie_links = queueMovieLinks(years, args.top_n, rate_limiter,
+                                      response_cache, scrape_journal,
+                                      known_title_ids, timings,
+                                      args.timeout, args.retries,
+                                      args.base_url.rstrip('/'), transport)
+        start_message = ('Initiating movie URL collection, scraping each '
+                         'movie page as soon as it is found...')
+
+    # Verbose output
+    print(start_message)
+    if(scrape_journal.completed):
+        print('Resuming: {} movies were already scraped.'\
+              .format(len(scrape_journal.completed)))
+
+    # Now for the fun part: scraping the actual movie
+    # data from the individual movie webpages.
+    failed_pages = asyncio.run(
+        scrapeMovies(movie_links, args.concurrency, rate_limiter,
+                     args.workers, timings, response_cache, scrape_journal,
+                     args.parser, args.timeout, args.retries, transport,
+                     args.stop_early))
+
+    # Every request has already been retried by the fetch engine, but
+    # pages that failed on the network are attempted one more time now
+    # that the other pages have been scraped and the server may have
+    # recovered.  Pages that failed to parse would only fail again.
+    if(failed_pages['network']):
         # Verbose output
-        print('Failed to scrape movie {} of {}.'.format(i+1, total_movie_count))
-    
-    i += 1
+        print('Retrying {} pages that failed to download...'\
+              .format(len(failed_pages['network'])))
+
+        retried_pages = asyncio.run(
+            scrapeMovies(failed_pages['network'], args.concurrency,
+                         rate_limiter, args.workers, timings, response_cache,
+                         scrape_journal, args.parser, args.timeout,
+                         args.retries, transport, args.stop_early))
+
+        failed_pages['network'] = retried_pages['network']
+        failed_pages['parse'] += retried_pages['parse']
+
+    # The MovieRecords scraped by this run (and any it resumed), which
+    # will then be saved to the dataset for analasys.  They are read back
+    # from the journal one at a time as they are saved, rather than all
+    # being held in memory.
+    movie_features = scrape_journal.iterRecords()
+
+    total_movie_count = len(scrape_journal.queued)
+    scraped_movie_count = len(scrape_journal.completed)
+    failed_scrapes = len(failed_pages['network']) + len(failed_pages['parse'])
+
+    # Verbose output showing how many pages were able to be scraped and also
+    # how many failed, and why.
+    print('Successfully scraped {} out of {} movies.  {} pages failed to scrape '
+          '({} network errors, {} parse errors).'\
+          .format(scraped_movie_count, total_movie_count, failed_scrapes,
+                  len(failed_pages['network']), len(failed_pages['parse'])))
+
+    # Save the records to columnar files so that they can simply be read
+    # into another file without having to re-scrape IMDb each time I want
+    # to tweak something!  An incremental or refresh run only adds its
+    # movies to the years they belong to.
+    if(args.incremental or args.refresh):
+        records.mergeMovies(movie_features, args.output, timings,
+                            args.batch_size)
+    else:
+        records.saveMovies(movie_features, args.output, timings,
+                           args.batch_size)
+
+    # Verbose output
+    print('Saved {} movies to \'{}\'.'.format(scraped_movie_count, args.output))
+
+    # Everything scraped is in the dataset now, so the job is finished and
+    # the next run starts a new one.
+    scrape_journal.reset()
+    scrape_journal.close()
+
+    profiler.stop()
+
+    if(args.timings):
+        print(timings.report())
+        print('Scraped {} pages in {:.2f} seconds ({:.1f} pages/sec).'\
+              .format(timings.counters.get('pages', 0), timings.elapsed(),
+                      timings.summary()['pages_per_second']))
+
+    if(args.metrics):
+        timings.writeJson(args.metrics)
 
-# Verbose output showing how many pages were able to be scraped and also
-# how many failed.
-print('Successfully scraped {} out of {} movies.  {} pages failed to scrape.'\
-      .format(scraped_movie_count, total_movie_count, failed_scrapes))
+        # Verbose output
+        print('Saved run metrics to \'{}\'.'.format(args.metrics))
 
-# Take the list movie_features and convert to a pandas dataframe.
-df = pd.DataFrame(movie_features)
+def main(argv=None, prog=None):
+    arg_parser = argparse.ArgumentParser(prog=prog,
+                                         description='Scrape movie data from '
+                                                     'IMDb.')
+    addArguments(arg_parser)
+    run(arg_parser.parse_args(argv))
 
-# Pickle the dataframe so that it can simply be read into another file
-# without having to re-scrape IMDb each time I want to tweak something!
-df.to_pickle('movie_dataframe.pkl')
+if __name__ == '__main__':
+    main()
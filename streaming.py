@@ -0,0 +1,369 @@
+# Out-of-core analysis of the movie dataset.
+#
+# analysis.py normally loads the whole dataset into one dataframe, which
+# stops working once the dataset no longer fits in memory.  This module
+# fits the same regression and summarizes the movies of each MPAA rating in
+# a single pass over the dataset, reading it a chunk of rows at a time
+# (records.iterDatasetChunks), so the data itself never has to fit in
+# memory; all that grows with the number of movies is the split below.
+#
+# The regression only needs the sufficient statistics X^T X and X^T y of
+# its rows, which can be added up chunk by chunk.  They are kept as the
+# triangular factor R of a QR decomposition (R^T R = X^T X) rather than as
+# X^T X itself: squaring budgets in the hundreds of millions would leave
+# too few digits for the 0/1 rating and month columns.  Solving with the
+# factor gives the same coefficients as LinearRegression fitted on all of
+# the rows at once.  Each movie is put in the holdout set or one of the
+# cross validation folds exactly as analysis.fitRegression() would split
+# the whole dataframe, and each set gets a factor of its own, so the fit
+# and both scores match the in-memory analysis and need no second pass.
+# The split is worked out from the row counts in the Parquet metadata
+# before the pass.  Shuffling the rows takes a permutation of 8 bytes per
+# movie, which is dropped again before the pass starts, leaving a byte per
+# movie for the fold each one is in.
+
+import numpy as np
+
+import features
+import metrics
+from records import MPAA_RATINGS, countMovies, iterDatasetChunks
+
+DEFAULT_CHUNK_SIZE = 100000  # Movies read from the dataset at a time.
+TEST_SIZE = 0.2              # Fraction of the movies held out for testing.
+FOLDS = 5                    # Number of cross validation folds.
+RANDOM_STATE = 10            # Seed for the holdout split.
+HELD_OUT = -1                # Fold of the movies held out for testing.
+
+# Every field but the title is read, which is most of the memory a chunk
+# would otherwise take.
+ANALYSIS_FIELDS = ['year', 'release_month', 'mpaa_rating', 'runtime', 'budget',
+                   'opening_weekend_gross', 'total_domestic_gross',
+                   'worldwide_gross', 'user_rating']
+
+class RegressionStatistics:
+    '''
+    Sufficient statistics of a linear regression
+    with an intercept, added up a chunk of rows
+    at a time.  Holds the upper triangular R of
+    the QR decomposition of [1 X y], which takes
+    the same (n_features + 2)^2 numbers however
+    many rows have been added.
+    '''
+
+    def __init__(self, n_features):
+        self.n_features = n_features
+        self.count = 0
+        self.factor = np.zeros((0, n_features + 2))
+
+    def update(self, X, y):
+        '''
+        Add the rows of feature matrix X and
+        target vector y.
+        '''
+
+        if(len(y) == 0):
+            return
+
+        rows = np.hstack([np.ones((len(y), 1)), X, y[:, np.newaxis]])
+        self.factor = np.linalg.qr(np.vstack([self.factor, rows]), mode='r')
+        self.count += len(y)
+
+    def merge(self, other):
+        '''
+        Return the statistics of the rows of both
+        self and other.
+        '''
+
+        merged = RegressionStatistics(self.n_features)
+        merged.factor = np.linalg.qr(np.vstack([self.factor, other.factor]),
+                                     mode='r')
+        merged.count = self.count + other.count
+        return merged
+
+    def crossProducts(self):
+        '''
+        Return X^T X and X^T y, with the
+        intercept as the first column of X.
+        '''
+
+        products = self.factor.T @ self.factor
+        return products[:-1, :-1], products[:-1, -1]
+
+    def fit(self, tol=None):
+        '''
+        Return the intercept and coefficients of
+        the least squares fit.  As in
+        LinearRegression, directions of the
+        features whose singular value is below tol
+        times the largest are left out, and a
+        feature that is a combination of the
+        others gets the smallest coefficients that
+        fit.
+        '''
+
+        from scipy import linalg
+
+        factor = self.factor
+        if(len(factor) < self.n_features + 2):
+            factor = np.vstack([factor, np.zeros((self.n_features + 2
+                                                  - len(factor),
+                                                  self.n_features + 2))])
+
+        # The first row of R is all that involves the intercept, so the
+        # coefficients are the least squares solution of the rest, which
+        # is the regression on the centered features.  That part of R has
+        # the same singular values as the centered features, so tol cuts
+        # off the same directions LinearRegression does.
+        coefficients = linalg.lstsq(factor[1:-1, 1:-1], factor[1:-1, -1],
+                                    cond=tol)[0]
+        intercept = (factor[0, -1] - factor[0, 1:-1] @ coefficients) \
+                    / factor[0, 0]
+
+        return intercept, coefficients
+
+    def residualSumOfSquares(self, intercept, coefficients):
+        return float(np.sum((self.factor @ np.concatenate(
+            [[-intercept], -coefficients, [1.0]]))**2))
+
+    def totalSumOfSquares(self):
+        # Sum of squares of y about its mean: what is left of y once the
+        # intercept row has been taken out.
+        return float(np.sum(self.factor[1:, -1]**2))
+
+    def score(self, intercept, coefficients):
+        '''
+        Return the r^2 of a fitted model on these
+        rows, as LinearRegression.score() would.
+        '''
+
+        return 1 - (self.residualSumOfSquares(intercept, coefficients)
+                    / self.totalSumOfSquares())
+
+class RatingSummaries:
+    '''
+    Count, means and spread of the budget and
+    worldwide gross of the movies of each MPAA
+    rating, and of budget against gross, added
+    up a chunk at a time.  Movies with any
+    other rating are grouped under 'Other'.
+    '''
+
+    def __init__(self):
+        self.groups = MPAA_RATINGS + ['Other']
+        # Per group: the number of movies, the mean budget and gross, the
+        # sums of their squared deviations from the mean, and the sum of the
+        # products of the budget and gross deviations.
+        self.count = np.zeros(len(self.groups))
+        self.means = np.zeros((len(self.groups), 2))
+        self.squares = np.zeros((len(self.groups), 2))
+        self.products = np.zeros(len(self.groups))
+
+    def update(self, df):
+        codes = features.categoryCodes(df, 'mpaa_rating', MPAA_RATINGS)
+        codes = np.where(codes >= 0, codes, len(MPAA_RATINGS))
+        values = np.hstack([features.numericColumn(df, 'budget'),
+                            features.numericColumn(df, 'worldwide_gross')])
+
+        present = ~np.isnan(values).any(axis=1)
+        codes, values = codes[present], values[present]
+
+        n_groups = len(self.groups)
+        count = np.bincount(codes, minlength=n_groups).astype(float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.stack([np.bincount(codes, values[:, i], n_groups)
+                              for i in range(2)], axis=1) / count[:, np.newaxis]
+        means = np.nan_to_num(means)
+
+        deviations = values - means[codes]
+        squares = np.stack([np.bincount(codes, deviations[:, i]**2, n_groups)
+                            for i in range(2)], axis=1)
+        products = np.bincount(codes, deviations[:, 0] * deviations[:, 1],
+                               n_groups)
+
+        self.combine(count, means, squares, products)
+
+    def combine(self, count, means, squares, products):
+        # Chan et al.'s update for merging the moments of two sets of rows,
+        # which stays accurate however far the means are from zero.
+        total = self.count + count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.nan_to_num(count / total)
+            delta = means - self.means
+
+            self.squares += squares + delta**2 * (self.count * weight)\
+                                                 [:, np.newaxis]
+            self.products += products + delta[:, 0] * delta[:, 1] \
+                                        * self.count * weight
+            self.means += delta * weight[:, np.newaxis]
+            self.count = total
+
+    def summary(self):
+        '''
+        Return a list of dictionaries, one per
+        rating that has movies, with the count, the
+        mean budget and gross, and the slope,
+        intercept and correlation of the regression
+        line of gross on budget.
+        '''
+
+        rows = []
+        for i, group in enumerate(self.groups):
+            if(self.count[i] == 0):
+                continue
+
+            budget_squares, gross_squares = self.squares[i]
+            slope = self.products[i] / budget_squares if budget_squares else 0.0
+            correlation = 0.0
+            if(budget_squares and gross_squares):
+                correlation = self.products[i] / np.sqrt(budget_squares
+                                                         * gross_squares)
+
+            rows.append({
+                'rating': group,
+                'movies': int(self.count[i]),
+                'mean_budget': self.means[i, 0],
+                'mean_gross': self.means[i, 1],
+                'slope': slope,
+                'intercept': self.means[i, 1] - slope * self.means[i, 0],
+                'correlation': correlation,
+            })
+
+        return rows
+
+    def report(self):
+        lines = ['{:<8} {:>9} {:>14} {:>14} {:>8} {:>7}'\
+                 .format('rating', 'movies', 'mean budget', 'mean gross',
+                         'slope', 'r')]
+        for row in self.summary():
+            lines.append('{rating:<8} {movies:>9} {mean_budget:>14,.0f} '
+                         '{mean_gross:>14,.0f} {slope:>8.3f} '
+                         '{correlation:>7.3f}'.format(**row))
+
+        return '\n'.join(lines)
+
+def splitRows(n_rows):
+    '''
+    Return an array with, for each of n_rows
+    movies in the order they are stored, the
+    cross validation fold it is in, or HELD_OUT
+    for the holdout set.  The split is the one
+    analysis.fitRegression() makes with
+    train_test_split() and cross_val_score(),
+    so both fit and score the same movies.
+    '''
+
+    # train_test_split() holds out the first ceil(TEST_SIZE * n_rows) rows
+    # of a permutation drawn with RANDOM_STATE and keeps the rest in the
+    # order of the permutation, and KFold() without shuffling cuts those
+    # into FOLDS consecutive runs, the first ones a row longer when they
+    # don't divide evenly.  Only the permutation is built from that, not
+    # the index arrays of every set.
+    permutation = np.random.RandomState(RANDOM_STATE).permutation(n_rows)
+    n_test = int(np.ceil(TEST_SIZE * n_rows))
+
+    n_train = n_rows - n_test
+    fold_sizes = np.full(FOLDS, n_train // FOLDS)
+    fold_sizes[:n_train % FOLDS] += 1
+
+    split = np.full(n_rows, HELD_OUT, dtype=np.int8)
+    split[permutation[n_test:]] = np.repeat(np.arange(FOLDS, dtype=np.int8),
+                                            fold_sizes)
+
+    return split
+
+def analyzeDataset(path, feature_list, chunk_size=DEFAULT_CHUNK_SIZE,
+                   timings=None):
+    '''
+    Read the dataset at path chunk_size movies at
+    a time and add each chunk to the regression
+    statistics of its holdout set or training
+    fold and to the per-rating summaries.
+    Returns a tuple of the test statistics, the
+    list of fold statistics and the
+    RatingSummaries.
+    '''
+
+    timings = timings or metrics.Metrics()
+
+    n_features = len(features.featureNames(feature_list))
+    test = RegressionStatistics(n_features)
+    folds = [RegressionStatistics(n_features) for fold in range(FOLDS)]
+    ratings = RatingSummaries()
+
+    split = splitRows(countMovies(path))
+
+    offset = 0
+    chunks = iterDatasetChunks(path, chunk_size, ANALYSIS_FIELDS)
+    while(True):
+        with timings.timed('load'):
+            df = next(chunks, None)
+        if(df is None):
+            break
+
+        with timings.timed('accumulate'):
+            X = features.featureMatrix(df, feature_list)
+            y = features.targetVector(df)
+
+            chunk_split = split[offset:offset + len(df)]
+            offset += len(df)
+
+            held_out = chunk_split == HELD_OUT
+            test.update(X[held_out], y[held_out])
+            for i, fold_statistics in enumerate(folds):
+                rows = chunk_split == i
+                fold_statistics.update(X[rows], y[rows])
+
+            ratings.update(df)
+
+    return test, folds, ratings
+
+def fitRegression(path, feature_list, chunk_size=DEFAULT_CHUNK_SIZE,
+                  timings=None):
+    '''
+    Fit a linear regression of worldwide gross
+    earnings on the named features in one pass
+    over the dataset at path.  Returns a tuple
+    of the fitted LinearRegression, its r^2 on
+    the holdout set, its mean cross validation
+    score on the training set, the number of
+    movies and the RatingSummaries.
+    '''
+
+    from sklearn.linear_model import LinearRegression
+
+    timings = timings or metrics.Metrics()
+
+    # The fit is filled into a LinearRegression, so that it can be saved
+    # and used like one fitted in memory.  Newer versions of scikit-learn
+    # ignore directions of the features below its tol, and so does the fit
+    # here.
+    linreg_model = LinearRegression()
+    tol = getattr(linreg_model, 'tol', None)
+
+    test, folds, ratings = analyzeDataset(path, feature_list, chunk_size,
+                                          timings)
+
+    training = folds[0]
+    for fold_statistics in folds[1:]:
+        training = training.merge(fold_statistics)
+
+    with timings.timed('fit'):
+        intercept, coefficients = training.fit(tol)
+        linreg_model.intercept_ = intercept
+        linreg_model.coef_ = coefficients
+        linreg_model.n_features_in_ = len(coefficients)
+
+    # Each fold is scored with the model fitted on the other folds.
+    with timings.timed('cross_validation'):
+        cv_scores = []
+        for i, fold_statistics in enumerate(folds):
+            others = [other for j, other in enumerate(folds) if j != i]
+            rest = others[0]
+            for other in others[1:]:
+                rest = rest.merge(other)
+            cv_scores.append(fold_statistics.score(*rest.fit(tol)))
+
+    r_squared = test.score(intercept, coefficients)
+
+    return (linreg_model, r_squared,
+            float(np.mean(cv_scores)), test.count + training.count, ratings)
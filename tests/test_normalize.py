@@ -0,0 +1,18 @@
+# Tests for the release month parsing in normalize.py.  Run them from the
+# root of the repository with `python -m pytest`.
+
+import normalize
+
+def test_release_month_of_a_date():
+    assert normalize.parseReleaseMonth('4 May 2012 (USA)') == 'May'
+    assert normalize.parseReleaseMonth('March 2019') == 'March'
+
+def test_release_month_needs_a_whole_month_name():
+    # Month names inside other words, or not capitalised the way IMDb
+    # writes dates, are not release months.
+    assert normalize.parseReleaseMonth('Mayday marches on') is None
+    assert normalize.parseReleaseMonth('may 2012') is None
+    assert normalize.parseReleaseMonth('Junebug (2005)') is None
+
+def test_release_month_missing():
+    assert normalize.parseReleaseMonth('2012 (USA)') is None
@@ -0,0 +1,297 @@
+# Shared work queue for distributed scrape runs.
+#
+# In a distributed scrape, a coordinator collects the movie pages from the
+# list pages and puts them on a work queue, and any number of worker
+# processes, on this machine or others, take pages off it to scrape.  A
+# worker doesn't remove a page when it takes it but leases it for a while:
+# once the page is scraped it is marked done, and if the worker crashes or
+# hangs, the lease runs out and the page goes to another worker.  Pages
+# that fail to download are put back on the queue up to MAX_ATTEMPTS
+# times; pages that fail to parse are given up on straight away.
+#
+# The queue is reached through the WorkQueue interface so that other
+# backends can be added to BACKENDS.  The SQLite backend needs nothing but
+# a file every worker can open, e.g. on a shared disk.  Lease expiry times
+# are compared across hosts, so their clocks should roughly agree.
+
+import contextlib
+import sqlite3
+import time
+
+DEFAULT_QUEUE_PATH = 'scrape_queue.sqlite'
+DEFAULT_BACKEND = 'sqlite'
+DEFAULT_LEASE = 120.0  # Seconds a worker has to finish a page it has taken.
+MAX_ATTEMPTS = 3       # Times a page is handed out before it is given up on.
+
+class WorkQueue:
+    '''
+    Interface of a queue of movie pages
+    shared by the coordinator and the workers
+    of a distributed scrape.  Each page is
+    pending, leased to a worker until some
+    time, done or failed.
+    '''
+
+    def push(self, movie_urls):
+        '''
+        Add pages to the end of the queue.  Pages
+        already on it are left as they are.
+        '''
+
+        raise NotImplementedError
+
+    def markCollected(self):
+        '''
+        Record that every page has been pushed, so
+        workers can stop once the queue is empty.
+        '''
+
+        raise NotImplementedError
+
+    def collected(self):
+        raise NotImplementedError
+
+    def setMode(self, mode):
+        '''
+        Record the kind of run the queue was filled
+        for ('full', 'incremental' or 'refresh'),
+        which decides how the results are saved.
+        '''
+
+        raise NotImplementedError
+
+    def mode(self):
+        '''
+        Return the kind of run recorded with
+        setMode(), or None.
+        '''
+
+        raise NotImplementedError
+
+    def lease(self, worker_id, count, seconds=DEFAULT_LEASE):
+        '''
+        Hand worker_id up to count pages for the
+        next seconds seconds, oldest first.  Pages
+        whose lease has run out are handed out
+        again.  Returns a list of URLs.
+        '''
+
+        raise NotImplementedError
+
+    def renew(self, worker_id, movie_urls, seconds=DEFAULT_LEASE):
+        '''
+        Extend worker_id's leases on pages it is
+        still working on.
+        '''
+
+        raise NotImplementedError
+
+    def complete(self, movie_url):
+        raise NotImplementedError
+
+    def fail(self, movie_url, error, retry=True):
+        '''
+        Record that a page failed.  With retry it
+        is put back on the queue, unless it has
+        already been handed out MAX_ATTEMPTS times.
+        '''
+
+        raise NotImplementedError
+
+    def counts(self):
+        '''
+        Return a dictionary of state -> number of
+        pages, counting pages whose lease has run
+        out as pending.
+        '''
+
+        raise NotImplementedError
+
+    def finished(self):
+        '''
+        Whether every page has been collected and
+        is now either done or failed.
+        '''
+
+        counts = self.counts()
+        return (self.collected() and
+                counts.get('pending', 0) + counts.get('leased', 0) == 0)
+
+    def failures(self):
+        '''
+        Return a dictionary of URL -> error for
+        every page that was given up on.
+        '''
+
+        raise NotImplementedError
+
+    def reset(self):
+        '''
+        Empty the queue for the next run.
+        '''
+
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class SQLiteWorkQueue(WorkQueue):
+    '''
+    Work queue kept in a SQLite database at
+    path.  Every worker opens the same file,
+    and leasing is done in a transaction that
+    holds the write lock, so no page is ever
+    leased to two workers at once.
+    '''
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH):
+        self.path = path
+
+        # Wait for other workers' transactions rather than failing.
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+
+        # WAL lets workers read while another one writes, and the queue
+        # can be rebuilt from the list pages, so it isn't worth an fsync
+        # on every commit.
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute('PRAGMA synchronous = NORMAL')
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS pages (
+                position INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT UNIQUE NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS pages_state ON pages (state, position);
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        ''')
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE takes the write lock before anything is read, so
+        # that e.g. two workers can't pick the same pages.
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        self.db.execute('COMMIT')
+
+    def push(self, movie_urls):
+        with self.transaction():
+            self.db.executemany('INSERT OR IGNORE INTO pages (url) VALUES (?)',
+                                ((movie_url,) for movie_url in movie_urls))
+
+    def markCollected(self):
+        with self.transaction():
+            self.db.execute("INSERT OR REPLACE INTO settings "
+                            "VALUES ('collected', '1')")
+
+    def collected(self):
+        row = self.db.execute("SELECT 1 FROM settings "
+                              "WHERE key = 'collected'").fetchone()
+        return row is not None
+
+    def setMode(self, mode):
+        with self.transaction():
+            self.db.execute("INSERT OR REPLACE INTO settings "
+                            "VALUES ('mode', ?)", (mode,))
+
+    def mode(self):
+        row = self.db.execute("SELECT value FROM settings "
+                              "WHERE key = 'mode'").fetchone()
+        return row[0] if row is not None else None
+
+    def lease(self, worker_id, count, seconds=DEFAULT_LEASE):
+        now = time.time()
+
+        with self.transaction():
+            # A page whose lease keeps running out may be what is crashing
+            # the workers, so it is only handed out MAX_ATTEMPTS times.
+            self.db.execute(
+                "UPDATE pages SET state = 'failed', error = 'lease expired' "
+                "WHERE state = 'leased' AND lease_expires < ? "
+                "AND attempts >= ?", (now, MAX_ATTEMPTS))
+
+            rows = self.db.execute(
+                "SELECT position, url FROM pages "
+                "WHERE state = 'pending' "
+                "   OR (state = 'leased' AND lease_expires < ?) "
+                "ORDER BY position LIMIT ?", (now, count)).fetchall()
+
+            self.db.executemany(
+                "UPDATE pages SET state = 'leased', worker = ?, "
+                "lease_expires = ?, attempts = attempts + 1 "
+                "WHERE position = ?",
+                ((worker_id, now + seconds, position)
+                 for position, url in rows))
+
+        return [url for position, url in rows]
+
+    def renew(self, worker_id, movie_urls, seconds=DEFAULT_LEASE):
+        with self.transaction():
+            self.db.executemany(
+                "UPDATE pages SET lease_expires = ? "
+                "WHERE url = ? AND state = 'leased' AND worker = ?",
+                ((time.time() + seconds, movie_url, worker_id)
+                 for movie_url in movie_urls))
+
+    def complete(self, movie_url):
+        with self.transaction():
+            self.db.execute("UPDATE pages SET state = 'done', error = NULL "
+                            "WHERE url = ?", (movie_url,))
+
+    def fail(self, movie_url, error, retry=True):
+        with self.transaction():
+            # A page another worker has finished in the meantime stays done.
+            self.db.execute(
+                "UPDATE pages SET error = ?, state = CASE "
+                "WHEN ? AND attempts < ? THEN 'pending' ELSE 'failed' END "
+                "WHERE url = ? AND state != 'done'",
+                (repr(error), retry, MAX_ATTEMPTS, movie_url))
+
+    def counts(self):
+        return dict(self.db.execute(
+            "SELECT CASE WHEN state = 'leased' AND lease_expires < ? "
+            "THEN 'pending' ELSE state END, COUNT(*) "
+            "FROM pages GROUP BY 1", (time.time(),)).fetchall())
+
+    def failures(self):
+        return dict(self.db.execute("SELECT url, error FROM pages "
+                                    "WHERE state = 'failed' "
+                                    "ORDER BY position").fetchall())
+
+    def reset(self):
+        with self.transaction():
+            self.db.execute('DELETE FROM pages')
+            self.db.execute('DELETE FROM settings')
+
+    def close(self):
+        self.db.close()
+
+# Backend name -> WorkQueue class, opened with the location of the queue.
+BACKENDS = {
+    'sqlite': SQLiteWorkQueue,
+}
+
+def availableBackends():
+    return list(BACKENDS)
+
+def openQueue(location=DEFAULT_QUEUE_PATH, backend=DEFAULT_BACKEND):
+    '''
+    Open the work queue at location with the
+    named backend.
+    '''
+
+    if(backend not in BACKENDS):
+        raise ValueError('Unknown work queue backend {} (available: {}).'\
+                         .format(backend, ', '.join(availableBackends())))
+
+    return BACKENDS[backend](location)